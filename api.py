@@ -1,20 +1,87 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import joblib
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional
+from functools import partial
+import asyncio
 import numpy as np
+import os
 import pandas as pd
+import shutil
+import time
 
-# Charger le modèle sauvegardé
-try:
-    model = joblib.load("modele_selection.joblib")
-    print("Modèle chargé avec succès!")
-except Exception as e:
-    print(f"Erreur lors du chargement du modèle: {e}")
-    model = None
+from batching import MicroBatcher
+from jobs import ExecuteurJobs, FileJobs, FilePleine, TERMINE, decrire, extension_fichier
+from logging_config import ECHANTILLONNE, obtenir_logger
+from metrics import (CHRONOMETRE_INACTIF, Metriques, MiddlewareMetriques, ProfileurEchantillonne,
+                     exporter_profil, formater_profil)
+from model_registry import RegistreModeles
+from prediction_cache import CacheLocal, CachePredictions, CacheRedis
+
+logger = obtenir_logger("api")
+
+CHEMIN_MODELE = os.environ.get("API_CHEMIN_MODELE", "modele_selection.joblib")
+# Moteur exporté par compiled_model.py (moteur "mmap")
+CHEMIN_MOTEUR = os.environ.get("API_CHEMIN_MOTEUR", "modele_selection.moteur.joblib")
+
+# Moteur d'inférence: "sklearn" (pipeline d'origine), "compile" (compiled_model.py)
+# ou "mmap" (moteur exporté, projeté en mémoire et partagé entre les workers)
+MOTEUR = os.environ.get("API_MOTEUR", "sklearn")
+
+# Cache des prédictions (API_CACHE_TAILLE=0 pour le désactiver)
+CACHE_TAILLE = int(os.environ.get("API_CACHE_TAILLE", "10000"))
+CACHE_TTL = float(os.environ.get("API_CACHE_TTL", "3600"))
+CACHE_REDIS_URL = os.environ.get("API_CACHE_REDIS_URL")
+
+# Table des prédictions précalculées (lookup_table.py), utilisée si elle existe à côté du modèle
+TABLE_ACTIVE = os.environ.get("API_TABLE", "0") == "1"
+
+# Explications de /explain (explainer.py), préparées au chargement de chaque
+# version (API_EXPLICATIONS=0 pour les désactiver et économiser leur mémoire)
+EXPLICATIONS_ACTIVES = os.environ.get("API_EXPLICATIONS", "1") == "1"
+
+# Registre des versions: dossier surveillé, rechargement à chaud (model_registry.py)
+DOSSIER_MODELES = os.environ.get("API_DOSSIER_MODELES", "modeles")
+INTERVALLE_SURVEILLANCE = float(os.environ.get("API_INTERVALLE_SURVEILLANCE", "2"))
+VERSIONS_CONSERVEES = int(os.environ.get("API_VERSIONS_CONSERVEES", "3"))
+# En-tête permettant à une requête de choisir sa version du modèle
+ENTETE_VERSION = "X-Model-Version"
+
+# Micro-batching optionnel des appels concurrents à /predict
+MICRO_BATCH_ACTIF = os.environ.get("API_MICRO_BATCH", "0") == "1"
+MICRO_BATCH_TAILLE_MAX = int(os.environ.get("API_MICRO_BATCH_TAILLE_MAX", "64"))
+MICRO_BATCH_ATTENTE_MS = float(os.environ.get("API_MICRO_BATCH_ATTENTE_MS", "2"))
+micro_batcher = None
+
+# Durées par étape et par requête, exposées sur /metrics (API_METRIQUES=0 pour les désactiver)
+metriques = Metriques(actif=os.environ.get("API_METRIQUES", "1") == "1")
+metriques.decrire("api_lignes_predites_total", "Lignes prédites par version du modèle")
+metriques.decrire("api_lignes_expliquees_total", "Lignes expliquées par version du modèle")
+# Profilage échantillonné à la demande sur /debug/profile (désactivé par défaut)
+PROFILAGE_ACTIF = os.environ.get("API_PROFILAGE", "0") == "1"
+PROFILAGE_DUREE_MAX = 60.0
+profileur = ProfileurEchantillonne()
+
+# Jobs asynchrones pour les fichiers trop gros pour /predict/batch (jobs.py).
+# La file SQLite est partagée par tous les processus qui utilisent le même dossier;
+# API_JOBS_WORKERS jobs au plus s'exécutent en même temps dans chaque processus
+# (0: jobs exécutés seulement par un `python jobs.py` dédié)
+JOBS_DOSSIER = os.environ.get("API_JOBS_DOSSIER", "jobs")
+JOBS_WORKERS = int(os.environ.get("API_JOBS_WORKERS", "1"))
+JOBS_CAPACITE = int(os.environ.get("API_JOBS_CAPACITE", "20"))
+JOBS_TAILLE_CHUNK = int(os.environ.get("API_JOBS_TAILLE_CHUNK", "100000"))
+JOBS_TAILLE_MAX_MO = float(os.environ.get("API_JOBS_TAILLE_MAX_MO", "2048"))
+# Dossier des fichiers déjà présents sur le serveur que POST /jobs peut désigner par leur chemin
+JOBS_DOSSIER_ENTREES = os.environ.get("API_JOBS_DOSSIER_ENTREES")
+JOBS_RETRY_AFTER = "30"
+file_jobs = FileJobs(JOBS_DOSSIER, JOBS_CAPACITE)
+executeur_jobs = None
 
 # Créer l'application FastAPI
 app = FastAPI(title="API de Prédiction du Revenu Annuel",
               description="API pour prédire le revenu annuel d'un marocain")
+app.add_middleware(MiddlewareMetriques, metriques=metriques)
 
 # Définir le modèle de données d'entrée
 class PredictionInput(BaseModel):
@@ -48,56 +115,712 @@ class PredictionInput(BaseModel):
 class PredictionOutput(BaseModel):
     revenu_predit: float
     message: str
+    # Mode intervalles: dispersion des prédictions des arbres de la forêt
+    ecart_type: Optional[float] = None
+    intervalle_bas: Optional[float] = None
+    intervalle_haut: Optional[float] = None
 
-# Endpoint pour la prédiction
-@app.post("/predict", response_model=PredictionOutput)
-def predict(input_data: PredictionInput):
-    if model is None:
-        raise HTTPException(status_code=500, detail="Le modèle n'a pas pu être chargé")
-    
+# Ordre des colonnes attendu par le pipeline
+COLONNES_ENTREE = [
+    'age', 'sexe', 'milieu', 'etat_matrimonial', 'region', 'niveau_education',
+    'categorie_socioprofessionnelle', 'taille_foyer', 'aide_sociale', 'a_acces_credit',
+    'a_retraite', 'possede_voiture', 'possede_logement', 'possede_terrain',
+    'annees_experience', 'revenu_par_experience', 'niveau_socioeco', 'est_urbain',
+    'est_marie', 'weight'
+]
+
+# Nombre maximal de lignes acceptées par un appel à /predict/batch
+TAILLE_MAX_BATCH = 100000
+
+# Modèles de données pour la prédiction par lot
+class PredictionBatchInput(BaseModel):
+    # Format ligne par ligne: [{"age": 35, ...}, ...]
+    lignes: Optional[List[Dict[str, Any]]] = None
+    # Format colonnaire: {"age": [35, 42, ...], ...}
+    colonnes: Optional[Dict[str, List[Any]]] = None
+
+class ResultatLigne(BaseModel):
+    index: int
+    revenu_predit: Optional[float] = None
+    ecart_type: Optional[float] = None
+    intervalle_bas: Optional[float] = None
+    intervalle_haut: Optional[float] = None
+    erreur: Optional[str] = None
+
+class PredictionBatchOutput(BaseModel):
+    resultats: List[ResultatLigne]
+    n_succes: int
+    n_erreurs: int
+
+# Modèles de données des explications: revenu_predit = valeur_reference + somme des contributions
+class ExplicationOutput(BaseModel):
+    revenu_predit: float
+    # Prédiction moyenne du modèle, d'où partent les contributions
+    valeur_reference: float
+    # Champ d'entrée -> contribution (DH), par valeur absolue décroissante
+    contributions: Dict[str, float]
+
+class ExplicationLigne(BaseModel):
+    index: int
+    revenu_predit: Optional[float] = None
+    contributions: Optional[Dict[str, float]] = None
+    erreur: Optional[str] = None
+
+class ExplicationBatchOutput(BaseModel):
+    valeur_reference: float
+    resultats: List[ExplicationLigne]
+    n_succes: int
+    n_erreurs: int
+
+def construire_dataframe(entrees):
+    """Construit un DataFrame unique à partir d'une liste de PredictionInput."""
+    return pd.DataFrame([entree.model_dump() for entree in entrees], columns=COLONNES_ENTREE)
+
+def extraire_lignes(batch):
+    """Retourne la liste des lignes brutes d'un lot, quel que soit son format (413 s'il est trop volumineux)."""
+    if (batch.lignes is None) == (batch.colonnes is None):
+        raise HTTPException(status_code=422, detail="Fournir exactement un des champs 'lignes' ou 'colonnes'")
+
+    if batch.lignes is not None:
+        n_lignes = len(batch.lignes)
+    else:
+        longueurs = {len(valeurs) for valeurs in batch.colonnes.values()}
+        if len(longueurs) > 1:
+            raise HTTPException(status_code=422, detail="Toutes les colonnes doivent avoir la même longueur")
+        n_lignes = longueurs.pop() if longueurs else 0
+    if n_lignes > TAILLE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"Lot trop volumineux (maximum {TAILLE_MAX_BATCH} lignes)")
+
+    if batch.lignes is not None:
+        return batch.lignes
+    noms = list(batch.colonnes.keys())
+    return [
+        {nom: batch.colonnes[nom][i] for nom in noms}
+        for i in range(n_lignes)
+    ]
+
+def predire_pipeline(predicteur, X, chrono):
+    """Applique le pipeline étape par étape pour en chronométrer chaque transformation."""
+    etapes = getattr(predicteur, "steps", None)
+    if etapes is None:
+        predictions = predicteur.predict(X)
+        chrono.etape("modele")
+        return predictions
+    for nom, transformation in etapes[:-1]:
+        X = transformation.transform(X)
+        chrono.etape(nom)
+    nom, regresseur = etapes[-1]
+    predictions = regresseur.predict(X)
+    chrono.etape(nom)
+    return predictions
+
+def predire_entrees(entrees, version):
+    """
+    Prédit une liste de PredictionInput: lecture dans la table précalculée si
+    elle existe, puis modèle pour les entrées hors de la grille.
+    """
+    chrono = metriques.chronometre()
+    if version.table is None:
+        predictions = predire_modele(entrees, version, chrono)
+    else:
+        predictions = version.table.predire_lot(entrees)
+        chrono.etape("table")
+        hors_grille = [i for i, prediction in enumerate(predictions) if prediction is None]
+        if hors_grille:
+            calculees = predire_modele([entrees[i] for i in hors_grille], version, chrono)
+            for i, prediction in zip(hors_grille, calculees):
+                predictions[i] = prediction
+    chrono.terminer()
+    return predictions
+
+def encoder_entrees(entrees, version):
+    """Caractéristiques sélectionnées des entrées (ligne réutilisée pour une entrée seule)."""
+    if len(entrees) == 1:
+        return version.encodeur.encoder(entrees[0])
+    return version.encodeur.encoder_lot(entrees)
+
+def predire_modele(entrees, version, chrono):
+    """Prédit avec le modèle, sans DataFrame lorsque l'encodeur est disponible."""
+    if version.encodeur is None:
+        X = construire_dataframe(entrees)
+        chrono.etape("dataframe")
+        predictions = predire_pipeline(version.predicteur, X, chrono)
+    else:
+        X = encoder_entrees(entrees, version)
+        chrono.etape("encodage")
+        if version.cache is None:
+            predictions = version.regresseur.predict(X)
+            chrono.etape("regressor")
+        else:
+            def predire_manquants(X_manquants):
+                chrono.etape("cache")
+                resultat = version.regresseur.predict(X_manquants)
+                chrono.etape("regressor")
+                return resultat
+            predictions = version.cache.predire(X, predire_manquants)
+            chrono.etape("cache")
+    return predictions
+
+def predire_intervalles(entrees, version, niveau):
+    """
+    Prédiction, écart-type et intervalle central de niveau `niveau` des
+    prédictions des arbres, pour chaque entrée: un seul parcours de la forêt
+    compilée, dont la matrice des prédictions par arbre sert aux trois.
+    Ni la table précalculée ni le cache, qui ne gardent que les prédictions.
+    """
+    foret = version.foret_dispersion()
+    if foret is None:
+        raise ValueError("Intervalles disponibles uniquement pour une forêt aléatoire")
+    chrono = metriques.chronometre()
+    X = encoder_entrees(entrees, version)
+    chrono.etape("encodage")
+    predictions, ecarts_types, (bas, haut) = foret.dispersion(X, ((1 - niveau) / 2, (1 + niveau) / 2))
+    chrono.etape("arbres")
+    chrono.terminer()
+    return [
+        {"revenu_predit": float(p), "ecart_type": float(e), "intervalle_bas": float(b), "intervalle_haut": float(h)}
+        for p, e, b, h in zip(predictions, ecarts_types, bas, haut)
+    ]
+
+def expliquer_entrees(entrees, version):
+    """
+    Prédiction et contributions de chaque champ d'entrée (explainer.py), triées
+    par valeur absolue décroissante, pour chaque entrée. Comme les intervalles,
+    ni la table précalculée ni le cache.
+    """
+    explicateur = version.explicateur()
+    if explicateur is None:
+        raise ValueError("Explications indisponibles pour ce modèle")
+    chrono = metriques.chronometre()
+    X = encoder_entrees(entrees, version)
+    chrono.etape("encodage")
+    predictions, contributions = explicateur.expliquer(X)
+    chrono.etape("explication")
+    ordres = np.argsort(-np.abs(contributions), axis=1, kind="stable")
+    champs = explicateur.champs
+    resultats = [
+        {"revenu_predit": prediction, "contributions": {champs[j]: valeurs[j] for j in ordre}}
+        for prediction, valeurs, ordre in zip(predictions.tolist(), contributions.tolist(), ordres.tolist())
+    ]
+    chrono.terminer()
+    return resultats
+
+def predire_revenus(entrees, version):
+    return [float(p) for p in predire_entrees(entrees, version)]
+
+def predire_lot(entrees, version, predire=predire_revenus):
+    """
+    Prédit le revenu pour une liste de PredictionInput en un seul appel au modèle.
+    Si l'appel groupé échoue, le lot est coupé en deux et chaque moitié reprise,
+    jusqu'à isoler les lignes fautives: k lignes fautives parmi n coûtent de
+    l'ordre de k·log2(n) appels, au lieu d'un appel par ligne. Retourne une
+    liste de (résultat, erreur), le résultat étant celui de `predire` (par
+    défaut la prédiction).
+    """
+    if not entrees:
+        return []
+    try:
+        return [(resultat, None) for resultat in predire(entrees, version)]
+    except Exception as e:
+        if len(entrees) == 1:
+            return [(None, str(e))]
+    milieu = len(entrees) // 2
+    return predire_lot(entrees[:milieu], version, predire) + predire_lot(entrees[milieu:], version, predire)
+
+def predire_lot_versions(requetes):
+    """Prédit des couples (PredictionInput, version) du micro-batching, regroupés par version."""
+    resultats = [None] * len(requetes)
+    groupes = {}
+    for i, (_, version) in enumerate(requetes):
+        groupes.setdefault(id(version), (version, []))[1].append(i)
+    for version, indices in groupes.values():
+        metriques.incrementer("api_lignes_predites_total", (("version", version.nom),), len(indices))
+        for i, resultat in zip(indices, predire_lot([requetes[i][0] for i in indices], version)):
+            resultats[i] = resultat
+    return resultats
+
+def message_prediction(prediction):
+    return f"Le revenu annuel prédit est de {prediction:.2f} DH."
+
+def predire_unitaire(input_data, version, niveau=None):
     try:
-        # Créer un DataFrame avec une ligne pour la prédiction
-        data = {
-            'age': input_data.age,
-            'sexe': input_data.sexe,
-            'milieu': input_data.milieu,
-            'etat_matrimonial': input_data.etat_matrimonial,
-            'region': input_data.region,
-            'niveau_education': input_data.niveau_education,
-            'categorie_socioprofessionnelle': input_data.categorie_socioprofessionnelle,
-            'taille_foyer': input_data.taille_foyer,
-            'aide_sociale': input_data.aide_sociale,
-            'a_acces_credit': input_data.a_acces_credit,
-            'a_retraite': input_data.a_retraite,
-            'possede_voiture': input_data.possede_voiture,
-            'possede_logement': input_data.possede_logement,
-            'possede_terrain': input_data.possede_terrain,
-            'annees_experience': input_data.annees_experience,
-            'revenu_par_experience': input_data.revenu_par_experience,
-            'niveau_socioeco': input_data.niveau_socioeco,
-            'est_urbain': input_data.est_urbain,
-            'est_marie': input_data.est_marie,
-            'weight': input_data.weight
-        }
-        
-        # Créer le DataFrame
-        df = pd.DataFrame([data])
-        
-        # Afficher les colonnes pour le débogage
-        print(f"Colonnes du DataFrame: {df.columns.tolist()}")
-        
         # Faire la prédiction
-        prediction = model.predict(df)[0]
+        metriques.incrementer("api_lignes_predites_total", (("version", version.nom),))
+        if niveau is not None:
+            resultat = predire_intervalles([input_data], version, niveau)[0]
+            return PredictionOutput(message=message_prediction(resultat["revenu_predit"]), **resultat)
+        prediction = predire_entrees([input_data], version)[0]
+        logger.debug("Prédiction: %.2f", prediction, extra=ECHANTILLONNE)
         
-        # Préparer le message de retour
-        message = f"Le revenu annuel prédit est de {prediction:.2f} DH."
-        
-        return PredictionOutput(revenu_predit=float(prediction), message=message)
+        return PredictionOutput(revenu_predit=float(prediction), message=message_prediction(prediction))
     
     except Exception as e:
-        print(f"Erreur détaillée: {str(e)}")
+        logger.error(f"Erreur détaillée: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la prédiction: {str(e)}")
 
+# Requêtes de préchauffage d'une nouvelle version (encodeur, cache, parcours des arbres)
+EXEMPLE_PRECHAUFFAGE = {
+    "age": 35, "taille_foyer": 4, "aide_sociale": 0, "a_acces_credit": 1, "a_retraite": 0,
+    "possede_voiture": 1, "possede_logement": 1, "possede_terrain": 0, "annees_experience": 10,
+    "est_urbain": 1, "est_marie": 1, "sexe": "Homme", "milieu": "Urbain", "etat_matrimonial": "Marié",
+    "region": "Casablanca-Settat", "niveau_education": "Supérieur", "categorie_socioprofessionnelle": "Groupe 2",
+}
+ENTREES_PRECHAUFFAGE = [
+    PredictionInput(**dict(EXEMPLE_PRECHAUFFAGE, age=18 + i % 60, annees_experience=float(i % 40)))
+    for i in range(64)
+]
+
+def prechauffer(version):
+    """
+    Un lot puis une prédiction unitaire, pour initialiser les deux chemins avant
+    activation; de même pour les explications, dont les écarts des noeuds et la
+    valeur de référence sont calculés ici, une fois par version.
+    """
+    predire_lot(ENTREES_PRECHAUFFAGE, version)
+    predire_entrees(ENTREES_PRECHAUFFAGE[:1], version)
+    if EXPLICATIONS_ACTIVES and version.explicateur() is not None:
+        expliquer_entrees(ENTREES_PRECHAUFFAGE, version)
+        expliquer_entrees(ENTREES_PRECHAUFFAGE[:1], version)
+    if version.table is not None:
+        # Les entrées de préchauffage sont dans la grille: préchauffer aussi le modèle
+        predire_modele(ENTREES_PRECHAUFFAGE, version, CHRONOMETRE_INACTIF)
+        predire_modele(ENTREES_PRECHAUFFAGE[:1], version, CHRONOMETRE_INACTIF)
+
+def creer_cache(empreinte):
+    """Cache d'une version du modèle, dont les clés sont préfixées par `empreinte` (voir model_registry.py)."""
+    if CACHE_TAILLE <= 0:
+        return None
+    if CACHE_REDIS_URL:
+        stockage = CacheRedis(CACHE_REDIS_URL, CACHE_TTL)
+    else:
+        stockage = CacheLocal(CACHE_TAILLE, CACHE_TTL)
+    return CachePredictions(stockage, empreinte)
+
+registre = RegistreModeles(
+    DOSSIER_MODELES, CHEMIN_MOTEUR if MOTEUR == "mmap" else CHEMIN_MODELE, MOTEUR,
+    creer_cache=creer_cache, prechauffer=prechauffer,
+    intervalle=INTERVALLE_SURVEILLANCE, conserver=VERSIONS_CONSERVEES, table=TABLE_ACTIVE,
+)
+
+def charger_modele():
+    """Chargement synchrone de la version active (scripts et benchmarks). Retourne True si elle est prête."""
+    return registre.scanner(initial=True)
+
+def etat_chargement():
+    if registre.active is not None:
+        return "pret"
+    return "erreur" if registre.echecs else "chargement"
+
+def obtenir_version(nom=None):
+    """Version active, ou version demandée par l'en-tête X-Model-Version."""
+    etat = etat_chargement()
+    if etat == "erreur":
+        raise HTTPException(status_code=500, detail="Le modèle n'a pas pu être chargé")
+    if etat != "pret":
+        raise HTTPException(status_code=503, detail="Modèle en cours de chargement",
+                            headers={"Retry-After": "1"})
+    try:
+        return registre.obtenir(nom)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Version du modèle inconnue: {nom}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors du chargement de la version {nom}: {e}")
+
+@app.on_event("startup")
+async def demarrer_registre():
+    # Le modèle est chargé en arrière-plan: l'import du module et le démarrage
+    # du serveur ne l'attendent pas, /ready indique quand il est prêt
+    registre.demarrer()
+
+@app.on_event("startup")
+async def demarrer_micro_batching():
+    global micro_batcher
+    if MICRO_BATCH_ACTIF and micro_batcher is None:
+        micro_batcher = MicroBatcher(partial(profileur.executer, predire_lot_versions),
+                                     MICRO_BATCH_TAILLE_MAX, MICRO_BATCH_ATTENTE_MS)
+        await micro_batcher.demarrer()
+
+@app.on_event("startup")
+async def demarrer_jobs():
+    global executeur_jobs
+    if JOBS_WORKERS > 0 and executeur_jobs is None:
+        executeur_jobs = ExecuteurJobs(file_jobs, registre.obtenir, JOBS_WORKERS,
+                                       pret=lambda: registre.active is not None)
+        await run_in_threadpool(executeur_jobs.demarrer)
+
+@app.on_event("shutdown")
+async def arreter_micro_batching():
+    registre.arreter()
+    if micro_batcher is not None:
+        await micro_batcher.arreter()
+    if executeur_jobs is not None:
+        # Les jobs en cours s'arrêtent après leur chunk et reprendront au prochain démarrage
+        await run_in_threadpool(executeur_jobs.arreter)
+
+# Mode intervalles (?intervalles=true): écart-type et intervalle central de niveau
+# `niveau` des prédictions des arbres de la forêt. C'est la dispersion du modèle,
+# pas un intervalle de confiance calibré sur le revenu réel.
+NIVEAU_INTERVALLE = Query(0.9, gt=0, lt=1, description="Part centrale des arbres couverte par l'intervalle")
+
+def verifier_intervalles(version):
+    """La forêt compilée pour les intervalles (au premier appel), ou 400 si le modèle n'est pas une forêt."""
+    if version.foret_dispersion() is None:
+        raise HTTPException(status_code=400, detail=f"Intervalles indisponibles pour la version '{version.nom}': "
+                                                    "réservés aux forêts aléatoires")
+
+# Endpoint pour la prédiction
+@app.post("/predict", response_model=PredictionOutput, response_model_exclude_unset=True)
+async def predict(input_data: PredictionInput, response: Response,
+                  intervalles: bool = Query(False), niveau: float = NIVEAU_INTERVALLE,
+                  version_demandee: Optional[str] = Header(None, alias=ENTETE_VERSION)):
+    # Une version épinglée absente de la mémoire est chargée à la demande, hors de la boucle
+    if version_demandee is None:
+        version = obtenir_version()
+    else:
+        version = await run_in_threadpool(obtenir_version, version_demandee)
+    response.headers[ENTETE_VERSION] = version.nom
+
+    if intervalles:
+        await run_in_threadpool(verifier_intervalles, version)
+        return await run_in_threadpool(profileur.executer, predire_unitaire, input_data, version, niveau)
+    if micro_batcher is None:
+        return await run_in_threadpool(profileur.executer, predire_unitaire, input_data, version)
+
+    # Regroupement avec les autres requêtes concurrentes
+    prediction, erreur = await micro_batcher.soumettre((input_data, version))
+    if erreur is not None:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la prédiction: {erreur}")
+    return PredictionOutput(revenu_predit=prediction, message=message_prediction(prediction))
+
+def valider_lignes(lignes):
+    """
+    Valide chaque ligne séparément: une ligne invalide n'invalide pas le lot.
+    Retourne les indices et PredictionInput des lignes valides, et les erreurs (indice, message).
+    """
+    debut = time.perf_counter()
+    indices_valides = []
+    entrees_valides = []
+    erreurs = []
+    for i, ligne in enumerate(lignes):
+        try:
+            entrees_valides.append(PredictionInput.model_validate(ligne))
+            indices_valides.append(i)
+        except ValidationError as e:
+            erreurs.append((i, str(e)))
+    metriques.observer_etape("validation", time.perf_counter() - debut)
+    return indices_valides, entrees_valides, erreurs
+
+def predire_lignes(lignes, version, niveau=None):
+    """Valide puis prédit les lignes brutes d'un lot (avec intervalles si `niveau` est donné)."""
+    resultats = [None] * len(lignes)
+    indices_valides, entrees_valides, erreurs = valider_lignes(lignes)
+    for i, erreur in erreurs:
+        resultats[i] = ResultatLigne(index=i, revenu_predit=None, erreur=erreur)
+
+    # Une seule prédiction vectorisée pour toutes les lignes valides
+    metriques.incrementer("api_lignes_predites_total", (("version", version.nom),), len(entrees_valides))
+    if niveau is None:
+        for i, (prediction, erreur) in zip(indices_valides, predire_lot(entrees_valides, version)):
+            resultats[i] = ResultatLigne(index=i, revenu_predit=prediction, erreur=erreur)
+    else:
+        predire = partial(predire_intervalles, niveau=niveau)
+        for i, (resultat, erreur) in zip(indices_valides, predire_lot(entrees_valides, version, predire)):
+            resultats[i] = ResultatLigne(index=i, erreur=erreur, **(resultat or {"revenu_predit": None}))
+
+    n_erreurs = sum(1 for r in resultats if r.erreur is not None)
+    return PredictionBatchOutput(resultats=resultats, n_succes=len(resultats) - n_erreurs, n_erreurs=n_erreurs)
+
+# Endpoint pour la prédiction par lot
+@app.post("/predict/batch", response_model=PredictionBatchOutput, response_model_exclude_unset=True)
+def predict_batch(batch: PredictionBatchInput, response: Response,
+                  intervalles: bool = Query(False), niveau: float = NIVEAU_INTERVALLE,
+                  version_demandee: Optional[str] = Header(None, alias=ENTETE_VERSION)):
+    version = obtenir_version(version_demandee)
+    response.headers[ENTETE_VERSION] = version.nom
+
+    lignes = extraire_lignes(batch)
+    if intervalles:
+        verifier_intervalles(version)
+    return profileur.executer(predire_lignes, lignes, version, niveau if intervalles else None)
+
+# Explications: contribution de chaque champ d'entrée au revenu prédit, par
+# décomposition des chemins dans les arbres (explainer.py). Elles décrivent le
+# modèle, pas une relation de cause à effet dans les données.
+def verifier_explications(version):
+    """L'explicateur de la version; 404 si les explications sont désactivées, 400 si le modèle ne s'y prête pas."""
+    if not EXPLICATIONS_ACTIVES:
+        raise HTTPException(status_code=404, detail="Explications désactivées (API_EXPLICATIONS=1 pour les activer)")
+    explicateur = version.explicateur()
+    if explicateur is None:
+        raise HTTPException(status_code=400, detail=f"Explications indisponibles pour la version '{version.nom}': "
+                                                    "régresseur non supporté par le moteur compilé")
+    return explicateur
+
+def expliquer_unitaire(input_data, version, valeur_reference):
+    try:
+        metriques.incrementer("api_lignes_expliquees_total", (("version", version.nom),))
+        return ExplicationOutput(valeur_reference=valeur_reference, **expliquer_entrees([input_data], version)[0])
+    except Exception as e:
+        logger.error(f"Erreur détaillée: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur lors de l'explication: {str(e)}")
+
+def expliquer_lignes(lignes, version, valeur_reference):
+    """Valide puis explique les lignes brutes d'un lot."""
+    resultats = [None] * len(lignes)
+    indices_valides, entrees_valides, erreurs = valider_lignes(lignes)
+    for i, erreur in erreurs:
+        resultats[i] = ExplicationLigne(index=i, erreur=erreur)
+
+    metriques.incrementer("api_lignes_expliquees_total", (("version", version.nom),), len(entrees_valides))
+    for i, (resultat, erreur) in zip(indices_valides, predire_lot(entrees_valides, version, expliquer_entrees)):
+        resultats[i] = ExplicationLigne(index=i, erreur=erreur, **(resultat or {}))
+
+    n_erreurs = sum(1 for r in resultats if r.erreur is not None)
+    return ExplicationBatchOutput(valeur_reference=valeur_reference, resultats=resultats,
+                                  n_succes=len(resultats) - n_erreurs, n_erreurs=n_erreurs)
+
+# Endpoint pour l'explication d'une prédiction
+@app.post("/explain", response_model=ExplicationOutput)
+def explain(input_data: PredictionInput, response: Response,
+            version_demandee: Optional[str] = Header(None, alias=ENTETE_VERSION)):
+    version = obtenir_version(version_demandee)
+    response.headers[ENTETE_VERSION] = version.nom
+    explicateur = verifier_explications(version)
+    return profileur.executer(expliquer_unitaire, input_data, version, explicateur.valeur_reference)
+
+# Endpoint pour l'explication par lot (mêmes formats que /predict/batch)
+@app.post("/explain/batch", response_model=ExplicationBatchOutput)
+def explain_batch(batch: PredictionBatchInput, response: Response,
+                  version_demandee: Optional[str] = Header(None, alias=ENTETE_VERSION)):
+    version = obtenir_version(version_demandee)
+    response.headers[ENTETE_VERSION] = version.nom
+
+    lignes = extraire_lignes(batch)
+    explicateur = verifier_explications(version)
+    return profileur.executer(expliquer_lignes, lignes, version, explicateur.valeur_reference)
+
+def file_pleine():
+    return HTTPException(status_code=429, detail=f"File des jobs pleine ({JOBS_CAPACITE} jobs en attente)",
+                         headers={"Retry-After": JOBS_RETRY_AFTER})
+
+# Les blocs reçus sont regroupés jusqu'à cette taille avant chaque écriture (faite hors de la boucle d'événements)
+TAILLE_ECRITURE = 1024 * 1024
+
+async def recevoir_fichier(request, dossier):
+    """Écrit le corps de la requête sur disque au fil de la réception; retourne le chemin du fichier."""
+    temporaire = os.path.join(dossier, "entree.tmp")
+    taille_max = JOBS_TAILLE_MAX_MO * 1024 * 1024
+    taille = 0
+    entete = b""
+    tampon = bytearray()
+    with open(temporaire, "wb") as f:
+        async for bloc in request.stream():
+            taille += len(bloc)
+            if taille > taille_max:
+                raise HTTPException(status_code=413,
+                                    detail=f"Fichier trop volumineux (maximum {JOBS_TAILLE_MAX_MO:g} Mo)")
+            if len(entete) < 4:
+                entete += bloc[:4]
+            tampon += bloc
+            if len(tampon) >= TAILLE_ECRITURE:
+                await run_in_threadpool(f.write, bytes(tampon))
+                tampon.clear()
+        if tampon:
+            await run_in_threadpool(f.write, bytes(tampon))
+    if taille == 0:
+        raise HTTPException(status_code=400, detail="Corps de la requête vide: envoyer le fichier à prédire")
+    chemin = os.path.join(dossier, "entree" + extension_fichier(entete))
+    os.replace(temporaire, chemin)
+    return chemin
+
+def resoudre_entree(chemin):
+    """Chemin d'un fichier du dossier JOBS_DOSSIER_ENTREES, sans possibilité d'en sortir."""
+    if JOBS_DOSSIER_ENTREES is None:
+        raise HTTPException(status_code=400, detail="Référence à un fichier du serveur désactivée "
+                                                    "(API_JOBS_DOSSIER_ENTREES): envoyer le fichier")
+    if not isinstance(chemin, str) or not chemin:
+        raise HTTPException(status_code=400, detail='Corps attendu: {"chemin": "<fichier>"}')
+    racine = os.path.realpath(JOBS_DOSSIER_ENTREES)
+    complet = os.path.realpath(os.path.join(racine, chemin))
+    if os.path.commonpath([racine, complet]) != racine:
+        raise HTTPException(status_code=400, detail=f"Chemin hors de {JOBS_DOSSIER_ENTREES}: {chemin}")
+    if not os.path.exists(complet):
+        raise HTTPException(status_code=404, detail=f"Fichier introuvable: {chemin}")
+    return complet
+
+# Soumission d'un job: le fichier (CSV, CSV.gz ou Parquet) est envoyé comme corps
+# de la requête, ou désigné par {"chemin": ...} (Content-Type: application/json).
+# Réponse 202 immédiate; le job est prédit en arrière-plan avec la version du
+# modèle active (ou demandée par X-Model-Version) au moment de la soumission
+@app.post("/jobs", status_code=202)
+async def soumettre_job(request: Request, response: Response,
+                        conserver_colonnes: bool = Query(False),
+                        version_demandee: Optional[str] = Header(None, alias=ENTETE_VERSION)):
+    # Refuser avant de recevoir le fichier si la file est déjà pleine
+    if await run_in_threadpool(file_jobs.pleine):
+        raise file_pleine()
+    version = await run_in_threadpool(obtenir_version, version_demandee)
+
+    identifiant, dossier = await run_in_threadpool(file_jobs.nouveau_dossier)
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            try:
+                corps = await request.json()
+            except ValueError:
+                raise HTTPException(status_code=400, detail='Corps JSON invalide: attendu {"chemin": "<fichier>"}')
+            entree = resoudre_entree(corps.get("chemin") if isinstance(corps, dict) else None)
+        else:
+            entree = await recevoir_fichier(request, dossier)
+        job = await run_in_threadpool(file_jobs.soumettre, identifiant, entree, version.nom,
+                                      JOBS_TAILLE_CHUNK, conserver_colonnes)
+    except FilePleine:
+        shutil.rmtree(dossier, ignore_errors=True)
+        raise file_pleine()
+    except BaseException:
+        shutil.rmtree(dossier, ignore_errors=True)
+        raise
+    response.headers["Location"] = f"/jobs/{identifiant}"
+    response.headers[ENTETE_VERSION] = version.nom
+    return decrire(job)
+
+# Nombre de jobs par état (partagé par tous les processus qui utilisent la file)
+@app.get("/jobs")
+def jobs():
+    return {"capacite": JOBS_CAPACITE, "workers": JOBS_WORKERS, **file_jobs.compter()}
+
+def obtenir_job(identifiant):
+    job = file_jobs.obtenir(identifiant)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job inconnu: {identifiant}")
+    return job
+
+# Avancement d'un job: état, lignes prédites, débit, position dans la file
+@app.get("/jobs/{identifiant}")
+def job(identifiant: str):
+    return decrire(obtenir_job(identifiant))
+
+# Prédictions d'un job terminé (CSV envoyé par blocs, sans être chargé en mémoire)
+@app.get("/jobs/{identifiant}/resultats")
+def job_resultats(identifiant: str):
+    job = obtenir_job(identifiant)
+    if job["etat"] != TERMINE:
+        raise HTTPException(status_code=409, detail=f"Job non terminé (état: {job['etat']})",
+                            headers={"Retry-After": JOBS_RETRY_AFTER})
+    return FileResponse(job["sortie"], media_type="text/csv",
+                        filename=f"predictions-{identifiant}.csv")
+
+# Endpoint exposant les métriques du micro-batching
+@app.get("/batching/stats")
+def batching_stats():
+    if micro_batcher is None:
+        return {"actif": False}
+    return {"actif": True, **micro_batcher.statistiques()}
+
+# Endpoint exposant les compteurs du cache des prédictions
+@app.get("/cache/stats")
+def cache_stats():
+    version = registre.active
+    if version is None or version.cache is None:
+        return {"actif": False}
+    return {"actif": True, "version": version.nom, **version.cache.statistiques()}
+
+# Endpoint exposant les versions chargées par ce worker
+@app.get("/models")
+def models():
+    return registre.statistiques()
+
+# Endpoint de disponibilité: 200 une fois le modèle chargé, 503 sinon
+@app.get("/ready")
+def ready():
+    etat = etat_chargement()
+    version = registre.active
+    contenu = {
+        "pret": etat == "pret",
+        "etat": etat,
+        "version_active": version.nom if version is not None else None,
+        "duree_chargement_s": version.duree_chargement if version is not None else None,
+        "duree_prechauffage_s": version.duree_prechauffage if version is not None else None,
+        "erreurs": {nom: message for nom, (_, message) in registre.echecs.items()},
+        "moteur": MOTEUR,
+        "pid": os.getpid(),
+    }
+    return JSONResponse(contenu, status_code=200 if contenu["pret"] else 503)
+
+def familles_etat():
+    """Jauges et compteurs lus au moment du scrape de /metrics."""
+    version = registre.active
+    familles = [
+        ("api_modele_pret", "gauge", "1 si un modèle est chargé", [((), int(version is not None))]),
+        ("api_modele_remplacements_total", "counter", "Nombre d'activations de versions",
+         [((), registre.n_remplacements)]),
+    ]
+    if version is not None:
+        familles.append(("api_modele_version_info", "gauge", "Version active du modèle",
+                         [((("version", version.nom), ("moteur", MOTEUR)), 1)]))
+        if version.cache is not None:
+            stats = version.cache.statistiques()
+            familles += [
+                ("api_cache_hits_total", "counter", "Prédictions servies par le cache", [((), stats["hits"])]),
+                ("api_cache_misses_total", "counter", "Prédictions absentes du cache", [((), stats["misses"])]),
+            ]
+            if stats["taille"] is not None:
+                familles.append(("api_cache_taille", "gauge", "Entrées du cache", [((), stats["taille"])]))
+    if version is not None and version.table is not None:
+        stats = version.table.statistiques()
+        familles += [
+            ("api_table_hits_total", "counter", "Prédictions lues dans la table précalculée", [((), stats["hits"])]),
+            ("api_table_misses_total", "counter", "Entrées hors de la grille de la table", [((), stats["misses"])]),
+        ]
+    if micro_batcher is not None:
+        stats = micro_batcher.statistiques()
+        familles += [
+            ("api_micro_batch_lots_total", "counter", "Lots prédits par le micro-batching", [((), stats["n_lots"])]),
+            ("api_micro_batch_requetes_total", "counter", "Requêtes regroupées", [((), stats["n_requetes"])]),
+            ("api_micro_batch_en_file", "gauge", "Requêtes en attente de regroupement", [((), stats["en_file"])]),
+        ]
+    comptes = file_jobs.compter()
+    familles.append(("api_jobs", "gauge", "Jobs par état dans la file",
+                     [((("etat", etat),), n) for etat, n in comptes.items()]))
+    return familles
+
+# Endpoint Prometheus: histogrammes des durées par étape et par requête
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    texte = metriques.exposer(labels_communs=(("pid", os.getpid()),), familles=familles_etat())
+    return PlainTextResponse(texte, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Résumé lisible des durées par étape (moyenne, p50, p99 estimés depuis les histogrammes)
+@app.get("/metrics/etapes")
+def metrics_etapes():
+    return {"actif": metriques.actif, "pid": os.getpid(), "etapes": metriques.resume_etapes()}
+
+# Profilage échantillonné: profile une fraction des prédictions pendant `duree`
+# secondes et retourne le rapport cProfile (texte) ou le fichier .pstats
+@app.get("/debug/profile")
+async def debug_profile(duree: float = Query(10.0, gt=0, le=PROFILAGE_DUREE_MAX),
+                        taux: float = Query(0.1, gt=0, le=1),
+                        tri: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$"),
+                        lignes: int = Query(40, ge=1, le=1000),
+                        format: str = Query("texte", pattern="^(texte|pstats)$")):
+    if not PROFILAGE_ACTIF:
+        raise HTTPException(status_code=404, detail="Profilage désactivé (API_PROFILAGE=1 pour l'activer)")
+    try:
+        profileur.demarrer(duree, taux)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(duree)
+    finally:
+        n_profiles = profileur.n_profiles
+        stats = profileur.arreter()
+    if stats is None:
+        return PlainTextResponse(f"Aucune requête profilée en {duree:g} s (pid {os.getpid()})\n")
+    if format == "pstats":
+        return Response(exporter_profil(stats), media_type="application/octet-stream",
+                        headers={"Content-Disposition": f'attachment; filename="api-{os.getpid()}.pstats"'})
+    entete = f"{n_profiles} appels profilés en {duree:g} s (taux {taux:g}, pid {os.getpid()})\n\n"
+    return PlainTextResponse(entete + formater_profil(stats, tri, lignes))
+
 # Endpoint pour vérifier que l'API fonctionne
 @app.get("/")
 def read_root():
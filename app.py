@@ -1,5 +1,8 @@
 import streamlit as st
+import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -17,21 +20,98 @@ st.title("Prédiction du Revenu Annuel d'un Marocain")
 st.markdown("Cette application permet de prédire le revenu annuel d'un marocain en fonction de ses caractéristiques socio-démographiques.")
 
 # URL de l'API
-API_URL = "http://localhost:8000/predict"
+API_BASE_URL = os.environ.get("API_URL", "http://localhost:8000")
+API_URL = f"{API_BASE_URL}/predict"
+API_BATCH_URL = f"{API_BASE_URL}/predict/batch"
+API_EXPLAIN_URL = f"{API_BASE_URL}/explain"
+
+# Délais (s) d'établissement de la connexion et de lecture de la réponse
+TIMEOUT = (2.0, 10.0)
+# Durée de conservation des prédictions déjà demandées (s)
+DUREE_MEMOISATION = 600
+
+class ErreurAPI(Exception):
+    pass
+
+# Session HTTP partagée par toutes les exécutions du script et toutes les
+# sessions utilisateur: les connexions restent ouvertes (keep-alive) au lieu
+# d'être rétablies à chaque clic
+@st.cache_resource
+def obtenir_session():
+    session = requests.Session()
+    # Nouvelles tentatives sur les erreurs de connexion et les réponses
+    # 502/503/504 (modèle en cours de chargement: Retry-After est respecté);
+    # les prédictions sont sans effet de bord, POST peut donc être rejoué
+    tentatives = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                       allowed_methods=frozenset({"GET", "POST"}), raise_on_status=False)
+    adaptateur = HTTPAdapter(max_retries=tentatives, pool_connections=1, pool_maxsize=10)
+    session.mount("http://", adaptateur)
+    session.mount("https://", adaptateur)
+    return session
+
+def poster(url, corps):
+    try:
+        response = obtenir_session().post(url, json=corps, timeout=TIMEOUT)
+    except requests.RequestException as e:
+        raise ErreurAPI(f"Erreur de connexion à l'API: {str(e)}")
+    if response.status_code != 200:
+        raise ErreurAPI(f"Erreur lors de la prédiction: {response.text}")
+    return response.json()
+
+# Prédictions mémorisées: une saisie identique n'est pas renvoyée à l'API
+# (les erreurs, levées, ne sont pas mémorisées)
+@st.cache_data(ttl=DUREE_MEMOISATION, max_entries=1000, show_spinner=False)
+def predire_memorise(donnees):
+    return poster(API_URL, dict(donnees))
+
+@st.cache_data(ttl=DUREE_MEMOISATION, max_entries=200, show_spinner=False)
+def predire_variantes_memorise(donnees, champ, valeurs):
+    lignes = [dict(donnees, **{champ: valeur}) for valeur in valeurs]
+    resultats = poster(API_BATCH_URL, {"lignes": lignes})["resultats"]
+    return [(valeur, resultat["revenu_predit"], resultat["erreur"])
+            for valeur, resultat in zip(valeurs, resultats)]
+
+@st.cache_data(ttl=DUREE_MEMOISATION, max_entries=1000, show_spinner=False)
+def expliquer_memorise(donnees):
+    return poster(API_EXPLAIN_URL, dict(donnees))
 
 # Fonction pour faire une prédiction via l'API
 def predict_income(data):
     try:
-        response = requests.post(API_URL, json=data)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Erreur lors de la prédiction: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Erreur de connexion à l'API: {str(e)}")
+        return predire_memorise(tuple(sorted(data.items())))
+    except ErreurAPI as e:
+        st.error(str(e))
+        return None
+
+# Variantes d'une même personne ne différant que par `champ`, prédites en un seul appel à /predict/batch
+def predict_variants(data, champ, valeurs):
+    try:
+        return predire_variantes_memorise(tuple(sorted(data.items())), champ, tuple(valeurs))
+    except ErreurAPI as e:
+        st.error(str(e))
         return None
 
+# Contributions de chaque information saisie au revenu prédit, via /explain
+# (facultatif: un avertissement seulement si l'API ne les fournit pas)
+def explain_income(data):
+    try:
+        return expliquer_memorise(tuple(sorted(data.items())))
+    except ErreurAPI as e:
+        st.warning(f"Explication indisponible. {e}")
+        return None
+
+# Libellés des champs de l'API dans les explications
+LIBELLES_CHAMPS = {
+    "age": "Âge", "sexe": "Sexe", "milieu": "Milieu", "est_urbain": "Milieu urbain",
+    "etat_matrimonial": "État matrimonial", "est_marie": "Marié(e)", "taille_foyer": "Taille du foyer",
+    "niveau_education": "Niveau d'éducation", "annees_experience": "Années d'expérience",
+    "categorie_socioprofessionnelle": "Catégorie socioprofessionnelle", "a_retraite": "Retraite",
+    "aide_sociale": "Aide sociale", "a_acces_credit": "Accès au crédit", "possede_voiture": "Voiture",
+    "possede_logement": "Logement", "possede_terrain": "Terrain", "region": "Région",
+    "niveau_socioeco": "Niveau socio-économique", "revenu_par_experience": "Revenu par année d'expérience",
+    "weight": "Poids de l'observation",
+}
+
 # Interface utilisateur pour saisir les données
 st.header("Saisissez les informations")
 
@@ -57,18 +137,23 @@ with col1:
 
 with col2:
     st.subheader("Éducation et profession")
-    niveau_education = st.selectbox("Niveau d'éducation", 
-                                   ["Sans niveau", "Fondamental", "Secondaire", "Supérieur"])
+    niveaux_education = ["Sans niveau", "Fondamental", "Secondaire", "Supérieur"]
+    niveau_education = st.selectbox("Niveau d'éducation", niveaux_education)
     
     annees_experience = st.slider("Années d'expérience", 0, 50, 5)
     
-    categorie_socioprofessionnelle = st.selectbox("Catégorie socioprofessionnelle", 
-                                                 ["Groupe 1 : Cadres supérieurs et professions libérales",
-                                                  "Groupe 2 : Cadres moyens et employés",
-                                                  "Groupe 3 : Inactifs (retraités, rentiers)",
-                                                  "Groupe 4 : Travailleurs agricoles",
-                                                  "Groupe 5 : Ouvriers qualifiés et artisans",
-                                                  "Groupe 6 : Manœuvres et chômeurs"])
+    # Le modèle attend le code du groupe ("Groupe 1"), le libellé n'est qu'affiché
+    groupes_socioprofessionnels = {
+        "Groupe 1": "Groupe 1 : Cadres supérieurs et professions libérales",
+        "Groupe 2": "Groupe 2 : Cadres moyens et employés",
+        "Groupe 3": "Groupe 3 : Inactifs (retraités, rentiers)",
+        "Groupe 4": "Groupe 4 : Travailleurs agricoles",
+        "Groupe 5": "Groupe 5 : Ouvriers qualifiés et artisans",
+        "Groupe 6": "Groupe 6 : Manœuvres et chômeurs",
+    }
+    categorie_socioprofessionnelle = st.selectbox("Catégorie socioprofessionnelle",
+                                                 list(groupes_socioprofessionnels),
+                                                 format_func=groupes_socioprofessionnels.get)
     
     a_retraite = st.checkbox("Bénéficie d'une retraite")
     aide_sociale = st.checkbox("Bénéficie d'une aide sociale")
@@ -91,31 +176,31 @@ with col3:
     ]
     region = st.selectbox("Région", regions)
 
+# Préparation des données pour l'API
+input_data = {
+    "age": age,
+    "sexe": sexe,
+    "milieu": milieu,
+    "etat_matrimonial": etat_matrimonial,
+    "region": region,
+    "niveau_education": niveau_education,
+    "categorie_socioprofessionnelle": categorie_socioprofessionnelle,
+    "taille_foyer": float(taille_foyer),
+    "aide_sociale": int(aide_sociale),
+    "a_acces_credit": int(a_acces_credit),
+    "a_retraite": int(a_retraite),
+    "possede_voiture": float(possede_voiture),
+    "possede_logement": float(possede_logement),
+    "possede_terrain": int(possede_terrain),
+    "annees_experience": float(annees_experience),
+    "est_urbain": est_urbain,
+    "est_marie": est_marie,
+    "weight": 1.0,
+    "niveau_socioeco": float(niveau_socioeco)
+}
+
 # Bouton pour lancer la prédiction
 if st.button("Prédire le revenu annuel"):
-    # Préparation des données pour l'API
-    input_data = {
-        "age": age,
-        "sexe": sexe,
-        "milieu": milieu,
-        "etat_matrimonial": etat_matrimonial,
-        "region": region,
-        "niveau_education": niveau_education,
-        "categorie_socioprofessionnelle": categorie_socioprofessionnelle,
-        "taille_foyer": float(taille_foyer),
-        "aide_sociale": int(aide_sociale),
-        "a_acces_credit": int(a_acces_credit),
-        "a_retraite": int(a_retraite),
-        "possede_voiture": float(possede_voiture),
-        "possede_logement": float(possede_logement),
-        "possede_terrain": int(possede_terrain),
-        "annees_experience": float(annees_experience),
-        "est_urbain": est_urbain,
-        "est_marie": est_marie,
-        "weight": 1.0,
-        "niveau_socioeco": float(niveau_socioeco)
-    }
-
     # Appel à l'API pour la prédiction
     with st.spinner("Calcul en cours..."):
         result = predict_income(input_data)
@@ -174,6 +259,74 @@ if st.button("Prédire le revenu annuel"):
         else:
             st.success(f"Le revenu par personne est supérieur au seuil de pauvreté estimé à {seuil_pauvrete} DH.")
 
+        # Explication: ce que chaque information saisie ajoute ou retire au revenu moyen prédit par le modèle
+        st.subheader("Pourquoi ce revenu ?")
+        explication = explain_income(input_data)
+        if explication:
+            contributions = [(LIBELLES_CHAMPS.get(champ, champ), valeur)
+                             for champ, valeur in explication["contributions"].items() if abs(valeur) >= 1]
+            st.markdown(f"Le modèle part de son revenu moyen, **{explication['valeur_reference']:.0f} DH**, "
+                        "puis chaque information saisie le fait monter ou baisser:")
+            contributions.reverse()
+            fig, ax = plt.subplots(figsize=(10, 6))
+            ax.barh([libelle for libelle, _ in contributions], [valeur for _, valeur in contributions],
+                    color=['tab:green' if valeur > 0 else 'tab:red' for _, valeur in contributions])
+            for i, (_, valeur) in enumerate(contributions):
+                ax.annotate(f"{valeur:+.0f} DH", (valeur, i), va='center',
+                            ha='left' if valeur > 0 else 'right', fontsize=9)
+            ax.axvline(0, color='gray', linewidth=0.8)
+            ax.set_xlabel('Contribution au revenu annuel prédit (DH)')
+            ax.set_title(f"{explication['valeur_reference']:.0f} DH (moyenne) "
+                         f"→ {explication['revenu_predit']:.0f} DH (prédiction)")
+            st.pyplot(fig)
+
+# Analyse de scénarios: la même personne en faisant varier une seule caractéristique
+st.header("Et si... ?")
+st.markdown("Comparez le revenu prédit pour toutes les valeurs d'une caractéristique, "
+            "les autres informations saisies restant identiques.")
+
+# Caractéristique -> (champ de l'API, valeurs, caractéristique numérique)
+scenarios = {
+    "Région": ("region", regions, False),
+    "Niveau d'éducation": ("niveau_education", niveaux_education, False),
+    "Catégorie socioprofessionnelle": ("categorie_socioprofessionnelle", list(groupes_socioprofessionnels), False),
+    "Âge": ("age", list(range(18, 81, 2)), True),
+    "Années d'expérience": ("annees_experience", [float(a) for a in range(0, 51, 2)], True),
+}
+choix_scenario = st.selectbox("Caractéristique à faire varier", list(scenarios))
+
+if st.button("Comparer les variantes"):
+    champ, valeurs, numerique = scenarios[choix_scenario]
+
+    # Toutes les variantes en un seul appel à /predict/batch
+    with st.spinner(f"Calcul de {len(valeurs)} variantes..."):
+        variantes = predict_variants(input_data, champ, valeurs)
+
+    if variantes:
+        erreurs = [(valeur, erreur) for valeur, _, erreur in variantes if erreur is not None]
+        for valeur, erreur in erreurs:
+            st.warning(f"{valeur}: {erreur}")
+        predictions = [(valeur, revenu) for valeur, revenu, erreur in variantes if erreur is None]
+
+        fig, ax = plt.subplots(figsize=(10, 6))
+        if numerique:
+            # Caractéristique numérique: courbe, valeur saisie marquée
+            ax.plot([v for v, _ in predictions], [r for _, r in predictions], marker='o')
+            ax.axvline(input_data[champ], color='gray', linestyle='--', label='Valeur saisie')
+            ax.set_xlabel(choix_scenario)
+            ax.set_ylabel('Revenu annuel (DH)')
+            ax.legend()
+        else:
+            # Caractéristique catégorielle: barres triées, valeur saisie mise en évidence
+            predictions.sort(key=lambda p: p[1])
+            couleurs = ['tab:orange' if v == input_data[champ] else 'tab:blue' for v, _ in predictions]
+            ax.barh([v for v, _ in predictions], [r for _, r in predictions], color=couleurs)
+            for i, (_, revenu) in enumerate(predictions):
+                ax.annotate(f"{revenu:.0f} DH", (revenu, i), va='center', fontsize=9)
+            ax.set_xlabel('Revenu annuel (DH)')
+        ax.set_title(f"Revenu annuel prédit selon : {choix_scenario.lower()}")
+        st.pyplot(fig)
+
 # Informations supplémentaires
 st.header("Informations sur le modèle")
 st.markdown("""
@@ -188,6 +341,9 @@ Les principales variables qui influencent le revenu sont:
 - La région
 - Les possessions (voiture, logement, terrain)
 - L'accès au crédit et aux aides sociales
+
+Pour une personne donnée, la rubrique « Pourquoi ce revenu ? » affichée avec la prédiction
+détaille la contribution de chacune de ses informations au revenu prédit.
 """)
 
 # Pied de page
@@ -0,0 +1,137 @@
+"""
+Micro-batching des appels concurrents à /predict.
+
+Les requêtes sont placées dans une file asyncio puis regroupées en un lot,
+vidé dès que le lot atteint `taille_max` requêtes ou que la plus ancienne
+requête a attendu `attente_max_ms` millisecondes. Le lot est prédit en un seul
+appel au modèle et chaque requête reçoit son propre résultat.
+
+À l'arrêt, les requêtes encore en attente (file et lot en cours) sont prédites
+une dernière fois: aucune ne reste sans réponse.
+"""
+import asyncio
+import time
+from collections import deque
+
+
+class MicroBatcher:
+    def __init__(self, fonction_prediction, taille_max=64, attente_max_ms=2.0, historique=100):
+        """
+        fonction_prediction: fonction synchrone qui reçoit une liste d'entrées et
+        retourne une liste de (prédiction, erreur) dans le même ordre.
+        """
+        self.fonction_prediction = fonction_prediction
+        self.taille_max = taille_max
+        self.attente_max = attente_max_ms / 1000.0
+        self._file = None
+        self._tache = None
+        self._lot_en_cours = []
+
+        # Métriques par vidage
+        self.n_lots = 0
+        self.n_requetes = 0
+        self.taille_max_observee = 0
+        self.attente_totale = 0.0
+        self.duree_prediction_totale = 0.0
+        self.repartition_tailles = {}
+        self.derniers_lots = deque(maxlen=historique)
+
+    async def demarrer(self):
+        if self._tache is None:
+            self._file = asyncio.Queue()
+            self._tache = asyncio.create_task(self._boucle())
+
+    async def arreter(self):
+        """Arrête la boucle, puis prédit les requêtes restées dans le lot en cours et dans la file."""
+        if self._tache is not None:
+            self._tache.cancel()
+            try:
+                await self._tache
+            except asyncio.CancelledError:
+                pass
+            self._tache = None
+
+            # Un lot interrompu pendant sa constitution ou sa prédiction est repris en entier
+            restantes = [requete for requete in self._lot_en_cours if not requete[1].done()]
+            self._lot_en_cours = []
+            while not self._file.empty():
+                restantes.append(self._file.get_nowait())
+            if restantes:
+                await self._vider(restantes, asyncio.get_running_loop())
+
+    async def soumettre(self, entree):
+        """Ajoute une entrée à la file et attend son résultat (prédiction, erreur)."""
+        if self._tache is None:
+            raise RuntimeError("Micro-batching arrêté")
+        future = asyncio.get_running_loop().create_future()
+        await self._file.put((entree, future, time.perf_counter()))
+        return await future
+
+    async def _boucle(self):
+        boucle = asyncio.get_running_loop()
+        while True:
+            lot = self._lot_en_cours = [await self._file.get()]
+            echeance = boucle.time() + self.attente_max
+
+            # Compléter le lot jusqu'à la taille maximale ou l'échéance
+            while len(lot) < self.taille_max:
+                if not self._file.empty():
+                    lot.append(self._file.get_nowait())
+                    continue
+                restant = echeance - boucle.time()
+                if restant <= 0:
+                    break
+                try:
+                    lot.append(await asyncio.wait_for(self._file.get(), restant))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._vider(lot, boucle)
+            self._lot_en_cours = []
+
+    async def _vider(self, lot, boucle):
+        debut = time.perf_counter()
+        entrees = [entree for entree, _, _ in lot]
+        try:
+            # La prédiction est exécutée hors de la boucle d'événements
+            resultats = await boucle.run_in_executor(None, self.fonction_prediction, entrees)
+        except Exception as e:
+            resultats = [(None, str(e))] * len(lot)
+        duree = time.perf_counter() - debut
+
+        for (_, future, _), resultat in zip(lot, resultats):
+            if not future.done():
+                future.set_result(resultat)
+
+        attente = sum(debut - arrivee for _, _, arrivee in lot)
+        self._enregistrer(len(lot), attente, duree)
+
+    def _enregistrer(self, taille, attente, duree):
+        self.n_lots += 1
+        self.n_requetes += taille
+        self.taille_max_observee = max(self.taille_max_observee, taille)
+        self.attente_totale += attente
+        self.duree_prediction_totale += duree
+        # Répartition des tailles de lot par puissance de 2 (1, 2, 4, 8, ...)
+        tranche = 1 << (taille - 1).bit_length()
+        self.repartition_tailles[tranche] = self.repartition_tailles.get(tranche, 0) + 1
+        self.derniers_lots.append({
+            "taille": taille,
+            "attente_moyenne_ms": attente / taille * 1000,
+            "duree_prediction_ms": duree * 1000,
+        })
+
+    def statistiques(self):
+        return {
+            "taille_max": self.taille_max,
+            "attente_max_ms": self.attente_max * 1000,
+            "n_lots": self.n_lots,
+            "n_requetes": self.n_requetes,
+            "en_file": self._file.qsize() if self._file is not None else 0,
+            "taille_moyenne": self.n_requetes / self.n_lots if self.n_lots else 0.0,
+            "taille_max_observee": self.taille_max_observee,
+            "attente_moyenne_ms": self.attente_totale / self.n_requetes * 1000 if self.n_requetes else 0.0,
+            "duree_prediction_moyenne_ms": self.duree_prediction_totale / self.n_lots * 1000 if self.n_lots else 0.0,
+            "repartition_tailles": {str(k): v for k, v in sorted(self.repartition_tailles.items())},
+            "derniers_lots": list(self.derniers_lots),
+        }
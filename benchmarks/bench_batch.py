@@ -0,0 +1,59 @@
+"""
+Compare le débit (lignes/s) du chemin ligne par ligne (/predict) et du chemin
+par lot (/predict/batch) pour des lots de 1, 100 et 10 000 lignes.
+
+Usage (depuis la racine du projet, avec modele_selection.joblib présent):
+    python benchmarks/bench_batch.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import api
+from donnees import generer_lignes, en_colonnes
+
+TAILLES = [1, 100, 10000]
+# Au-delà, le chemin ligne par ligne est mesuré sur un échantillon puis extrapolé
+MAX_LIGNES_UNITAIRES = 500
+
+
+def mesurer_unitaire(client, lignes):
+    echantillon = lignes[:MAX_LIGNES_UNITAIRES]
+    debut = time.perf_counter()
+    for ligne in echantillon:
+        reponse = client.post("/predict", json=ligne)
+        reponse.raise_for_status()
+    return len(echantillon) / (time.perf_counter() - debut)
+
+
+def mesurer_batch(client, corps, n):
+    debut = time.perf_counter()
+    reponse = client.post("/predict/batch", json=corps)
+    reponse.raise_for_status()
+    assert reponse.json()["n_succes"] == n
+    return n / (time.perf_counter() - debut)
+
+
+def main():
+    if not api.charger_modele():
+        sys.exit("modele_selection.joblib introuvable: entraîner le modèle avant le benchmark.")
+    client = TestClient(api.app)
+    # Préchauffage
+    client.post("/predict/batch", json={"lignes": generer_lignes(10)})
+
+    print(f"{'taille':>8} {'unitaire (l/s)':>16} {'lot lignes (l/s)':>18} {'lot colonnes (l/s)':>20} {'gain':>8}")
+    for taille in TAILLES:
+        lignes = generer_lignes(taille, seed=taille)
+        debit_unitaire = mesurer_unitaire(client, lignes)
+        debit_lignes = mesurer_batch(client, {"lignes": lignes}, taille)
+        debit_colonnes = mesurer_batch(client, {"colonnes": en_colonnes(lignes)}, taille)
+        print(f"{taille:>8} {debit_unitaire:>16.0f} {debit_lignes:>18.0f} {debit_colonnes:>20.0f} "
+              f"{debit_lignes / debit_unitaire:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
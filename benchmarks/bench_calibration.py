@@ -0,0 +1,50 @@
+"""
+Compare la calibration en forme fermée (CalibrateurQuantile) à la calibration
+itérative d'origine (ajuster_distribution_skew): durée et écart aux cibles.
+
+Usage (depuis la racine du projet):
+    python benchmarks/bench_calibration.py [taille ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import generate_dataset as gd
+
+TAILLES = [40000, 5000000]
+
+
+def ecarts(revenus, milieu):
+    resultat = []
+    for m, (cible, pct_cible) in gd.cibles_milieu.items():
+        valeurs = revenus[milieu == m]
+        moyenne = valeurs.mean()
+        resultat.append((moyenne - cible, (valeurs < moyenne).mean() * 100 - pct_cible))
+    return resultat
+
+
+def main():
+    tailles = [int(t) for t in sys.argv[1:]] or TAILLES
+    print(f"{'lignes':>9} {'méthode':>10} {'durée (s)':>10} {'écart moy. U/R (DH)':>22} {'écart % U/R (pts)':>20}")
+    for n in tailles:
+        rng = np.random.default_rng(42)
+        donnees = gd.ajouter_bruit(gd.generer_donnees(n, rng), rng)
+        milieu = donnees['milieu']
+        for methode in ['iterative', 'quantile']:
+            revenus = donnees['revenu_annuel'].copy()
+            debut = time.perf_counter()
+            if methode == 'iterative':
+                gd.calibrer_revenus_iteratif(revenus, milieu == 0, np.random.default_rng(0))
+            else:
+                gd.calibrer_revenus(revenus, milieu)
+            duree = time.perf_counter() - debut
+            (du, pu), (dr, pr) = ecarts(revenus, milieu)
+            print(f"{n:>9} {methode:>10} {duree:>10.3f} {du:>+10.2f} / {dr:>+9.2f} {pu:>+9.1f} / {pr:>+8.1f}")
+
+
+if __name__ == "__main__":
+    main()
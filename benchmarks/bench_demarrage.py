@@ -0,0 +1,105 @@
+"""
+Démarrage à froid et mémoire par worker de l'API (uvicorn --workers N) selon
+le format du modèle: pickle scikit-learn (API_MOTEUR=sklearn) ou moteur
+exporté projeté en mémoire (API_MOTEUR=mmap).
+
+Pour chaque configuration, mesure le temps entre le lancement d'uvicorn et le
+moment où tous les workers répondent 200 sur /ready, puis, après quelques
+prédictions, le RSS et le PSS (part de la mémoire partagée attribuée à chaque
+processus) de chaque worker.
+
+Usage (depuis le dossier qui contient modele_selection.joblib et
+modele_selection.moteur.joblib):
+    python benchmarks/bench_demarrage.py
+"""
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from donnees import generer_lignes  # noqa: E402
+
+MOTEURS = ["sklearn", "mmap"]
+WORKERS = [1, 4, 8]
+PORT = 8765
+DELAI_MAX = 180.0
+
+
+def interroger_ready(url):
+    try:
+        reponse = httpx.get(f"{url}/ready", timeout=5.0)
+    except httpx.HTTPError:
+        return None
+    return reponse.json() if reponse.status_code == 200 else None
+
+
+def attendre_workers(url, n_workers, executor):
+    """Interroge /ready (plusieurs connexions simultanées) jusqu'à ce que n_workers distincts soient prêts."""
+    prets = {}
+    debut = time.perf_counter()
+    while len(prets) < n_workers:
+        if time.perf_counter() - debut > DELAI_MAX:
+            raise TimeoutError(f"{len(prets)}/{n_workers} workers prêts après {DELAI_MAX:.0f} s")
+        for etat in executor.map(interroger_ready, [url] * 4 * n_workers):
+            if etat is not None and etat["pid"] not in prets:
+                prets[etat["pid"]] = etat["duree_chargement_s"]
+        time.sleep(0.05)
+    return time.perf_counter() - debut, prets
+
+
+def memoire(pid):
+    """RSS et PSS (Mo) d'un processus."""
+    valeurs = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for ligne in f:
+            champs = ligne.split()
+            if champs[0] in ("Rss:", "Pss:"):
+                valeurs[champs[0][:-1]] = int(champs[1]) / 1024
+    return valeurs["Rss"], valeurs["Pss"]
+
+
+def mesurer(moteur, n_workers, executor):
+    url = f"http://127.0.0.1:{PORT}"
+    env = dict(os.environ, API_MOTEUR=moteur, PYTHONPATH=RACINE, API_LOG_NIVEAU="WARNING")
+    processus = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(PORT),
+         "--workers", str(n_workers), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        duree, prets = attendre_workers(url, n_workers, executor)
+
+        # Quelques lots pour que chaque worker parcoure ses arbres
+        lot = {"lignes": generer_lignes(200)}
+        list(executor.map(lambda _: httpx.post(f"{url}/predict/batch", json=lot, timeout=60.0),
+                          range(4 * n_workers)))
+
+        mesures = [memoire(pid) for pid in prets]
+        rss = sum(m[0] for m in mesures) / len(mesures)
+        pss = sum(m[1] for m in mesures) / len(mesures)
+        chargement = sum(prets.values()) / len(prets)
+        return duree, chargement, rss, pss
+    finally:
+        processus.terminate()
+        processus.wait()
+
+
+def main():
+    print(f"{'moteur':>8} {'workers':>8} {'démarrage (s)':>14} {'chargement (s)':>15} "
+          f"{'RSS/worker (Mo)':>16} {'PSS/worker (Mo)':>16} {'PSS total (Mo)':>15}")
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        for moteur in MOTEURS:
+            for n_workers in WORKERS:
+                duree, chargement, rss, pss = mesurer(moteur, n_workers, executor)
+                print(f"{moteur:>8} {n_workers:>8} {duree:>14.2f} {chargement:>15.3f} "
+                      f"{rss:>16.0f} {pss:>16.0f} {pss * n_workers:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
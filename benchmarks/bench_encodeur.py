@@ -0,0 +1,64 @@
+"""
+Temps CPU par requête du chemin /predict avant et après l'encodeur direct
+(feature_encoder.py): construction d'un DataFrame et print à chaque requête,
+contre encodage dans une ligne NumPy réutilisée.
+
+Usage (depuis la racine du projet, avec modele_selection.joblib présent):
+    python benchmarks/bench_encodeur.py [n_requetes]
+"""
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+
+import api
+from compiled_model import compiler_pipeline
+from donnees import generer_lignes
+from feature_encoder import EncodeurRequetes
+
+
+def temps_cpu_par_requete(fonction, entrees):
+    debut = time.process_time()
+    for entree in entrees:
+        fonction(entree)
+    return (time.process_time() - debut) / len(entrees) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    pipeline = joblib.load("modele_selection.joblib")
+    encodeur = EncodeurRequetes(pipeline)
+    regresseur = pipeline.named_steps['regressor']
+    foret = compiler_pipeline(pipeline).foret
+    entrees = [api.PredictionInput(**ligne) for ligne in generer_lignes(n)]
+
+    def avant(entree):
+        # Chemin d'origine: DataFrame d'une ligne et print des colonnes
+        df = api.construire_dataframe([entree])
+        print(f"Colonnes du DataFrame: {df.columns.tolist()}")
+        return pipeline.predict(df)[0]
+
+    chemins = [
+        ("DataFrame seul", lambda e: api.construire_dataframe([e])),
+        ("encodeur seul", encodeur.encoder),
+        ("avant: DataFrame + pipeline + print", avant),
+        ("après: encodeur + régresseur sklearn", lambda e: regresseur.predict(encodeur.encoder(e))[0]),
+        ("après: encodeur + forêt compilée", lambda e: foret.predict(encodeur.encoder(e))[0]),
+    ]
+    for _, fonction in chemins:  # préchauffage
+        with open(os.devnull, "w") as nul, contextlib.redirect_stdout(nul):
+            fonction(entrees[0])
+
+    print(f"{n} requêtes, temps CPU moyen par requête")
+    for nom, fonction in chemins:
+        with open(os.devnull, "w") as nul, contextlib.redirect_stdout(nul):
+            micro = temps_cpu_par_requete(fonction, entrees)
+        print(f"{nom:>40}: {micro:>10.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
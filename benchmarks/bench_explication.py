@@ -0,0 +1,91 @@
+"""
+Latence de /explain (contributions par champ d'entrée) par rapport à la
+prédiction seule, pour 1, 100 et 1 000 lignes:
+  - prédiction seule: chemin de /predict (encodeur + régresseur du moteur choisi);
+  - explication: feuilles atteintes par la forêt compilée puis remontée de tous
+    les chemins à la fois (explainer.py), écarts des noeuds précalculés;
+  - naïf: decision_path de chaque arbre de `estimators_` depuis Python,
+    multiplié par les écarts de ses noeuds ventilés par champ, recalculés à
+    chaque appel.
+
+Le cache et la table précalculée sont désactivés. Le moteur se choisit comme
+pour l'API (API_MOTEUR=sklearn ou compile).
+
+Usage (depuis la racine du projet, avec modele_selection.joblib présent):
+    python benchmarks/bench_explication.py [repetitions]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["API_CACHE_TAILLE"] = "0"
+os.environ["API_TABLE"] = "0"
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+
+import api  # noqa: E402
+from donnees import generer_lignes  # noqa: E402
+
+TAILLES = [1, 100, 1000]
+
+
+def latence_mediane(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return float(np.median(durees)) * 1000
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    api.charger_modele()
+    version = api.registre.obtenir()
+    arbres = joblib.load(version.chemin).named_steps['regressor'].estimators_
+    explicateur = version.explicateur()
+    champs = [lecteur[1] for lecteur in version.encodeur.lecteurs]
+    champ_caracteristique = np.array([explicateur.champs.index(champ) for champ in champs])
+
+    def naif(entrees):
+        X = version.encodeur.encoder_lot(entrees)
+        contributions = np.zeros((len(X), explicateur.n_champs))
+        for arbre in arbres:
+            t = arbre.tree_
+            internes = np.flatnonzero(t.children_left != -1)
+            parents = np.arange(t.node_count)
+            parents[t.children_left[internes]] = internes
+            parents[t.children_right[internes]] = internes
+            valeurs = t.value[:, 0, 0]
+            ventilation = np.zeros((t.node_count, explicateur.n_champs))
+            ventilation[np.arange(t.node_count), champ_caracteristique[t.feature[parents]]] = valeurs - valeurs[parents]
+            contributions += arbre.decision_path(X) @ ventilation
+        return contributions / len(arbres)
+
+    entrees = [api.PredictionInput(**ligne) for ligne in generer_lignes(100, seed=0)]
+    _, contributions = explicateur.expliquer(version.encodeur.encoder_lot(entrees))
+    ecart = np.abs(contributions - naif(entrees)).max()
+    taille = sum(tableau.nbytes for tableau in (explicateur.parents, explicateur.ecarts, explicateur.champs_noeuds))
+    print(f"moteur {api.MOTEUR}, {len(arbres)} arbres, {explicateur.n_champs} champs; écarts des noeuds: "
+          f"{taille / 1e6:.0f} Mo, valeur de référence {explicateur.valeur_reference:.0f} DH; "
+          f"écart maximal au calcul naïf {ecart:.1e} DH")
+    chemins = [
+        ("prédiction seule", lambda entrees: api.predire_entrees(entrees, version)),
+        ("explication", lambda entrees: api.expliquer_entrees(entrees, version)),
+        ("naïf (arbre par arbre)", naif),
+    ]
+    print(f"\n{'lignes':>7} " + "".join(f"{nom:>24}" for nom, _ in chemins) + f"{'surcoût':>10}")
+    for n in TAILLES:
+        entrees = [api.PredictionInput(**ligne) for ligne in generer_lignes(n, seed=n)]
+        latences = []
+        for _, fonction in chemins:
+            fonction(entrees)
+            latences.append(latence_mediane(lambda: fonction(entrees), max(3, repetitions // max(1, n // 100))))
+        print(f"{n:>7} " + "".join(f"{latence:>21.2f} ms" for latence in latences)
+              + f"{latences[1] / latences[0]:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
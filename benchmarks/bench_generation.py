@@ -0,0 +1,42 @@
+"""
+Débit de generate_dataset.py (lignes/s) et respect des cibles de distribution
+pour plusieurs tailles de population. L'écriture du CSV n'est pas mesurée.
+
+Usage (depuis la racine du projet):
+    python benchmarks/bench_generation.py [taille ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_dataset as gd
+
+TAILLES = [40000, 1000000, 10000000]
+# Écarts tolérés par rapport aux cibles (ceux du générateur d'origine à 40 000 lignes)
+TOLERANCE_MOYENNE = 1.0
+TOLERANCE_POURCENTAGE = 7.0
+
+
+def main():
+    tailles = [int(t) for t in sys.argv[1:]] or TAILLES
+    print(f"{'lignes':>10} {'durée (s)':>10} {'lignes/s':>12} {'moy. urbain':>12} {'moy. rural':>11} "
+          f"{'% urbain':>9} {'% rural':>8}  cibles")
+    for n in tailles:
+        debut = time.perf_counter()
+        df = gd.generer_dataset(n, seed=42)
+        duree = time.perf_counter() - debut
+        stats = gd.statistiques_revenu(df)
+        (moy_u, pct_u), (moy_r, pct_r) = stats['urbain'], stats['rural']
+        ok = (abs(moy_u - gd.target_urbain) <= TOLERANCE_MOYENNE
+              and abs(moy_r - gd.target_rural) <= TOLERANCE_MOYENNE
+              and abs(pct_u - gd.target_pct_below_mean_urbain) <= TOLERANCE_POURCENTAGE
+              and abs(pct_r - gd.target_pct_below_mean_rural) <= TOLERANCE_POURCENTAGE)
+        print(f"{n:>10} {duree:>10.2f} {n / duree:>12.0f} {moy_u:>12.1f} {moy_r:>11.1f} "
+              f"{pct_u:>9.1f} {pct_r:>8.1f}  {'OK' if ok else 'HORS TOLÉRANCE'}")
+        del df
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Pic de mémoire et débit de la génération en flux (generate_dataset.py
+--taille-chunk) pour plusieurs tailles de population: le pic de mémoire doit
+rester constant quand n_samples augmente.
+
+Chaque mesure est faite dans un processus séparé.
+
+Usage (depuis la racine du projet):
+    python benchmarks/bench_generation_flux.py [format] [taille_chunk]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TAILLES = [1000000, 5000000, 10000000]
+
+ENFANT = """
+import json, resource, sys, time
+sys.path.insert(0, {racine!r})
+import generate_dataset as gd
+debut = time.perf_counter()
+stats = gd.generer_flux({n}, 42, {taille_chunk}, gd.creer_ecrivain({format!r}, {sortie!r}))
+duree = time.perf_counter() - debut
+print(json.dumps({{"duree": duree, "rss_mo": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "stats": stats.resume()}}))
+"""
+
+
+def main():
+    format_sortie = sys.argv[1] if len(sys.argv) > 1 else "parquet"
+    taille_chunk = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+    dossier = tempfile.mkdtemp()
+    try:
+        print(f"format {format_sortie}, chunks de {taille_chunk} lignes")
+        print(f"{'lignes':>10} {'durée (s)':>10} {'lignes/s':>10} {'pic RSS (Mo)':>13} "
+              f"{'moy. urbain':>12} {'moy. rural':>11}")
+        for n in TAILLES:
+            sortie = os.path.join(dossier, f"dataset_{n}")
+            code = ENFANT.format(racine=RACINE, n=n, taille_chunk=taille_chunk,
+                                 format=format_sortie, sortie=sortie)
+            resultat = json.loads(subprocess.run([sys.executable, "-c", code], check=True,
+                                                 capture_output=True, text=True).stdout.splitlines()[-1])
+            print(f"{n:>10} {resultat['duree']:>10.1f} {n / resultat['duree']:>10.0f} "
+                  f"{resultat['rss_mo']:>13.0f} {resultat['stats']['urbain'][0]:>12.1f} "
+                  f"{resultat['stats']['rural'][0]:>11.1f}")
+    finally:
+        shutil.rmtree(dossier)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Passage à l'échelle de la génération multi-processus (generate_dataset.py
+--workers): débit et accélération pour 1, 2, 4 et 8 processus, et
+vérification que la sortie est identique quel que soit le nombre de processus.
+
+Usage (depuis la racine du projet):
+    python benchmarks/bench_generation_parallele.py [n_samples] [taille_chunk]
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_dataset as gd  # noqa: E402
+
+WORKERS = [1, 2, 4, 8]
+
+
+def empreinte(chemin):
+    """Empreinte du CSV décompressé (les en-têtes gzip contiennent la date d'écriture)."""
+    h = hashlib.sha256()
+    with gzip.open(chemin, "rb") as f:
+        while bloc := f.read(1 << 20):
+            h.update(bloc)
+    return h.hexdigest()[:16]
+
+
+def main():
+    n_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 4000000
+    taille_chunk = int(sys.argv[2]) if len(sys.argv) > 2 else 250000
+    print(f"{n_samples} lignes, chunks de {taille_chunk}, {os.cpu_count()} coeurs")
+    print(f"{'workers':>8} {'durée (s)':>10} {'lignes/s':>10} {'accélération':>13} {'empreinte':>17}")
+
+    dossier = tempfile.mkdtemp()
+    try:
+        reference = None
+        empreintes = set()
+        for workers in WORKERS:
+            sortie = os.path.join(dossier, f"dataset_{workers}.csv.gz")
+            debut = time.perf_counter()
+            gd.generer_flux(n_samples, 42, taille_chunk, gd.EcrivainCSV(sortie), workers)
+            duree = time.perf_counter() - debut
+            reference = reference or duree
+            h = empreinte(sortie)
+            empreintes.add(h)
+            print(f"{workers:>8} {duree:>10.2f} {n_samples / duree:>10.0f} "
+                  f"{reference / duree:>12.2f}x {h:>17}")
+            os.remove(sortie)
+    finally:
+        shutil.rmtree(dossier)
+
+    if len(empreintes) > 1:
+        sys.exit("ÉCHEC: la sortie dépend du nombre de processus")
+    print("Sortie identique pour tous les nombres de processus")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare l'entraînement incrémental (incremental.py) au réentraînement complet
+quand les enquêtes arrivent par lots: durée de chaque mise à jour et MAE, RMSE,
+R² sur un même ensemble de test.
+
+Le dataset est mélangé puis découpé en un ensemble de test, des données
+initiales et des lots. Après chaque lot:
+  - sans mise à jour: le modèle initial;
+  - incrémental: +N arbres entraînés sur le lot (warm_start);
+  - glissant: idem, en gardant au plus le nombre d'arbres du modèle initial;
+  - complet: nettoyage, prétraitement et forêt réentraînés sur toutes les
+    données reçues (mêmes hyperparamètres, sans recherche de grille).
+
+Usage (depuis la racine du projet, avec le dataset généré):
+    python benchmarks/bench_incremental.py [dataset.csv] [n_lots] [arbres_par_lot]
+"""
+import copy
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from sklearn.ensemble import RandomForestRegressor  # noqa: E402
+from sklearn.pipeline import Pipeline  # noqa: E402
+
+import train  # noqa: E402
+from incremental import EtatIncremental, integrer_lot  # noqa: E402
+
+PART_TEST = 0.2
+PART_INITIALE = 0.4
+N_ARBRES = 100
+
+
+def entrainer_complet(df, configuration):
+    random_state = configuration['random_state']
+    df = train.nettoyer(df, random_state)
+    X = df.drop(columns=[train.cible])
+    y = df[train.cible]
+    pretraitement = train.construire_pretraitement(X, configuration['k_caracteristiques'])
+    regresseur = RandomForestRegressor(n_estimators=N_ARBRES, random_state=random_state, n_jobs=-1)
+    regresseur.fit(pretraitement.fit_transform(X, y), y.to_numpy())
+    return Pipeline(pretraitement.steps + [('regressor', regresseur)])
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    configuration = train.charger_configuration()
+    chemin = sys.argv[1] if len(sys.argv) > 1 else configuration['dataset']
+    n_lots = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    arbres_par_lot = int(sys.argv[3]) if len(sys.argv) > 3 else configuration['incremental']['arbres_par_lot']
+    random_state = configuration['random_state']
+
+    df = pd.read_csv(chemin).sample(frac=1, random_state=random_state).reset_index(drop=True)
+    n_test, n_initial = int(len(df) * PART_TEST), int(len(df) * PART_INITIALE)
+    test = train.nettoyer(df.iloc[:n_test], random_state)
+    X_test, y_test = test.drop(columns=[train.cible]), test[train.cible]
+    initial = df.iloc[n_test:n_test + n_initial]
+    lots = np.array_split(df.iloc[n_test + n_initial:], n_lots)
+
+    debut = time.perf_counter()
+    modele_initial = entrainer_complet(initial, configuration)
+    print(f"Modèle initial: {len(initial)} lignes, {time.perf_counter() - debut:.1f} s")
+    etat_initial = EtatIncremental.initialiser(initial, configuration['incremental']['taille_reservoir'],
+                                               random_state)
+    strategies = {
+        'incrémental': (copy.deepcopy(modele_initial), copy.deepcopy(etat_initial), None),
+        'glissant': (copy.deepcopy(modele_initial), copy.deepcopy(etat_initial), N_ARBRES),
+    }
+
+    lignes = [('initial', len(initial), 'sans mise à jour', 0.0,
+               train.metriques(y_test, modele_initial.predict(X_test)), N_ARBRES)]
+    recues = initial
+    for i, lot in enumerate(lots, 1):
+        recues = pd.concat([recues, lot])
+        for nom, (modele, etat, arbres_max) in strategies.items():
+            debut = time.perf_counter()
+            integrer_lot(modele, etat, lot, arbres_par_lot, arbres_max)
+            duree = time.perf_counter() - debut
+            lignes.append((f'lot {i}', len(recues), nom, duree, train.metriques(y_test, modele.predict(X_test)),
+                           len(modele.named_steps['regressor'].estimators_)))
+        debut = time.perf_counter()
+        complet = entrainer_complet(recues, configuration)
+        duree = time.perf_counter() - debut
+        lignes.append((f'lot {i}', len(recues), 'complet', duree, train.metriques(y_test, complet.predict(X_test)),
+                       N_ARBRES))
+    lignes.append((f'lot {n_lots}', len(recues), 'sans mise à jour', 0.0,
+                   train.metriques(y_test, modele_initial.predict(X_test)), N_ARBRES))
+
+    print(f"\n{'étape':<8} {'lignes':>7} {'stratégie':<17} {'durée (s)':>10} {'arbres':>7} "
+          f"{'MAE':>9} {'RMSE':>9} {'R²':>7}")
+    for etape, n_lignes, nom, duree, test_metriques, n_arbres in lignes:
+        print(f"{etape:<8} {n_lignes:>7} {nom:<17} {duree:>10.2f} {n_arbres:>7} "
+              f"{test_metriques['MAE']:>9.0f} {test_metriques['RMSE']:>9.0f} {test_metriques['R²']:>7.4f}")
+    print(f"\n{len(X_test)} lignes de test, {arbres_par_lot} arbres par lot, {N_ARBRES} arbres au plus (glissant)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Surcoût de l'instrumentation (metrics.py): durées par étape, durées des
+requêtes HTTP et compteurs, activés puis désactivés (API_METRIQUES) sur les
+mêmes appels.
+
+Les mesures alternent les deux états sur plusieurs tours pour neutraliser la
+dérive de la machine; la durée retenue est la médiane des tours. Le cache des
+prédictions est désactivé pour que chaque appel parcoure le modèle.
+
+L'écart de bout en bout étant du même ordre que le bruit de mesure, le coût
+absolu de l'instrumentation d'une requête /predict (chronomètre de trois
+étapes, compteur, middleware et histogramme de la requête) est aussi mesuré
+seul, en boucle, et rapporté à la durée d'une requête.
+
+Usage (depuis la racine du projet, avec modele_selection.joblib présent):
+    python benchmarks/bench_instrumentation.py [n_appels] [n_tours]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+
+import api
+from metrics import Metriques, MiddlewareMetriques
+from donnees import generer_lignes
+
+TAILLE_LOT = 100
+
+
+async def mesurer_http(client, chemin, corps, n_appels):
+    debut = time.perf_counter()
+    for i in range(n_appels):
+        reponse = await client.post(chemin, json=corps[i % len(corps)])
+        reponse.raise_for_status()
+    return (time.perf_counter() - debut) / n_appels
+
+
+def mesurer_fonction(entrees, version, n_appels):
+    debut = time.perf_counter()
+    for i in range(n_appels):
+        api.predire_entrees([entrees[i % len(entrees)]], version)
+    return (time.perf_counter() - debut) / n_appels
+
+
+async def application_vide(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def cout_instrumentation(n=200000):
+    """
+    Durée (s) de l'instrumentation d'une requête /predict, hors prédiction:
+    chronomètre de trois étapes et compteur, plus le surcoût du middleware
+    (activé moins désactivé) autour d'une application ASGI vide.
+    """
+    metriques = Metriques()
+    debut = time.perf_counter()
+    for _ in range(n):
+        chrono = metriques.chronometre()
+        chrono.etape("encodage")
+        chrono.etape("cache")
+        chrono.etape("regressor")
+        chrono.terminer()
+        metriques.incrementer("api_lignes_predites_total", (("version", "v1"),))
+    cout = (time.perf_counter() - debut) / n
+
+    async def envoyer(message):
+        pass
+
+    durees = {}
+    for actif in (False, True):
+        middleware = MiddlewareMetriques(application_vide, Metriques(actif=actif))
+        scope = {"type": "http", "method": "POST", "app": api.app, "endpoint": api.predict}
+        debut = time.perf_counter()
+        for _ in range(n):
+            await middleware(scope, None, envoyer)
+        durees[actif] = (time.perf_counter() - debut) / n
+    return cout + max(0.0, durees[True] - durees[False])
+
+
+async def main(n_appels, n_tours):
+    if not api.charger_modele():
+        sys.exit("modele_selection.joblib introuvable: entraîner le modèle avant le benchmark.")
+    version = api.registre.active
+    version.cache = None
+
+    lignes = generer_lignes(1000)
+    entrees = [api.PredictionInput(**ligne) for ligne in lignes]
+    lots = [{"lignes": lignes[i:i + TAILLE_LOT]} for i in range(0, len(lignes), TAILLE_LOT)]
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        cas = {
+            "predire_entrees (1 ligne)": lambda: mesurer_fonction(entrees, version, n_appels),
+            "/predict": lambda: mesurer_http(client, "/predict", lignes, n_appels),
+            f"/predict/batch ({TAILLE_LOT} lignes)": lambda: mesurer_http(
+                client, "/predict/batch", lots, max(1, n_appels // 10)),
+        }
+
+        print(f"{n_appels} appels par tour, {n_tours} tours, moteur {api.MOTEUR}")
+        print(f"{'cas':>28} {'sans (ms)':>10} {'avec (ms)':>10} {'surcoût':>8}")
+        duree_predict = None
+        for nom, mesure in cas.items():
+            durees = {False: [], True: []}
+            for actif in (False, True):    # préchauffage
+                api.metriques.actif = actif
+                resultat = mesure()
+                if asyncio.iscoroutine(resultat):
+                    await resultat
+            for _ in range(n_tours):
+                for actif in (False, True):
+                    api.metriques.actif = actif
+                    resultat = mesure()
+                    if asyncio.iscoroutine(resultat):
+                        resultat = await resultat
+                    durees[actif].append(resultat)
+            sans, avec = np.median(durees[False]), np.median(durees[True])
+            print(f"{nom:>28} {sans * 1000:>10.3f} {avec * 1000:>10.3f} {(avec / sans - 1) * 100:>7.1f}%")
+            if nom == "/predict":
+                duree_predict = sans
+
+    cout = await cout_instrumentation()
+    print(f"\nCoût de l'instrumentation d'une requête /predict: {cout * 1e6:.2f} µs "
+          f"({cout / duree_predict * 100:.2f}% d'une requête de {duree_predict * 1000:.3f} ms)")
+
+    api.metriques.actif = True
+    print("\nDurées par étape (ms):")
+    for etape, resume in api.metriques.resume_etapes().items():
+        print(f"{etape:>18} n={resume['n']:<8} moyenne {resume['moyenne_ms']:.3f}  "
+              f"p50 {resume['p50_ms']:.3f}  p99 {resume['p99_ms']:.3f}")
+
+
+if __name__ == "__main__":
+    n_appels = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_tours = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    asyncio.run(main(n_appels, n_tours))
@@ -0,0 +1,76 @@
+"""
+Latence ajoutée par le mode intervalles de /predict (?intervalles=true) par
+rapport à la prédiction seule, pour 1, 100 et 1 000 lignes:
+  - prédiction seule: chemin de /predict (encodeur + régresseur du moteur choisi);
+  - intervalles: un parcours de la forêt compilée, matrice par arbre réutilisée
+    pour la prédiction, l'écart-type et les quantiles;
+  - naïf: predict de chaque arbre de `estimators_` depuis Python, puis les
+    mêmes statistiques.
+
+Le cache et la table précalculée sont désactivés. Le moteur se choisit comme
+pour l'API (API_MOTEUR=sklearn ou compile).
+
+Usage (depuis la racine du projet, avec modele_selection.joblib présent):
+    python benchmarks/bench_intervalles.py [repetitions]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["API_CACHE_TAILLE"] = "0"
+os.environ["API_TABLE"] = "0"
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+
+import api  # noqa: E402
+from donnees import generer_lignes  # noqa: E402
+
+TAILLES = [1, 100, 1000]
+NIVEAU = 0.9
+
+
+def latence_mediane(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return float(np.median(durees)) * 1000
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    api.charger_modele()
+    version = api.registre.obtenir()
+    arbres = joblib.load(version.chemin).named_steps['regressor'].estimators_
+    quantiles = ((1 - NIVEAU) / 2, (1 + NIVEAU) / 2)
+
+    def naif(entrees):
+        X = version.encodeur.encoder_lot(entrees)
+        par_arbre = np.column_stack([arbre.predict(X) for arbre in arbres])
+        return par_arbre.mean(axis=1), par_arbre.std(axis=1), np.quantile(par_arbre, quantiles, axis=1)
+
+    debut = time.perf_counter()
+    version.foret_dispersion()
+    print(f"moteur {api.MOTEUR}, {len(arbres)} arbres; forêt des intervalles compilée en "
+          f"{time.perf_counter() - debut:.2f} s")
+    chemins = [
+        ("prédiction seule", lambda entrees: api.predire_entrees(entrees, version)),
+        ("intervalles", lambda entrees: api.predire_intervalles(entrees, version, NIVEAU)),
+        ("naïf (arbre par arbre)", naif),
+    ]
+    print(f"\n{'lignes':>7} " + "".join(f"{nom:>24}" for nom, _ in chemins) + f"{'surcoût':>10}")
+    for n in TAILLES:
+        entrees = [api.PredictionInput(**ligne) for ligne in generer_lignes(n, seed=n)]
+        latences = []
+        for _, fonction in chemins:
+            fonction(entrees)
+            latences.append(latence_mediane(lambda: fonction(entrees), max(3, repetitions // max(1, n // 100))))
+        print(f"{n:>7} " + "".join(f"{latence:>21.2f} ms" for latence in latences)
+              + f"{latences[1] / latences[0]:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Mesure le débit et la latence (p50/p99) de /predict sous charge concurrente,
+sans micro-batching puis avec plusieurs réglages (taille max, attente max).
+
+Usage (depuis la racine du projet, avec modele_selection.joblib présent):
+    python benchmarks/bench_micro_batch.py [n_clients] [n_requetes]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+
+import api
+from batching import MicroBatcher
+from donnees import generer_lignes
+
+REGLAGES = [None, (16, 1.0), (64, 2.0), (256, 5.0)]
+
+
+async def charger(client, lignes, n_clients):
+    latences = []
+    file = asyncio.Queue()
+    for ligne in lignes:
+        file.put_nowait(ligne)
+
+    async def appelant():
+        while not file.empty():
+            ligne = file.get_nowait()
+            debut = time.perf_counter()
+            reponse = await client.post("/predict", json=ligne)
+            reponse.raise_for_status()
+            latences.append(time.perf_counter() - debut)
+
+    debut = time.perf_counter()
+    await asyncio.gather(*(appelant() for _ in range(n_clients)))
+    return len(lignes) / (time.perf_counter() - debut), np.array(latences) * 1000
+
+
+async def main(n_clients, n_requetes):
+    if not api.charger_modele():
+        sys.exit("modele_selection.joblib introuvable: entraîner le modèle avant le benchmark.")
+    lignes = generer_lignes(n_requetes)
+    transport = httpx.ASGITransport(app=api.app)
+    limites = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limites) as client:
+        print(f"{n_clients} clients concurrents, {n_requetes} requêtes")
+        print(f"{'réglage':>18} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'taille moy.':>12}")
+        for reglage in REGLAGES:
+            if reglage is None:
+                api.micro_batcher = None
+                nom = "sans batching"
+            else:
+                api.micro_batcher = MicroBatcher(api.predire_lot_versions, *reglage)
+                await api.micro_batcher.demarrer()
+                nom = f"{reglage[0]} / {reglage[1]} ms"
+            debit, latences = await charger(client, lignes, n_clients)
+            taille = api.micro_batcher.statistiques()["taille_moyenne"] if api.micro_batcher else 1.0
+            print(f"{nom:>18} {debit:>8.0f} {np.percentile(latences, 50):>8.1f} "
+                  f"{np.percentile(latences, 99):>8.1f} {taille:>12.1f}")
+            if api.micro_batcher is not None:
+                await api.micro_batcher.arreter()
+        api.micro_batcher = None
+
+
+if __name__ == "__main__":
+    n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_requetes = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    asyncio.run(main(n_clients, n_requetes))
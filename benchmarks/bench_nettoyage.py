@@ -0,0 +1,101 @@
+"""
+Durée et pic de mémoire du nettoyage: en mémoire (lecture complète puis
+nettoyer() de train.py, comme le notebook) et par chunks (cleaning.py), pour
+chaque fichier donné. Les deux sorties sont comparées quand elles tiennent en
+mémoire: identiques, ou part des lignes qui diffèrent par colonne.
+
+Chaque mesure est faite dans un processus séparé. Un fichier de 10 millions de
+lignes se génère avec:
+    python generate_dataset.py --n-samples 10000000 --taille-chunk 500000 --format csv --sortie d10m.csv.gz
+
+Usage (depuis la racine du projet):
+    python benchmarks/bench_nettoyage.py [fichier ...] [--sans-memoire]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIGNES_MAX_COMPARAISON = 1000000
+
+ENFANT = """
+import json, resource, sys, time, warnings
+sys.path.insert(0, {racine!r})
+warnings.filterwarnings('ignore')
+debut = time.perf_counter()
+if {mode!r} == 'memoire':
+    import pandas as pd
+    import train
+    df = train.nettoyer(pd.read_csv({entree!r}))
+    df.to_parquet({sortie!r}, index=False)
+    lignes = len(df)
+else:
+    import cleaning
+    lignes = cleaning.nettoyer_fichier({entree!r}, {sortie!r})['lignes_ecrites']
+duree = time.perf_counter() - debut
+print(json.dumps({{"duree": duree, "rss_mo": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "lignes": lignes}}))
+"""
+
+
+def mesurer(mode, entree, sortie):
+    code = ENFANT.format(racine=RACINE, mode=mode, entree=entree, sortie=sortie)
+    processus = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if processus.returncode:
+        return None, processus.returncode
+    return json.loads(processus.stdout.splitlines()[-1]), 0
+
+
+def comparer(sortie_memoire, sortie_chunks):
+    import pandas as pd
+
+    sys.path.insert(0, RACINE)
+    from cleaning import lire_nettoye
+
+    reference = pd.read_parquet(sortie_memoire)
+    nettoye = lire_nettoye(sortie_chunks)
+    if reference.shape != nettoye.shape or list(reference.columns) != list(nettoye.columns):
+        return "différente"
+    # Au-delà de l'échantillon, seul le seuil de l'Isolation Forest (donc `weight`) peut différer
+    ecarts = {col: (reference[col] != nettoye[col]).mean() for col in reference.columns}
+    ecarts = {col: ecart for col, ecart in ecarts.items() if ecart}
+    if not ecarts:
+        return "identique"
+    return ", ".join(f"{col} {ecart:.1%}" for col, ecart in ecarts.items())
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+    modes = ['chunks'] if '--sans-memoire' in sys.argv else ['memoire', 'chunks']
+    fichiers = arguments or [os.path.join(RACINE, 'dataset_revenu_marocains.csv')]
+    dossier = tempfile.mkdtemp()
+    try:
+        print(f"{'fichier':<32} {'mode':>8} {'lignes':>10} {'durée (s)':>10} {'lignes/s':>10} "
+              f"{'pic RSS (Mo)':>13}  {'sortie'}")
+        for entree in fichiers:
+            sorties = {mode: os.path.join(dossier, f"{mode}.parquet") for mode in modes}
+            resultats = {}
+            for mode in modes:
+                resultat, code = mesurer(mode, entree, sorties[mode])
+                if resultat is None:
+                    print(f"{os.path.basename(entree):<32} {mode:>8} {'échec (code ' + str(code) + ')':>36}")
+                    continue
+                resultats[mode] = resultat
+                verification = ''
+                if mode == 'chunks' and 'memoire' in resultats and resultat['lignes'] <= LIGNES_MAX_COMPARAISON:
+                    verification = comparer(sorties['memoire'], sorties['chunks'])
+                print(f"{os.path.basename(entree):<32} {mode:>8} {resultat['lignes']:>10} "
+                      f"{resultat['duree']:>10.1f} {resultat['lignes'] / resultat['duree']:>10.0f} "
+                      f"{resultat['rss_mo']:>13.0f}  {verification}")
+            for sortie in sorties.values():
+                if os.path.exists(sortie):
+                    os.remove(sortie)
+    finally:
+        shutil.rmtree(dossier)
+
+
+if __name__ == "__main__":
+    main()
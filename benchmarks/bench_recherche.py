@@ -0,0 +1,68 @@
+"""
+Compare la recherche exhaustive des grilles du notebook aux divisions
+successives (train.py, recherche 'halving'): durée de la recherche de chaque
+modèle et métriques MAE/RMSE/R² en validation croisée et sur l'ensemble de test.
+
+Usage (depuis la racine du projet, avec le dataset généré):
+    python benchmarks/bench_recherche.py [dataset.csv] [cpus]
+"""
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from sklearn.model_selection import KFold, train_test_split  # noqa: E402
+
+import train  # noqa: E402
+
+MODES = ['grille', 'halving']
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    configuration = train.charger_configuration()
+    chemin = sys.argv[1] if len(sys.argv) > 1 else configuration['dataset']
+    n_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    random_state = configuration['random_state']
+
+    df = train.nettoyer(pd.read_csv(chemin), random_state)
+    X = df.drop(columns=[train.cible])
+    y = df[train.cible]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=configuration['test_size'], random_state=random_state
+    )
+    pretraitement = train.construire_pretraitement(X_train, configuration['k_caracteristiques'])
+    plis = train.pretraiter_plis(pretraitement, X_train, y_train,
+                                 KFold(n_splits=configuration['n_plis'], shuffle=True, random_state=random_state))
+    X_train_pretraite = pretraitement.fit_transform(X_train, y_train)
+    X_test_pretraite = pretraitement.transform(X_test)
+
+    lignes = []
+    for nom, modele in configuration['modeles'].items():
+        for mode in MODES:
+            debut = time.perf_counter()
+            resultat, regresseur = train.rechercher(nom, dict(modele, recherche=mode), plis,
+                                                    y_train.to_numpy(), random_state, n_jobs)
+            duree = time.perf_counter() - debut
+            regresseur.fit(X_train_pretraite, y_train.to_numpy())
+            test = train.metriques(y_test, regresseur.predict(X_test_pretraite))
+            lignes.append((nom, mode, resultat['n_candidats'], duree, resultat, test))
+
+    print(f"\n{'modèle':<20} {'mode':>8} {'cand.':>6} {'durée (s)':>10} {'gain':>6} "
+          f"{'MAE cv':>9} {'RMSE cv':>9} {'R² cv':>7} {'MAE test':>9} {'RMSE test':>10} {'R² test':>8}")
+    durees = {}
+    for nom, mode, n_candidats, duree, cv, test in lignes:
+        durees.setdefault(nom, duree)
+        print(f"{nom:<20} {mode:>8} {n_candidats:>6} {duree:>10.1f} {durees[nom] / duree:>5.1f}x "
+              f"{cv['MAE']:>9.0f} {cv['RMSE']:>9.0f} {cv['R²']:>7.4f} "
+              f"{test['MAE']:>9.0f} {test['RMSE']:>10.0f} {test['R²']:>8.4f}")
+    totaux = {mode: sum(ligne[3] for ligne in lignes if ligne[1] == mode) for mode in MODES}
+    print(f"\nDurée totale: grille {totaux['grille']:.1f} s, halving {totaux['halving']:.1f} s "
+          f"({totaux['grille'] / totaux['halving']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Génération de requêtes synthétiques valides pour les benchmarks de l'API.
+"""
+import numpy as np
+
+REGIONS = [
+    "Tanger-Tétouan-Al Hoceïma", "L'Oriental", "Fès-Meknès", "Rabat-Salé-Kénitra",
+    "Béni Mellal-Khénifra", "Casablanca-Settat", "Marrakech-Safi", "Drâa-Tafilalet",
+    "Souss-Massa", "Guelmim-Oued Noun", "Laâyoune-Sakia El Hamra", "Dakhla-Oued Ed-Dahab"
+]
+NIVEAUX_EDUCATION = ['Sans niveau', 'Fondamental', 'Secondaire', 'Supérieur']
+GROUPES_SOCIO = ['Groupe 1', 'Groupe 2', 'Groupe 3', 'Groupe 4', 'Groupe 5', 'Groupe 6']
+ETATS_MATRIMONIAUX = ['Célibataire', 'Marié', 'Divorcé', 'Veuf']
+
+
+def generer_lignes(n, seed=0):
+    """Retourne n dictionnaires au format PredictionInput."""
+    rng = np.random.default_rng(seed)
+    age = rng.integers(18, 80, n)
+    milieu = rng.choice(['Urbain', 'Rural'], n, p=[0.63, 0.37])
+    etat = rng.choice(ETATS_MATRIMONIAUX, n, p=[0.35, 0.55, 0.07, 0.03])
+    voiture = rng.integers(0, 2, n)
+    logement = rng.integers(0, 2, n)
+    terrain = rng.integers(0, 2, n)
+    lignes = []
+    for i in range(n):
+        lignes.append({
+            "age": int(age[i]),
+            "sexe": str(rng.choice(['Homme', 'Femme'])),
+            "milieu": str(milieu[i]),
+            "etat_matrimonial": str(etat[i]),
+            "region": str(rng.choice(REGIONS)),
+            "niveau_education": str(rng.choice(NIVEAUX_EDUCATION)),
+            "categorie_socioprofessionnelle": str(rng.choice(GROUPES_SOCIO)),
+            "taille_foyer": float(rng.integers(1, 10)),
+            "aide_sociale": int(rng.integers(0, 2)),
+            "a_acces_credit": int(rng.integers(0, 2)),
+            "a_retraite": int(age[i] >= 60),
+            "possede_voiture": float(voiture[i]),
+            "possede_logement": float(logement[i]),
+            "possede_terrain": int(terrain[i]),
+            "annees_experience": float(max(0, age[i] - 20 - rng.integers(0, 5))),
+            "est_urbain": int(milieu[i] == 'Urbain'),
+            "est_marie": int(etat[i] == 'Marié'),
+            "weight": 1.0,
+            "niveau_socioeco": float(voiture[i] + logement[i] + terrain[i]),
+        })
+    return lignes
+
+
+def en_colonnes(lignes):
+    """Convertit une liste de lignes au format colonnaire de /predict/batch."""
+    return {cle: [ligne[cle] for ligne in lignes] for cle in lignes[0]}
+
+
+def charger_entrees_dataset(chemin="dataset_revenu_marocains.csv", n=None):
+    """
+    Charge le dataset généré et le met au format d'entrée du modèle
+    (valeurs manquantes conservées pour exercer les imputations).
+    """
+    import pandas as pd
+
+    df = pd.read_csv(chemin, nrows=n)
+    df = df.drop(columns=['id_utilisateur', 'date_enregistrement', 'code_postal', 'age_en_mois',
+                          'categorie_age', 'revenu_annuel'], errors='ignore')
+    df['weight'] = 1.0
+    df['niveau_socioeco'] = df[['possede_voiture', 'possede_logement', 'possede_terrain']].sum(axis=1)
+    return df
+
+
+def requetes_dataset(chemin="dataset_revenu_marocains.csv", n=10000, seed=0):
+    """
+    Retourne n requêtes /predict tirées (avec remise) des lignes complètes du
+    dataset généré: PredictionInput n'accepte pas de valeurs manquantes.
+    Sans dataset, les requêtes sont synthétiques (generer_lignes).
+    """
+    import os
+
+    if not os.path.exists(chemin):
+        return generer_lignes(n, seed)
+    df = charger_entrees_dataset(chemin).dropna()
+    df = df.sample(n=n, replace=len(df) < n, random_state=seed)
+    return df.to_dict("records")
@@ -0,0 +1,79 @@
+"""
+Vérifie que le moteur compilé (compiled_model.py) et l'encodeur direct des
+requêtes (feature_encoder.py) reproduisent les prédictions de
+modele_selection.joblib sur le dataset généré, puis compare les latences.
+
+Usage (depuis la racine du projet):
+    python benchmarks/parite_moteur_compile.py [dataset.csv]
+
+Le script se termine avec un code non nul si un écart dépasse la tolérance.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+import numpy as np
+
+import api
+from compiled_model import compiler_pipeline
+from donnees import charger_entrees_dataset, generer_lignes
+from feature_encoder import EncodeurRequetes
+
+RTOL = 1e-9
+ATOL = 1e-6
+
+
+def chronometrer(fonction, X, repetitions):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        fonction(X)
+    return (time.perf_counter() - debut) / repetitions
+
+
+def main():
+    chemin = sys.argv[1] if len(sys.argv) > 1 else "dataset_revenu_marocains.csv"
+    pipeline = joblib.load("modele_selection.joblib")
+
+    debut = time.perf_counter()
+    moteur = compiler_pipeline(pipeline)
+    print(f"Compilation: {time.perf_counter() - debut:.2f} s "
+          f"({moteur.foret.n_arbres} arbres, {moteur.foret.n_noeuds} noeuds, "
+          f"profondeur max {moteur.foret.profondeur_max})")
+
+    X = charger_entrees_dataset(chemin)
+    attendu = pipeline.predict(X)
+    # Les petits lots passent par le parcours vectorisé, les grands par le parcours natif
+    limite = min(len(X), 20 * 256)
+    petits = [moteur.predict(X.iloc[debut:debut + 256]) for debut in range(0, limite, 256)]
+    obtenu = np.concatenate(petits + [moteur.predict(X.iloc[limite:])])
+    ecart = np.abs(attendu - obtenu)
+    print(f"Parité sur {len(X)} lignes: écart max {ecart.max():.3e}, "
+          f"écart relatif max {(ecart / np.maximum(np.abs(attendu), 1e-12)).max():.3e}")
+    if not np.allclose(obtenu, attendu, rtol=RTOL, atol=ATOL):
+        sys.exit(f"ÉCHEC: {(~np.isclose(obtenu, attendu, rtol=RTOL, atol=ATOL)).sum()} prédictions divergent")
+
+    # L'encodeur direct des requêtes doit produire les mêmes prédictions que le DataFrame
+    entrees = [api.PredictionInput(**ligne) for ligne in generer_lignes(2000)]
+    encodeur = EncodeurRequetes(pipeline)
+    attendu = pipeline.predict(api.construire_dataframe(entrees))
+    regresseur = pipeline.named_steps['regressor']
+    for nom, obtenu in [("encodeur + régresseur", regresseur.predict(encodeur.encoder_lot(entrees))),
+                        ("encodeur + forêt compilée", moteur.foret.predict(encodeur.encoder_lot(entrees)))]:
+        if not np.allclose(obtenu, attendu, rtol=RTOL, atol=ATOL):
+            sys.exit(f"ÉCHEC {nom}: {(~np.isclose(obtenu, attendu, rtol=RTOL, atol=ATOL)).sum()} prédictions divergent")
+    print(f"Parité de l'encodeur direct sur {len(entrees)} requêtes")
+
+    print(f"{'lignes':>8} {'sklearn (ms)':>14} {'compilé (ms)':>14} {'gain':>8}")
+    for n, repetitions in [(1, 200), (100, 20), (10000, 2)]:
+        echantillon = X.iloc[:n]
+        t_sklearn = chronometrer(pipeline.predict, echantillon, repetitions)
+        t_moteur = chronometrer(moteur.predict, echantillon, repetitions)
+        print(f"{n:>8} {t_sklearn * 1000:>14.2f} {t_moteur * 1000:>14.2f} {t_sklearn / t_moteur:>7.1f}x")
+    print("Parité OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Suite de benchmarks du modèle et de l'API, avec comparaison de deux exécutions.
+
+Trois sections, toutes locales (aucun accès réseau):
+  - modele:  predict du pipeline scikit-learn et du moteur compilé sur des lots
+             de 1 à 100 000 lignes du dataset (latence par appel, lignes/s);
+  - asgi:    l'application FastAPI dans le processus (httpx.ASGITransport);
+  - uvicorn: l'API servie par uvicorn sur un port local (--workers N).
+Pour les deux dernières, un générateur de charge en boucle fermée envoie des
+requêtes tirées du dataset généré depuis N clients concurrents et mesure le
+débit et les latences p50/p95/p99. Le cache des prédictions est désactivé
+(sauf --cache) pour que chaque requête parcoure le modèle.
+
+Chaque cas est répété (--repetitions) et les résultats retiennent la médiane
+des répétitions et leur dispersion relative ((max - min) / médiane).
+
+Les résultats sont écrits en JSON; `comparer` signale les mesures d'une
+exécution dégradées de plus d'un seuil par rapport à une référence (débit plus
+bas ou latence plus haute) et se termine avec le code 1 s'il y en a. Pour un
+cas dont les répétitions varient plus que le seuil, la tolérance est élargie
+à cette dispersion: un écart dans le bruit de la machine n'est pas signalé.
+
+Usage (depuis le dossier qui contient modele_selection.joblib et le dataset):
+    python benchmarks/suite.py executer --sortie reference.json
+    python benchmarks/suite.py executer --sections asgi,uvicorn --clients 1,32 --sortie courant.json
+    python benchmarks/suite.py comparer reference.json courant.json --seuil 0.10
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+import httpx  # noqa: E402
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from donnees import charger_entrees_dataset, requetes_dataset  # noqa: E402
+
+SECTIONS = ["modele", "asgi", "uvicorn"]
+TAILLES = [1, 10, 100, 1000, 10000, 100000]
+CLIENTS = [1, 16, 64]
+TAILLE_LOT = 100
+# Durée visée des mesures du modèle pour chaque taille de lot (s)
+BUDGET_MODELE = 1.0
+DELAI_DEMARRAGE = 180.0
+
+# Sens de chaque mesure comparée: +1 plus haut est meilleur, -1 plus bas est meilleur
+SENS = {"debit": 1, "p50_ms": -1, "p95_ms": -1, "p99_ms": -1}
+
+
+def agreger(mesures):
+    """Médiane et dispersion relative de chaque mesure comparée sur plusieurs répétitions."""
+    resultat = dict(mesures[0])
+    resultat["dispersion"] = {}
+    for mesure in SENS:
+        valeurs = [m[mesure] for m in mesures]
+        mediane = float(np.median(valeurs))
+        resultat[mesure] = mediane
+        resultat["dispersion"][mesure] = (max(valeurs) - min(valeurs)) / mediane if mediane else 0.0
+    if "erreurs" in resultat:
+        resultat["erreurs"] = sum(m["erreurs"] for m in mesures)
+    resultat["repetitions"] = len(mesures)
+    return resultat
+
+
+def centiles(latences):
+    latences = np.asarray(latences) * 1000
+    return {
+        "p50_ms": float(np.percentile(latences, 50)),
+        "p95_ms": float(np.percentile(latences, 95)),
+        "p99_ms": float(np.percentile(latences, 99)),
+    }
+
+
+# --- Section modele ---------------------------------------------------------
+
+def mesurer_predict(predict, X, taille):
+    """Appels répétés de predict sur un lot de `taille` lignes, pendant environ BUDGET_MODELE secondes."""
+    predict(X)   # préchauffage
+    debut = time.perf_counter()
+    predict(X)
+    estimation = time.perf_counter() - debut
+    n_appels = int(min(1000, max(3, BUDGET_MODELE / max(estimation, 1e-6))))
+    durees = []
+    for _ in range(n_appels):
+        debut = time.perf_counter()
+        predict(X)
+        durees.append(time.perf_counter() - debut)
+    return {"debit": taille / float(np.median(durees)), "n_appels": n_appels, **centiles(durees)}
+
+
+def section_modele(args):
+    from compiled_model import compiler_pipeline
+
+    pipeline = joblib.load(args.modele)
+    moteurs = {"sklearn": pipeline.predict}
+    try:
+        moteurs["compile"] = compiler_pipeline(pipeline).predict
+    except ValueError as e:
+        print(f"  moteur compilé indisponible: {e}")
+
+    # Lignes du dataset, valeurs manquantes comprises (imputations exercées)
+    donnees = charger_entrees_dataset(args.dataset, n=max(args.tailles)) if os.path.exists(args.dataset) \
+        else pd.DataFrame(requetes_dataset(args.dataset, max(args.tailles)))
+    resultats = []
+    for taille in args.tailles:
+        X = donnees.iloc[np.arange(taille) % len(donnees)].reset_index(drop=True)
+        for nom, predict in moteurs.items():
+            mesure = agreger([mesurer_predict(predict, X, taille) for _ in range(args.repetitions)])
+            resultats.append({"section": "modele", "cas": f"{nom}/{taille}", **mesure})
+            afficher(resultats[-1])
+    return resultats
+
+
+# --- Générateur de charge ---------------------------------------------------
+
+async def generer_charge(client, chemin, corps, n_clients, n_requetes):
+    """
+    Boucle fermée: n_clients envoient chacun une requête dès la réponse à la
+    précédente, jusqu'à n_requetes au total. Retourne débit, centiles et erreurs.
+    """
+    latences = []
+    erreurs = 0
+    suivante = 0
+
+    async def appelant():
+        nonlocal erreurs, suivante
+        while suivante < n_requetes:
+            i = suivante
+            suivante += 1
+            debut = time.perf_counter()
+            try:
+                reponse = await client.post(chemin, json=corps[i % len(corps)])
+                if reponse.status_code != 200:
+                    erreurs += 1
+            except httpx.HTTPError:
+                erreurs += 1
+            latences.append(time.perf_counter() - debut)
+
+    debut = time.perf_counter()
+    await asyncio.gather(*(appelant() for _ in range(n_clients)))
+    duree = time.perf_counter() - debut
+    return {"debit": n_requetes / duree, "n_requetes": n_requetes, "erreurs": erreurs, **centiles(latences)}
+
+
+def corps_requetes(args):
+    lignes = requetes_dataset(args.dataset, args.requetes)
+    lots = [{"lignes": lignes[i:i + TAILLE_LOT]} for i in range(0, len(lignes), TAILLE_LOT)]
+    return {"predict": ("/predict", lignes, args.requetes),
+            "batch": ("/predict/batch", lots, max(1, args.requetes // TAILLE_LOT))}
+
+
+async def charger_api(client, section, args):
+    resultats = []
+    for endpoint, (chemin, corps, n_requetes) in corps_requetes(args).items():
+        if endpoint not in args.endpoints:
+            continue
+        await generer_charge(client, chemin, corps, 1, min(20, n_requetes))   # préchauffage
+        for n_clients in args.clients:
+            mesure = agreger([await generer_charge(client, chemin, corps, n_clients, n_requetes)
+                              for _ in range(args.repetitions)])
+            resultats.append({"section": section, "cas": f"{endpoint}/{n_clients}", **mesure})
+            afficher(resultats[-1])
+    return resultats
+
+
+# --- Section asgi -------------------------------------------------------------
+
+async def section_asgi(args):
+    import api
+
+    if not api.charger_modele():
+        sys.exit(f"{api.CHEMIN_MODELE} introuvable: entraîner le modèle avant le benchmark.")
+    if not args.cache:
+        api.registre.active.cache = None
+    transport = httpx.ASGITransport(app=api.app)
+    limites = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limites,
+                                 timeout=60.0) as client:
+        return await charger_api(client, "asgi", args)
+
+
+# --- Section uvicorn ----------------------------------------------------------
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def attendre_pret(client, processus, n_workers):
+    """Interroge /ready (plusieurs connexions simultanées) jusqu'à ce que n_workers distincts soient prêts."""
+    async def interroger():
+        try:
+            reponse = await client.get("/ready")
+        except httpx.HTTPError:
+            return None
+        return reponse.json()["pid"] if reponse.status_code == 200 else None
+
+    prets = set()
+    debut = time.perf_counter()
+    while len(prets) < n_workers:
+        if processus.poll() is not None:
+            raise RuntimeError(f"uvicorn s'est arrêté (code {processus.returncode})")
+        if time.perf_counter() - debut > DELAI_DEMARRAGE:
+            raise TimeoutError(f"{len(prets)}/{n_workers} workers prêts après {DELAI_DEMARRAGE:.0f} s")
+        prets.update(await asyncio.gather(*(interroger() for _ in range(4 * n_workers))))
+        prets.discard(None)
+        await asyncio.sleep(0.1)
+
+
+async def section_uvicorn(args):
+    port = port_libre()
+    env = dict(os.environ, PYTHONPATH=RACINE, API_LOG_NIVEAU="WARNING")
+    if not args.cache:
+        env["API_CACHE_TAILLE"] = "0"
+    processus = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    n_connexions = max(args.clients + [4 * args.workers])
+    limites = httpx.Limits(max_connections=n_connexions, max_keepalive_connections=n_connexions)
+    # Sans TCP_NODELAY, l'en-tête et le corps envoyés séparément attendent l'ACK retardé (~40 ms)
+    transport = httpx.AsyncHTTPTransport(limits=limites,
+                                         socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)])
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", transport=transport,
+                                     timeout=60.0) as client:
+            await attendre_pret(client, processus, args.workers)
+            return await charger_api(client, "uvicorn", args)
+    finally:
+        processus.terminate()
+        processus.wait()
+
+
+# --- Exécution et comparaison -------------------------------------------------
+
+def afficher(resultat):
+    print(f"  {resultat['section']:<8} {resultat['cas']:<16} {resultat['debit']:>12.1f}/s "
+          f"p50 {resultat['p50_ms']:>9.3f} ms  p95 {resultat['p95_ms']:>9.3f} ms  "
+          f"p99 {resultat['p99_ms']:>9.3f} ms" + (f"  erreurs {resultat['erreurs']}" if resultat.get("erreurs") else ""))
+
+
+def contexte(args):
+    try:
+        commit = subprocess.run(["git", "-C", RACINE, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "moteur_api": os.environ.get("API_MOTEUR", "sklearn"),
+        "parametres": {
+            "sections": args.sections, "tailles": args.tailles, "clients": args.clients,
+            "requetes": args.requetes, "endpoints": args.endpoints, "workers": args.workers,
+            "cache": args.cache, "repetitions": args.repetitions,
+        },
+    }
+
+
+def executer(args):
+    resultats = []
+    if "modele" in args.sections:
+        print("modele: predict par taille de lot (débit en lignes/s)")
+        resultats += section_modele(args)
+    if "asgi" in args.sections:
+        print("asgi: API dans le processus (débit en requêtes/s)")
+        resultats += asyncio.run(section_asgi(args))
+    if "uvicorn" in args.sections:
+        print(f"uvicorn: API sur un port local, {args.workers} worker(s) (débit en requêtes/s)")
+        resultats += asyncio.run(section_uvicorn(args))
+
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump({"contexte": contexte(args), "resultats": resultats}, f, indent=2, ensure_ascii=False)
+    print(f"Résultats écrits dans {args.sortie}")
+
+
+def comparer(args):
+    """Affiche l'écart relatif de chaque mesure; retourne le nombre de régressions."""
+    with open(args.reference, encoding="utf-8") as f:
+        reference = json.load(f)
+    with open(args.courant, encoding="utf-8") as f:
+        courant = json.load(f)
+    avant = {(r["section"], r["cas"]): r for r in reference["resultats"]}
+    apres = {(r["section"], r["cas"]): r for r in courant["resultats"]}
+
+    print(f"référence: {reference['contexte'].get('commit')} ({reference['contexte']['date']}), "
+          f"courant: {courant['contexte'].get('commit')} ({courant['contexte']['date']}), "
+          f"seuil {args.seuil:.0%}")
+    print(f"{'section':<8} {'cas':<16} {'mesure':<7} {'référence':>12} {'courant':>12} {'écart':>8} "
+          f"{'tolérance':>10}")
+    regressions = []
+    for cle in sorted(avant.keys() & apres.keys()):
+        for mesure, sens in SENS.items():
+            a, b = avant[cle][mesure], apres[cle][mesure]
+            ecart = (b - a) / a if a else 0.0
+            tolerance = max(args.seuil, avant[cle].get("dispersion", {}).get(mesure, 0.0),
+                            apres[cle].get("dispersion", {}).get(mesure, 0.0))
+            regression = sens * ecart < -tolerance
+            if regression:
+                regressions.append((cle, mesure))
+            print(f"{cle[0]:<8} {cle[1]:<16} {mesure:<7} {a:>12.3f} {b:>12.3f} {ecart:>+7.1%} "
+                  f"{tolerance:>10.0%}" + ("  RÉGRESSION" if regression else ""))
+        if apres[cle].get("erreurs", 0) > avant[cle].get("erreurs", 0):
+            regressions.append((cle, "erreurs"))
+            print(f"{cle[0]:<8} {cle[1]:<16} erreurs {avant[cle].get('erreurs', 0):>12} "
+                  f"{apres[cle]['erreurs']:>12}  RÉGRESSION")
+    for cle in sorted(avant.keys() - apres.keys()):
+        print(f"{cle[0]:<8} {cle[1]:<16} absent de l'exécution courante")
+
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) au-delà de {args.seuil:.0%}")
+    else:
+        print(f"\nAucune régression au-delà de {args.seuil:.0%}")
+    return len(regressions)
+
+
+def liste_entiers(texte):
+    return [int(valeur) for valeur in texte.split(",")]
+
+
+def liste_noms(choix):
+    def analyser(texte):
+        noms = texte.split(",")
+        inconnus = set(noms) - set(choix)
+        if inconnus:
+            raise argparse.ArgumentTypeError(f"valeurs inconnues {sorted(inconnus)} (choix: {','.join(choix)})")
+        return noms
+    return analyser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commandes = parser.add_subparsers(dest="commande", required=True)
+
+    run = commandes.add_parser("executer", help="Exécute les benchmarks et écrit les résultats en JSON")
+    run.add_argument("--sortie", default="benchmark.json")
+    run.add_argument("--sections", type=liste_noms(SECTIONS), default=SECTIONS)
+    run.add_argument("--modele", default=os.environ.get("API_CHEMIN_MODELE", "modele_selection.joblib"))
+    run.add_argument("--dataset", default="dataset_revenu_marocains.csv")
+    run.add_argument("--tailles", type=liste_entiers, default=TAILLES, help="Tailles de lot de la section modele")
+    run.add_argument("--clients", type=liste_entiers, default=CLIENTS, help="Niveaux de concurrence")
+    run.add_argument("--requetes", type=int, default=2000, help="Requêtes /predict par niveau de concurrence")
+    run.add_argument("--endpoints", type=liste_noms(["predict", "batch"]), default=["predict", "batch"],
+                     help=f"predict (une ligne par requête) et/ou batch ({TAILLE_LOT} lignes par requête)")
+    run.add_argument("--workers", type=int, default=1, help="Workers uvicorn")
+    run.add_argument("--repetitions", type=int, default=3, help="Répétitions de chaque cas")
+    run.add_argument("--cache", action="store_true", help="Garder le cache des prédictions actif")
+
+    comparaison = commandes.add_parser("comparer", help="Compare deux fichiers de résultats")
+    comparaison.add_argument("reference")
+    comparaison.add_argument("courant")
+    comparaison.add_argument("--seuil", type=float, default=0.10,
+                             help="Dégradation relative tolérée (0.10 = 10%%)")
+
+    args = parser.parse_args()
+    if args.commande == "executer":
+        executer(args)
+    else:
+        sys.exit(1 if comparer(args) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Nettoyage du dataset par chunks, pour des fichiers qui ne tiennent pas en
+mémoire: mêmes étapes que nettoyer() de train.py (et que le notebook), avec une
+mémoire bornée par la taille des chunks.
+
+  1. Lecture de l'entrée (CSV, éventuellement compressé, ou Parquet, comme
+     score.py) en une seule passe: les doublons sont écartés d'après une
+     empreinte 64 bits de chaque ligne, les médianes (réservoir d'échantillons),
+     les modes (comptages) et un échantillon des colonnes de l'Isolation
+     Forest sont cumulés, et les lignes retenues sont écrites dans un Parquet
+     temporaire.
+  2. L'Isolation Forest est ajustée sur l'échantillon (au plus
+     `taille_echantillon` lignes, dont les valeurs manquantes sont remplacées
+     par les médianes).
+  3. Relecture du Parquet temporaire par chunks: imputation, `weight` (0.5 pour
+     les lignes jugées aberrantes, 1.0 sinon), suppression des extrêmes et des
+     colonnes inutiles, `niveau_socioeco`, puis écriture d'un unique fichier
+     Parquet typé (colonnes catégorielles en dtype `category`).
+
+Tant que le fichier compte moins de lignes que le réservoir et l'échantillon,
+le résultat est identique à celui de nettoyer(); au-delà, médianes et seuil de
+l'Isolation Forest sont estimés sur l'échantillon.
+
+Usage:
+    python cleaning.py dataset_revenu_marocains.csv dataset_nettoye.parquet
+    python train.py --nettoye dataset_nettoye.parquet
+"""
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from score import lire_chunks
+from train import cible, colonnes_aberrantes, colonnes_possessions, colonnes_supprimees
+
+TAILLE_CHUNK_DEFAUT = 200000
+TAILLE_RESERVOIR = 100000
+TAILLE_ECHANTILLON = 100000
+
+
+def normaliser(df):
+    """Colonnes numériques en float64: un entier et un flottant égaux ont la même empreinte."""
+    numeriques = df.select_dtypes(include='number').columns
+    return df.astype({col: 'float64' for col in numeriques})
+
+
+def empreintes_lignes(df):
+    return pd.util.hash_pandas_object(normaliser(df), index=False).to_numpy()
+
+
+class EnsembleEmpreintes:
+    """
+    Empreintes des lignes déjà vues, en tableaux triés de tailles
+    décroissantes: un nouveau tableau est fusionné avec le dernier tant qu'il
+    est au moins aussi grand, ce qui garde un nombre logarithmique de tableaux.
+    """
+
+    def __init__(self):
+        self.niveaux = []
+
+    def __len__(self):
+        return sum(len(niveau) for niveau in self.niveaux)
+
+    def contient(self, empreintes):
+        vues = np.zeros(len(empreintes), dtype=bool)
+        for niveau in self.niveaux:
+            positions = np.minimum(np.searchsorted(niveau, empreintes), len(niveau) - 1)
+            vues |= niveau[positions] == empreintes
+        return vues
+
+    def ajouter(self, empreintes):
+        niveau = np.unique(empreintes)
+        while self.niveaux and len(self.niveaux[-1]) <= len(niveau):
+            niveau = np.union1d(self.niveaux.pop(), niveau)
+        if len(niveau):
+            self.niveaux.append(niveau)
+
+    def filtrer(self, empreintes):
+        """Masque des lignes jamais vues (première occurrence dans le chunk), désormais mémorisées."""
+        nouvelles = ~pd.Series(empreintes).duplicated().to_numpy() & ~self.contient(empreintes)
+        self.ajouter(empreintes[nouvelles])
+        return nouvelles
+
+
+def echantillonner(reservoir, n_vus, valeurs, taille, rng):
+    """
+    Échantillonnage par réservoir (algorithme R) de taille `taille`, par lots:
+    remplissage, puis la i-ème valeur remplace une case au hasard avec
+    probabilité taille/i. Fonctionne ligne par ligne pour un tableau 2D.
+    """
+    place = max(0, min(taille - len(reservoir), len(valeurs)))
+    reservoir = np.concatenate([reservoir, valeurs[:place]])
+    reste = valeurs[place:]
+    if len(reste):
+        rangs = n_vus + place + np.arange(1, len(reste) + 1)
+        cases = (rng.random(len(reste)) * rangs).astype(np.int64)
+        gardees = cases < taille
+        reservoir[cases[gardees]] = reste[gardees]
+    return reservoir
+
+
+class StatistiquesCourantes:
+    """
+    Médianes et modes cumulés sur tous les chunks observés: un réservoir
+    d'échantillons uniforme de taille bornée par colonne numérique (médiane
+    exacte tant que la colonne compte moins de valeurs que le réservoir) et le
+    comptage des modalités des autres colonnes (mode exact).
+    """
+
+    def __init__(self, taille_reservoir=TAILLE_RESERVOIR, random_state=42):
+        self.taille_reservoir = taille_reservoir
+        self.rng = np.random.default_rng(random_state)
+        self.reservoirs = {}
+        self.n_vus = {}
+        self.comptes = {}
+
+    def observer(self, df):
+        for col in df.select_dtypes(include='number'):
+            valeurs = df[col].dropna().to_numpy(dtype=float)
+            self.reservoirs[col] = echantillonner(self.reservoirs.get(col, np.empty(0)), self.n_vus.get(col, 0),
+                                                  valeurs, self.taille_reservoir, self.rng)
+            self.n_vus[col] = self.n_vus.get(col, 0) + len(valeurs)
+        for col in df.select_dtypes(include='object'):
+            comptes = self.comptes.setdefault(col, {})
+            for modalite, n in df[col].value_counts().items():
+                comptes[modalite] = comptes.get(modalite, 0) + int(n)
+
+    def medianes(self):
+        return {col: float(np.median(r)) for col, r in self.reservoirs.items() if len(r)}
+
+    def modes(self):
+        # À égalité, la plus petite modalité, comme Series.mode()
+        modes = {}
+        for col, comptes in self.comptes.items():
+            if comptes:
+                maximum = max(comptes.values())
+                modes[col] = min(modalite for modalite, n in comptes.items() if n == maximum)
+        return modes
+
+    def valeurs(self):
+        return {**self.medianes(), **self.modes()}
+
+
+def _ecrire(ecrivain, df, chemin):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if ecrivain is None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        ecrivain = pq.ParquetWriter(chemin, table.schema)
+    else:
+        table = pa.Table.from_pandas(df, schema=ecrivain.schema, preserve_index=False)
+    ecrivain.write_table(table)
+    return ecrivain
+
+
+def nettoyer_fichier(entree, sortie, taille_chunk=TAILLE_CHUNK_DEFAUT, random_state=42,
+                     taille_reservoir=TAILLE_RESERVOIR, taille_echantillon=TAILLE_ECHANTILLON):
+    """
+    Nettoie `entree` chunk par chunk et écrit le Parquet typé `sortie`.
+    Retourne le rapport du nettoyage (lignes, durées par étape).
+    """
+    import pyarrow.parquet as pq
+
+    durees = {}
+    debut = time.perf_counter()
+    rng = np.random.default_rng(random_state)
+    statistiques = StatistiquesCourantes(taille_reservoir, random_state)
+    empreintes = EnsembleEmpreintes()
+    echantillon = np.empty((0, len(colonnes_aberrantes)))
+    flottantes = set()
+    n_lues = n_retenues = 0
+    temporaire = sortie + '.dedoublonne.tmp'
+    ecrivain = None
+    try:
+        for chunk in lire_chunks(entree, taille_chunk):
+            n_lues += len(chunk)
+            flottantes.update(chunk.select_dtypes(include='float').columns)
+            chunk = normaliser(chunk)
+            chunk = chunk[empreintes.filtrer(empreintes_lignes(chunk))]
+            statistiques.observer(chunk)
+            echantillon = echantillonner(echantillon, n_retenues, chunk[colonnes_aberrantes].to_numpy(),
+                                         taille_echantillon, rng)
+            n_retenues += len(chunk)
+            ecrivain = _ecrire(ecrivain, chunk, temporaire)
+        if ecrivain is not None:
+            ecrivain.close()
+        durees['lecture et dedoublonnage'] = time.perf_counter() - debut
+        if not n_retenues:
+            raise ValueError(f"Aucune ligne dans '{entree}'")
+
+        debut = time.perf_counter()
+        valeurs = statistiques.valeurs()
+        echantillon = pd.DataFrame(echantillon, columns=colonnes_aberrantes).fillna(valeurs)
+        iso_forest = IsolationForest(contamination=0.05, random_state=random_state).fit(echantillon)
+        durees['isolation forest'] = time.perf_counter() - debut
+
+        debut = time.perf_counter()
+        categories = {col: pd.CategoricalDtype(sorted(comptes)) for col, comptes in statistiques.comptes.items()}
+        n_ecrites = n_reduits = 0
+        ecrivain = None
+        for lot in pq.ParquetFile(temporaire).iter_batches(batch_size=taille_chunk):
+            df = lot.to_pandas().fillna(valeurs)
+            entieres = [col for col in df.select_dtypes(include='number') if col not in flottantes]
+            df = df.astype({col: 'int64' for col in entieres})
+
+            # Valeurs aberrantes: suppression des extrêmes, poids réduit pour les modérées
+            aberrant = iso_forest.predict(df[colonnes_aberrantes]) == -1
+            extremes = ((df['age'] > 100) | (df[cible] > 1000000)).to_numpy()
+            df = df[~extremes].copy()
+            df['weight'] = np.where(aberrant[~extremes], 0.5, 1.0)
+
+            df = df.drop(columns=colonnes_supprimees)
+            df['niveau_socioeco'] = df[colonnes_possessions].sum(axis=1)
+            df = df.astype({col: dtype for col, dtype in categories.items() if col in df.columns})
+            n_ecrites += len(df)
+            n_reduits += int((df['weight'] < 1).sum())
+            ecrivain = _ecrire(ecrivain, df, sortie + '.tmp')
+        ecrivain.close()
+        os.replace(sortie + '.tmp', sortie)
+        durees['imputation et ecriture'] = time.perf_counter() - debut
+    finally:
+        for chemin in (temporaire, sortie + '.tmp'):
+            if os.path.exists(chemin):
+                os.remove(chemin)
+
+    return {
+        'lignes_lues': n_lues,
+        'doublons': n_lues - n_retenues,
+        'lignes_ecrites': n_ecrites,
+        'extremes': n_retenues - n_ecrites,
+        'poids_reduits': n_reduits,
+        'echantillon_isolation_forest': len(echantillon),
+        'durees': durees,
+    }
+
+
+def lire_nettoye(chemin):
+    """Dataset nettoyé, catégories rendues en chaînes (types attendus par le prétraitement de train.py)."""
+    df = pd.read_parquet(chemin)
+    return df.astype({col: object for col in df.select_dtypes(include='category')})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nettoie le dataset par chunks et écrit un Parquet typé")
+    parser.add_argument("entree", help="Fichier CSV (éventuellement compressé) ou Parquet (fichier ou dossier)")
+    parser.add_argument("sortie", help="Fichier Parquet nettoyé")
+    parser.add_argument("--taille-chunk", type=int, default=TAILLE_CHUNK_DEFAUT, help="Lignes par chunk")
+    parser.add_argument("--echantillon", type=int, default=TAILLE_ECHANTILLON,
+                        help="Lignes au plus pour ajuster l'Isolation Forest")
+    parser.add_argument("--random-state", type=int, default=42)
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    rapport = nettoyer_fichier(args.entree, args.sortie, args.taille_chunk, args.random_state,
+                               taille_echantillon=args.echantillon)
+    duree = time.perf_counter() - debut
+    print(f"{rapport['lignes_lues']} lignes lues, {rapport['doublons']} doublons, "
+          f"{rapport['extremes']} extrêmes supprimés, {rapport['poids_reduits']} à poids réduit")
+    for etape, duree_etape in rapport['durees'].items():
+        print(f"  {etape:<28} {duree_etape:>8.2f} s")
+    print(f"{rapport['lignes_ecrites']} lignes écrites dans '{args.sortie}' en {duree:.1f} s "
+          f"({rapport['lignes_lues'] / duree:.0f} lignes/s)")
+    print(f"Pic de mémoire: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} Mo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Moteur d'inférence compilé pour le pipeline sauvegardé (modele_selection.joblib).
+
+Le pipeline scikit-learn (ColumnTransformer -> SelectKBest -> forêt) est
+"compilé" une seule fois en une représentation à plat:
+  - seules les colonnes qui alimentent les 15 caractéristiques sélectionnées
+    sont lues;
+  - les imputations, les constantes du StandardScaler et les tables
+    catégorie -> code sont précalculées;
+  - les noeuds de tous les arbres sont regroupés dans des tableaux NumPy
+    contigus, parcourus de façon vectorisée pour tous les arbres à la fois.
+
+Usage:
+    moteur = compiler_pipeline(joblib.load("modele_selection.joblib"))
+    moteur.predict(df)  # mêmes prédictions que pipeline.predict(df)
+
+Le moteur peut aussi être exporté (exporter_moteur) dans un fichier dont les
+tableaux NumPy sont chargés en mémoire partagée (mmap) par charger_moteur:
+les workers uvicorn d'une même machine partagent alors les noeuds des arbres
+via le cache de pages du système au lieu d'en garder chacun une copie.
+
+    python compiled_model.py modele_selection.joblib modele_selection.moteur.joblib
+"""
+import sys
+
+import joblib
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+# Nombre de lignes traitées à la fois pour borner la mémoire du parcours
+TAILLE_BLOC = 4096
+# Nombre de niveaux parcourus entre deux retraits des parcours terminés
+INTERVALLE_COMPACTAGE = 2
+# Au-delà de ce nombre de lignes, le parcours natif arbre par arbre de
+# scikit-learn (code compilé) devient plus rapide que le parcours vectorisé
+SEUIL_PARCOURS_NATIF = 512
+
+
+def est_manquant(valeur):
+    return valeur is None or (isinstance(valeur, float) and valeur != valeur)
+
+
+def _decrire_sorties(preprocessor):
+    """
+    Décrit chaque caractéristique produite par le ColumnTransformer, dans l'ordre.
+    Chaque description est un tuple:
+      ('num', colonne, valeur_imputation, moyenne, echelle)
+      ('ord', colonne, valeur_imputation, table_codes, code_inconnu)
+      ('onehot', colonne, valeur_imputation, categorie)
+    """
+    sorties = []
+    for nom, transformer, colonnes in preprocessor.transformers_:
+        if nom == 'remainder':
+            if transformer != 'drop':
+                raise ValueError("Le moteur compilé ne gère que remainder='drop'")
+            continue
+        if transformer == 'drop':
+            continue
+        etapes = [etape for _, etape in transformer.steps] if hasattr(transformer, 'steps') else [transformer]
+
+        imputations = [None] * len(colonnes)
+        moyennes = np.zeros(len(colonnes))
+        echelles = np.ones(len(colonnes))
+        encodeur = None
+        for etape in etapes:
+            if isinstance(etape, SimpleImputer):
+                imputations = list(etape.statistics_)
+            elif isinstance(etape, StandardScaler):
+                if etape.mean_ is not None:
+                    moyennes = etape.mean_
+                if etape.scale_ is not None:
+                    echelles = etape.scale_
+            elif isinstance(etape, (OrdinalEncoder, OneHotEncoder)):
+                encodeur = etape
+            else:
+                raise ValueError(f"Étape non supportée par le moteur compilé: {type(etape).__name__}")
+
+        for i, colonne in enumerate(colonnes):
+            if encodeur is None:
+                sorties.append(('num', colonne, imputations[i], float(moyennes[i]), float(echelles[i])))
+            elif isinstance(encodeur, OrdinalEncoder):
+                table = {categorie: float(code) for code, categorie in enumerate(encodeur.categories_[i])}
+                code_inconnu = encodeur.unknown_value if encodeur.handle_unknown == 'use_encoded_value' else None
+                sorties.append(('ord', colonne, imputations[i], table, code_inconnu))
+            else:
+                if encodeur.drop is not None:
+                    raise ValueError("Le moteur compilé ne gère pas OneHotEncoder(drop=...)")
+                for categorie in encodeur.categories_[i]:
+                    sorties.append(('onehot', colonne, imputations[i], categorie))
+    return sorties
+
+
+def caracteristiques_selectionnees(pipeline):
+    """Description (voir _decrire_sorties) des caractéristiques vues par le régresseur."""
+    sorties = _decrire_sorties(pipeline.named_steps['preprocessor'])
+    selection = pipeline.named_steps.get('feature_selection')
+    if selection is None:
+        return sorties
+    return [sorties[i] for i in np.flatnonzero(selection.get_support())]
+
+
+def imputations_numeriques(pipeline):
+    """Valeur d'imputation de chaque colonne numérique d'entrée, que SelectKBest l'ait retenue ou non."""
+    return {sortie[1]: sortie[2] for sortie in _decrire_sorties(pipeline.named_steps['preprocessor'])
+            if sortie[0] == 'num'}
+
+
+def _seuils_float32(seuils):
+    """
+    Convertit les seuils en float32 sans changer aucune décision: pour x en
+    float32, x <= s équivaut à x <= plus grand float32 inférieur ou égal à s.
+    """
+    seuils32 = seuils.astype(np.float32)
+    trop_grands = seuils32.astype(np.float64) > seuils
+    seuils32[trop_grands] = np.nextafter(seuils32[trop_grands], np.float32(-np.inf))
+    return seuils32
+
+
+class ForetCompilee:
+    """Noeuds de plusieurs arbres de régression regroupés dans des tableaux contigus."""
+
+    # Vrai pour les forêts aléatoires, dont la prédiction est la moyenne des
+    # arbres: la dispersion des arbres a alors un sens (voir dispersion())
+    moyenne_des_arbres = False
+
+    def __init__(self, arbres, facteur, biais):
+        enfants, caracteristiques, seuils, valeurs, racines, est_feuille = [], [], [], [], [], []
+        decalage = 0
+        profondeur_max = 0
+        for arbre in arbres:
+            t = arbre.tree_
+            n = t.node_count
+            feuilles = t.children_left == -1
+            indices = np.arange(n) + decalage
+
+            # Les feuilles bouclent sur elles-mêmes: le parcours n'a pas besoin de masque
+            gauche = np.where(feuilles, indices, t.children_left + decalage)
+            droite = np.where(feuilles, indices, t.children_right + decalage)
+            paire = np.empty(2 * n, dtype=np.int32)
+            paire[0::2] = gauche
+            paire[1::2] = droite
+
+            enfants.append(paire)
+            caracteristiques.append(np.where(feuilles, 0, t.feature))
+            seuils.append(np.where(feuilles, np.inf, t.threshold))
+            est_feuille.append(feuilles)
+            valeurs.append(t.value[:, 0, 0])
+            racines.append(decalage)
+            profondeur_max = max(profondeur_max, t.max_depth)
+            decalage += n
+
+        # Les enfants sont entrelacés: enfants[2 * noeud + aller_a_droite]
+        self.enfants = np.ascontiguousarray(np.concatenate(enfants))
+        self.caracteristiques = np.ascontiguousarray(np.concatenate(caracteristiques), dtype=np.int32)
+        self.seuils = _seuils_float32(np.concatenate(seuils))
+        self.est_feuille = np.concatenate(est_feuille)
+        self.valeurs = np.ascontiguousarray(np.concatenate(valeurs), dtype=np.float64)
+        self.racines = np.array(racines, dtype=np.intp)
+        self.arbres_natifs = [arbre.tree_ for arbre in arbres]
+        self.profondeur_max = profondeur_max
+        self.facteur = facteur
+        self.biais = biais
+
+    @property
+    def n_arbres(self):
+        return len(self.racines)
+
+    @property
+    def n_noeuds(self):
+        return len(self.seuils)
+
+    def feuilles(self, X):
+        """Indice global de la feuille atteinte, pour chaque ligne et chaque arbre."""
+        n, n_colonnes = X.shape
+        n_arbres = self.n_arbres
+        if n > SEUIL_PARCOURS_NATIF and self.arbres_natifs is not None:
+            X = np.ascontiguousarray(X, dtype=np.float32)
+            return np.column_stack([arbre.apply(X) for arbre in self.arbres_natifs]) + self.racines
+        X_plat = np.ascontiguousarray(X, dtype=np.float32).ravel()
+
+        # Parcours à plat des couples (ligne, arbre) encore actifs
+        resultat = np.empty(n * n_arbres, dtype=np.intp)
+        couples = np.arange(n * n_arbres)
+        noeuds = np.tile(self.racines, n)
+        debuts_lignes = np.repeat(np.arange(n, dtype=np.intp) * n_colonnes, n_arbres)
+        for profondeur in range(self.profondeur_max):
+            # Retirer périodiquement les couples arrivés à une feuille
+            if profondeur and profondeur % INTERVALLE_COMPACTAGE == 0:
+                actifs = ~self.est_feuille[noeuds]
+                if not actifs.all():
+                    termines = ~actifs
+                    resultat[couples[termines]] = noeuds[termines]
+                    couples, noeuds, debuts_lignes = couples[actifs], noeuds[actifs], debuts_lignes[actifs]
+                    if len(couples) == 0:
+                        break
+            aller_droite = X_plat[debuts_lignes + self.caracteristiques[noeuds]] > self.seuils[noeuds]
+            noeuds = self.enfants[2 * noeuds + aller_droite]
+        resultat[couples] = noeuds
+        return resultat.reshape(n, n_arbres)
+
+    def predire_par_arbre(self, X):
+        """Matrice (n_lignes, n_arbres) des prédictions de chaque arbre."""
+        return self.valeurs[self.feuilles(X)]
+
+    def predict(self, X):
+        return self.biais + self.facteur * self.predire_par_arbre(X).sum(axis=1)
+
+    def dispersion(self, X, quantiles=()):
+        """
+        Prédiction, écart-type et quantiles (len(quantiles), n_lignes) des
+        prédictions des arbres, tirés de la même matrice par arbre: un seul
+        parcours de la forêt, par blocs de TAILLE_BLOC lignes.
+        """
+        predictions, ecarts_types, valeurs_quantiles = [], [], []
+        for debut in range(0, max(len(X), 1), TAILLE_BLOC):
+            par_arbre = self.predire_par_arbre(X[debut:debut + TAILLE_BLOC])
+            predictions.append(self.biais + self.facteur * par_arbre.sum(axis=1))
+            ecarts_types.append(par_arbre.std(axis=1))
+            valeurs_quantiles.append(np.quantile(par_arbre, quantiles, axis=1).reshape(len(quantiles), -1))
+        return np.concatenate(predictions), np.concatenate(ecarts_types), np.concatenate(valeurs_quantiles, axis=1)
+
+
+def compiler_regresseur(regresseur):
+    if isinstance(regresseur, (RandomForestRegressor, ExtraTreesRegressor)):
+        foret = ForetCompilee(regresseur.estimators_, 1.0 / len(regresseur.estimators_), 0.0)
+        foret.moyenne_des_arbres = True
+        return foret
+    if isinstance(regresseur, DecisionTreeRegressor):
+        return ForetCompilee([regresseur], 1.0, 0.0)
+    if isinstance(regresseur, GradientBoostingRegressor):
+        if regresseur.init_ == 'zero':
+            biais = 0.0
+        elif hasattr(regresseur.init_, 'constant_'):
+            biais = float(np.ravel(regresseur.init_.constant_)[0])
+        else:
+            raise ValueError("Estimateur initial du Gradient Boosting non supporté")
+        return ForetCompilee(regresseur.estimators_[:, 0], regresseur.learning_rate, biais)
+    raise ValueError(f"Régresseur non supporté par le moteur compilé: {type(regresseur).__name__}")
+
+
+class MoteurCompile:
+    """Version à plat du pipeline, avec la même interface predict(X)."""
+
+    def __init__(self, pipeline):
+        self.sorties = caracteristiques_selectionnees(pipeline)
+        self.n_caracteristiques = len(self.sorties)
+        self.imputations = imputations_numeriques(pipeline)
+        self.foret = compiler_regresseur(pipeline.named_steps['regressor'])
+
+        # Caractéristiques numériques: colonnes, imputations et constantes du scaler
+        positions_num = [p for p, s in enumerate(self.sorties) if s[0] == 'num']
+        self.positions_num = np.array(positions_num, dtype=np.intp)
+        self.colonnes_num = [self.sorties[p][1] for p in positions_num]
+        self.imputations_num = np.array(
+            [np.nan if est_manquant(self.sorties[p][2]) else self.sorties[p][2] for p in positions_num],
+            dtype=np.float64)
+        self.moyennes = np.array([self.sorties[p][3] for p in positions_num], dtype=np.float64)
+        self.echelles = np.array([self.sorties[p][4] for p in positions_num], dtype=np.float64)
+
+        # Caractéristiques catégorielles, regroupées par colonne d'entrée:
+        # colonne -> (valeur_imputation, table_codes, code_inconnu, [(position, type, cible)])
+        self.colonnes_cat = {}
+        for position, sortie in enumerate(self.sorties):
+            type_sortie, colonne, imputation = sortie[:3]
+            if type_sortie == 'num':
+                continue
+            if colonne not in self.colonnes_cat:
+                self.colonnes_cat[colonne] = (imputation, {}, None, [])
+            imputation, table, code_inconnu, cibles = self.colonnes_cat[colonne]
+            if type_sortie == 'ord':
+                table.update(sortie[3])
+                code_inconnu = sortie[4]
+                cibles.append((position, 'ord', None))
+            else:
+                cibles.append((position, 'onehot', sortie[3]))
+            self.colonnes_cat[colonne] = (imputation, table, code_inconnu, cibles)
+
+        self.colonnes_requises = list(dict.fromkeys(self.colonnes_num + list(self.colonnes_cat)))
+
+    def transformer(self, colonnes):
+        """
+        Calcule la matrice (n_lignes, n_caracteristiques) des caractéristiques
+        sélectionnées. `colonnes` est un DataFrame ou un dict nom -> séquence.
+        """
+        n = len(colonnes[self.colonnes_requises[0]])
+        X = np.empty((n, self.n_caracteristiques), dtype=np.float64)
+
+        if self.colonnes_num:
+            brut = np.column_stack([np.asarray(colonnes[c], dtype=np.float64) for c in self.colonnes_num])
+            brut = np.where(np.isnan(brut), self.imputations_num, brut)
+            X[:, self.positions_num] = (brut - self.moyennes) / self.echelles
+
+        for colonne, (imputation, table, code_inconnu, cibles) in self.colonnes_cat.items():
+            valeurs = [imputation if est_manquant(v) else v for v in colonnes[colonne]]
+            for position, type_sortie, cible in cibles:
+                if type_sortie == 'onehot':
+                    X[:, position] = [v == cible for v in valeurs]
+                    continue
+                codes = [table.get(v, code_inconnu) for v in valeurs]
+                if any(code is None for code in codes):
+                    inconnues = sorted({str(v) for v, code in zip(valeurs, codes) if code is None})
+                    raise ValueError(f"Catégories inconnues {inconnues} dans la colonne '{colonne}'")
+                X[:, position] = codes
+
+        # Les arbres de scikit-learn comparent des valeurs en float32
+        return X.astype(np.float32)
+
+    def predict(self, colonnes):
+        X = self.transformer(colonnes)
+        if len(X) <= TAILLE_BLOC:
+            return self.foret.predict(X)
+        return np.concatenate([
+            self.foret.predict(X[debut:debut + TAILLE_BLOC])
+            for debut in range(0, len(X), TAILLE_BLOC)
+        ])
+
+
+def compiler_pipeline(pipeline):
+    return MoteurCompile(pipeline)
+
+
+def exporter_moteur(pipeline, chemin):
+    """
+    Sauvegarde le pipeline dans un format chargeable en mmap: le moteur compilé
+    si le régresseur est supporté, sinon le pipeline lui-même (sans compression,
+    ses tableaux restent projetables). Retourne l'objet sauvegardé.
+    """
+    try:
+        objet = compiler_pipeline(pipeline)
+        # Les arbres scikit-learn sont recopiés au chargement: le moteur exporté
+        # n'utilise que ses propres tableaux, quel que soit le nombre de lignes
+        objet.foret.arbres_natifs = None
+    except ValueError:
+        objet = pipeline
+    joblib.dump(objet, chemin, compress=0)
+    return objet
+
+
+def charger_moteur(chemin, mmap_mode='r'):
+    """Charge un fichier écrit par exporter_moteur; les tableaux sont projetés en lecture seule."""
+    return joblib.load(chemin, mmap_mode=mmap_mode)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python compiled_model.py modele_selection.joblib modele_selection.moteur.joblib")
+    exporte = exporter_moteur(joblib.load(sys.argv[1]), sys.argv[2])
+    print(f"{type(exporte).__name__} exporté dans '{sys.argv[2]}'")
@@ -0,0 +1,273 @@
+"""
+Variantes compactes du modèle sauvegardé par train.py, et rapport
+précision / taille / latence pour choisir celle à déployer dans l'API.
+
+La forêt retenue par train.py (max_depth=None) contient des arbres très
+profonds: un fichier volumineux, un chargement lent et un parcours long pour
+chaque ligne. À partir du pipeline entraîné (le "maître"), ce module produit:
+  - des forêts de profondeur limitée (max_depth) ou aux feuilles plus grosses
+    (min_samples_leaf), réentraînées avec les autres hyperparamètres du maître;
+  - des sous-forêts de K arbres du maître, choisis un à un (sélection gloutonne)
+    pour que leur moyenne reste la plus proche possible de la forêt complète;
+  - des élèves distillés: un Gradient Boosting et une régression linéaire
+    entraînés sur les prédictions du maître, à partir des mêmes
+    caractéristiques encodées. Sur ses propres lignes d'entraînement, une
+    forêt profonde restitue presque la cible: l'élève apprend donc les
+    prédictions hors sac (chaque ligne n'est prédite que par les arbres qui ne
+    l'ont pas tirée), ou des prédictions croisées si le maître n'est pas une
+    forêt avec bootstrap.
+
+Chaque variante garde le prétraitement du maître (préprocesseur et
+SelectKBest): c'est un pipeline complet, sauvegardé sous
+`<dossier>/<variante>.joblib`, que le registre de l'API charge tel quel
+(copier le fichier dans API_DOSSIER_MODELES pour le déployer).
+
+Le rapport donne pour chaque variante MAE, RMSE et R² sur l'ensemble de test de
+train.py, l'écart moyen aux prédictions du maître, la taille du fichier, la
+durée de chargement et les latences d'une prédiction unitaire (pipeline
+scikit-learn et moteur compilé de compiled_model.py) et d'un lot.
+
+Usage (après train.py, mêmes configuration et dataset):
+    python compression.py [--config config.json] [--modele modele_selection.joblib]
+    python compression.py --nettoye dataset_nettoye.parquet   # si train.py --nettoye
+ou directement à la fin de l'entraînement:
+    python train.py --compresser
+"""
+import argparse
+import json
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+from sklearn.ensemble._forest import _generate_unsampled_indices, _get_n_samples_bootstrap
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import KFold, cross_val_predict, train_test_split
+from sklearn.pipeline import Pipeline
+
+from compiled_model import compiler_pipeline
+from train import charger_configuration, cible, metriques, nettoyer
+
+# Nombre de lignes d'entraînement utilisées pour choisir les arbres des sous-forêts
+N_LIGNES_SELECTION = 5000
+TAILLE_LOT = 10000
+# Plis des prédictions croisées distillées quand le maître n'a pas de prédictions hors sac
+N_PLIS_DISTILLATION = 5
+
+
+def selectionner_arbres(foret, X, n_arbres):
+    """
+    Sélection gloutonne: à chaque étape, ajoute l'arbre qui rapproche le plus
+    la moyenne des arbres retenus de la prédiction de la forêt complète sur X.
+    Retourne les indices des arbres, dans l'ordre de sélection.
+    """
+    predictions = np.stack([arbre.predict(X) for arbre in foret.estimators_])
+    cible_foret = predictions.mean(axis=0)
+    choisis = []
+    somme = np.zeros(X.shape[0])
+    restants = list(range(len(predictions)))
+    for k in range(1, min(n_arbres, len(predictions)) + 1):
+        erreurs = (((somme + predictions[restants]) / k - cible_foret) ** 2).mean(axis=1)
+        meilleur = restants.pop(int(np.argmin(erreurs)))
+        choisis.append(meilleur)
+        somme += predictions[meilleur]
+    return choisis
+
+
+def sous_foret(foret, indices):
+    """Copie de la forêt réduite aux arbres `indices` (même classe, mêmes hyperparamètres)."""
+    reduite = clone(foret).set_params(n_estimators=len(indices))
+    for attribut in ('n_features_in_', 'feature_names_in_', 'n_outputs_', 'estimator_'):
+        if hasattr(foret, attribut):
+            setattr(reduite, attribut, getattr(foret, attribut))
+    reduite.estimators_ = [foret.estimators_[i] for i in indices]
+    return reduite
+
+
+def predictions_hors_sac(regresseur, X_entrainement, y_entrainement, random_state):
+    """
+    Prédictions du maître sur ses lignes d'entraînement, chacune faite sans les
+    arbres qui l'ont apprise (comme oob_prediction_, recalculé à partir des
+    tirages bootstrap des arbres). Les lignes tirées par tous les arbres
+    gardent leur cible. Sans bootstrap, prédictions croisées sur
+    N_PLIS_DISTILLATION plis d'un clone du maître.
+    """
+    if getattr(regresseur, 'bootstrap', False) and hasattr(regresseur, 'estimators_'):
+        n = len(X_entrainement)
+        n_bootstrap = _get_n_samples_bootstrap(n, regresseur.max_samples)
+        sommes = np.zeros(n)
+        comptes = np.zeros(n)
+        for arbre in regresseur.estimators_:
+            hors_sac = _generate_unsampled_indices(arbre.random_state, n, n_bootstrap)
+            sommes[hors_sac] += arbre.predict(X_entrainement[hors_sac])
+            comptes[hors_sac] += 1
+        return np.where(comptes > 0, sommes / np.maximum(comptes, 1), y_entrainement)
+    plis = KFold(N_PLIS_DISTILLATION, shuffle=True, random_state=random_state)
+    return cross_val_predict(clone(regresseur), X_entrainement, y_entrainement, cv=plis)
+
+
+def variantes(maitre, X_entrainement, y_entrainement, parametres, random_state):
+    """
+    Itère sur (nom, régresseur ajusté) pour chaque variante du régresseur du
+    maître, à partir des caractéristiques encodées de l'entraînement (celles
+    sur lesquelles le maître a été ajusté, dans le même ordre).
+    """
+    regresseur = maitre.named_steps['regressor']
+    est_foret = isinstance(regresseur, (RandomForestRegressor, ExtraTreesRegressor))
+    yield 'maitre', regresseur
+
+    if est_foret:
+        for profondeur in parametres.get('profondeurs', []):
+            yield f'profondeur_{profondeur}', clone(regresseur).set_params(
+                max_depth=profondeur).fit(X_entrainement, y_entrainement)
+        for feuilles in parametres.get('feuilles_min', []):
+            yield f'feuilles_{feuilles}', clone(regresseur).set_params(
+                min_samples_leaf=feuilles).fit(X_entrainement, y_entrainement)
+
+        rng = np.random.default_rng(random_state)
+        echantillon = rng.choice(len(X_entrainement), min(N_LIGNES_SELECTION, len(X_entrainement)), replace=False)
+        n_max = max(parametres.get('n_arbres', []), default=0)
+        if n_max:
+            ordre = selectionner_arbres(regresseur, X_entrainement[echantillon], n_max)
+            for n_arbres in parametres['n_arbres']:
+                if n_arbres < len(regresseur.estimators_):
+                    yield f'arbres_{n_arbres}', sous_foret(regresseur, ordre[:n_arbres])
+
+    # Distillation: l'élève apprend les prédictions du maître, pas la cible
+    if not (parametres.get('eleve_gb') or parametres.get('eleve_lineaire')):
+        return
+    y_maitre = predictions_hors_sac(regresseur, X_entrainement, y_entrainement, random_state)
+    if parametres.get('eleve_gb'):
+        eleve = GradientBoostingRegressor(random_state=random_state, **parametres['eleve_gb'])
+        yield 'eleve_gb', eleve.fit(X_entrainement, y_maitre)
+    if parametres.get('eleve_lineaire'):
+        yield 'eleve_lineaire', LinearRegression().fit(X_entrainement, y_maitre)
+
+
+def duree_mediane(fonction, n_repetitions):
+    durees = []
+    for _ in range(n_repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return float(np.median(durees))
+
+
+def mesurer(pipeline, chemin, X_test, y_test, y_maitre, n_appels):
+    """Précision, taille, chargement et latences d'une variante sauvegardée dans `chemin`."""
+    y_pred = pipeline.predict(X_test)
+    resultat = metriques(y_test, y_pred)
+    resultat['ecart_maitre'] = float(np.abs(y_pred - y_maitre).mean())
+    regresseur = pipeline.named_steps['regressor']
+    if hasattr(regresseur, 'estimators_'):
+        arbres = np.ravel(regresseur.estimators_)
+        resultat['n_arbres'] = len(arbres)
+        resultat['n_noeuds'] = int(sum(arbre.tree_.node_count for arbre in arbres))
+        resultat['profondeur_max'] = int(max(arbre.tree_.max_depth for arbre in arbres))
+
+    resultat['taille_mo'] = os.path.getsize(chemin) / 1e6
+    resultat['chargement_ms'] = duree_mediane(lambda: joblib.load(chemin), 3) * 1000
+
+    ligne = X_test.iloc[:1]
+    pipeline.predict(ligne)
+    resultat['ligne_ms'] = duree_mediane(lambda: pipeline.predict(ligne), n_appels) * 1000
+    try:
+        moteur = compiler_pipeline(pipeline)
+        moteur.predict(ligne)
+        resultat['ligne_compile_ms'] = duree_mediane(lambda: moteur.predict(ligne), n_appels) * 1000
+    except ValueError:
+        resultat['ligne_compile_ms'] = None
+    lot = X_test.iloc[:TAILLE_LOT]
+    resultat['lot_ms'] = duree_mediane(lambda: pipeline.predict(lot), 3) * 1000
+    resultat['n_lot'] = len(lot)
+    return resultat
+
+
+def compresser(maitre, X_train, y_train, X_test, y_test, configuration, n_appels=200):
+    """
+    Produit, sauvegarde et mesure les variantes du pipeline `maitre`; retourne
+    le rapport {variante: mesures} (aussi écrit dans le rapport de compression).
+    """
+    parametres = configuration['compression']
+    os.makedirs(parametres['dossier'], exist_ok=True)
+    pretraitement = maitre[:-1]
+    X_entrainement = pretraitement.transform(X_train)
+    y_maitre = maitre.predict(X_test)
+
+    rapport = {}
+    debut = time.perf_counter()
+    for nom, regresseur in variantes(maitre, X_entrainement, y_train.to_numpy(), parametres,
+                                     configuration['random_state']):
+        pipeline = Pipeline(pretraitement.steps + [('regressor', regresseur)])
+        chemin = os.path.join(parametres['dossier'], f'{nom}.joblib')
+        joblib.dump(pipeline, chemin)
+        rapport[nom] = mesurer(pipeline, chemin, X_test, y_test, y_maitre, n_appels)
+        rapport[nom]['fichier'] = chemin
+        print(f"{nom}: R² {rapport[nom]['R²']:.4f}, {rapport[nom]['taille_mo']:.1f} Mo "
+              f"({time.perf_counter() - debut:.1f} s)")
+        debut = time.perf_counter()
+
+    with open(parametres['rapport'], 'w', encoding='utf-8') as f:
+        json.dump(rapport, f, ensure_ascii=False, indent=2)
+    return rapport
+
+
+def _format(valeur, precision):
+    return '-' if valeur is None else f"{valeur:.{precision}f}"
+
+
+def afficher_tableau(rapport):
+    colonnes = [('MAE', 'MAE', 0), ('RMSE', 'RMSE', 0), ('R²', 'R²', 4), ('écart', 'ecart_maitre', 0),
+                ('Mo', 'taille_mo', 1), ('charg. ms', 'chargement_ms', 0), ('1 ligne ms', 'ligne_ms', 2),
+                ('compilé ms', 'ligne_compile_ms', 3), ('lot ms', 'lot_ms', 0)]
+    print(f"\n{'variante':<16}" + "".join(f"{titre:>12}" for titre, _, _ in colonnes))
+    for nom, mesures in rapport.items():
+        print(f"{nom:<16}" + "".join(f"{_format(mesures.get(cle), precision):>12}"
+                                      for _, cle, precision in colonnes))
+    n_lot = next(iter(rapport.values()))['n_lot'] if rapport else 0
+    print(f"\nécart: écart absolu moyen aux prédictions du maître; lot: {n_lot} lignes")
+
+
+def donnees_entrainement(configuration):
+    """Ensembles d'apprentissage et de test de train.py (même nettoyage, même découpage)."""
+    if configuration.get('dataset_nettoye'):
+        # Dataset déjà nettoyé par cleaning.py
+        from cleaning import lire_nettoye
+
+        df = lire_nettoye(configuration['dataset_nettoye'])
+    else:
+        df = nettoyer(pd.read_csv(configuration['dataset']), configuration['random_state'])
+    X = df.drop(columns=[cible])
+    y = df[cible]
+    return train_test_split(X, y, test_size=configuration['test_size'], random_state=configuration['random_state'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Variantes compactes du modèle et rapport précision/latence")
+    parser.add_argument("--config", help="Fichier JSON qui remplace des clés de la configuration par défaut")
+    parser.add_argument("--modele", help="Pipeline maître (défaut: sortie_modele de la configuration)")
+    parser.add_argument("--dataset", help="Dataset d'entraînement (remplace celui de la configuration)")
+    parser.add_argument("--nettoye", help="Parquet déjà nettoyé par cleaning.py (remplace chargement et nettoyage)")
+    parser.add_argument("--appels", type=int, default=200, help="Prédictions unitaires par mesure de latence")
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    configuration = charger_configuration(args.config)
+    if args.dataset:
+        configuration['dataset'] = args.dataset
+    if args.nettoye:
+        configuration['dataset_nettoye'] = args.nettoye
+    maitre = joblib.load(args.modele or configuration['sortie_modele'])
+    X_train, X_test, y_train, y_test = donnees_entrainement(configuration)
+    rapport = compresser(maitre, X_train, y_train, X_test, y_test, configuration, args.appels)
+    afficher_tableau(rapport)
+    print(f"\nVariantes dans '{configuration['compression']['dossier']}', "
+          f"rapport dans '{configuration['compression']['rapport']}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Explication des prédictions: contribution de chaque champ d'entrée au revenu
+prédit, par décomposition des chemins dans les arbres (méthode de Saabas).
+
+Dans un arbre, la valeur d'une feuille est la valeur de la racine plus la
+somme des écarts (valeur du noeud - valeur de son parent) le long du chemin;
+chaque écart est attribué à la caractéristique sur laquelle le parent coupe.
+Sur toute la forêt:
+
+    prédiction = valeur_reference + somme des contributions
+
+où valeur_reference est la prédiction moyenne du modèle (valeurs des racines,
+c'est-à-dire la moyenne des cibles d'entraînement). Les contributions des
+caractéristiques issues d'une même colonne (one-hot d'une région, etc.) sont
+additionnées sous le nom du champ de la requête.
+
+Les écarts, les champs et les parents de tous les noeuds sont calculés une
+seule fois, au chargement du modèle. Expliquer un lot revient alors à trouver
+les feuilles atteintes (le parcours de ForetCompilee, natif au-delà de
+SEUIL_PARCOURS_NATIF lignes) puis à remonter tous les chemins à la fois,
+niveau par niveau, en cumulant les écarts avec np.bincount.
+"""
+import numpy as np
+
+from compiled_model import TAILLE_BLOC
+
+# Nombre de niveaux remontés entre deux retraits des chemins terminés: les
+# feuilles sont à des profondeurs très variables (17 en moyenne, jusqu'à 33)
+INTERVALLE_COMPACTAGE = 4
+
+
+class ExplicateurForet:
+    """Contributions par champ d'entrée des prédictions d'une ForetCompilee."""
+
+    def __init__(self, foret, champs):
+        """`champs`: champ d'entrée de chaque caractéristique vue par la forêt, dans l'ordre."""
+        self.foret = foret
+        self.champs = list(dict.fromkeys(champs))
+        champ_caracteristique = np.array([self.champs.index(champ) for champ in champs], dtype=np.int32)
+
+        # Parent de chaque noeud; les racines sont leur propre parent, comme les
+        # feuilles sont leurs propres enfants: la remontée n'a pas besoin de masque
+        n_noeuds = foret.n_noeuds
+        internes = np.flatnonzero(~np.asarray(foret.est_feuille))
+        enfants = np.asarray(foret.enfants).reshape(-1, 2)
+        self.parents = np.arange(n_noeuds, dtype=np.int32)
+        self.parents[enfants[internes, 0]] = internes
+        self.parents[enfants[internes, 1]] = internes
+        self.racines = np.asarray(foret.racines)
+
+        # Écart de valeur apporté par chaque noeud et champ de la coupe de son parent (0 pour les racines)
+        valeurs = np.asarray(foret.valeurs)
+        self.ecarts = foret.facteur * (valeurs - valeurs[self.parents])
+        self.champs_noeuds = champ_caracteristique[np.asarray(foret.caracteristiques)[self.parents]]
+        self.profondeur_max = foret.profondeur_max
+
+        self.valeur_reference = float(foret.biais + foret.facteur * valeurs[self.racines].sum())
+
+    @property
+    def n_champs(self):
+        return len(self.champs)
+
+    def _remonter(self, feuilles):
+        """Contributions (n_lignes, n_champs) cumulées en remontant des feuilles vers les racines."""
+        n, n_arbres = feuilles.shape
+        n_champs = self.n_champs
+        contributions = np.zeros(n * n_champs)
+        noeuds = feuilles.ravel()
+        debuts_lignes = np.repeat(np.arange(n, dtype=np.intp) * n_champs, n_arbres)
+        for profondeur in range(self.profondeur_max):
+            contributions += np.bincount(debuts_lignes + self.champs_noeuds[noeuds], weights=self.ecarts[noeuds],
+                                         minlength=n * n_champs)
+            parents = self.parents[noeuds]
+            # Retirer périodiquement les chemins arrivés à leur racine
+            if profondeur % INTERVALLE_COMPACTAGE == INTERVALLE_COMPACTAGE - 1:
+                actifs = parents != noeuds
+                if not actifs.all():
+                    parents, debuts_lignes = parents[actifs], debuts_lignes[actifs]
+                    if len(parents) == 0:
+                        break
+            noeuds = parents
+        return contributions.reshape(n, n_champs)
+
+    def expliquer(self, X):
+        """
+        Prédictions (n_lignes,) et contributions (n_lignes, n_champs) des
+        lignes de X (caractéristiques encodées), par blocs de TAILLE_BLOC lignes.
+        """
+        foret = self.foret
+        predictions, contributions = [], []
+        for debut in range(0, max(len(X), 1), TAILLE_BLOC):
+            feuilles = foret.feuilles(X[debut:debut + TAILLE_BLOC])
+            predictions.append(foret.biais + foret.facteur * np.asarray(foret.valeurs)[feuilles].sum(axis=1))
+            contributions.append(self._remonter(feuilles))
+        return np.concatenate(predictions), np.concatenate(contributions)
@@ -0,0 +1,69 @@
+"""
+Encodage direct des requêtes de l'API en vecteurs de caractéristiques.
+
+Le pipeline d'origine exige un DataFrame pandas pour chaque prédiction. Cet
+encodeur lit directement les attributs des objets PredictionInput et produit
+les caractéristiques sélectionnées (après imputation, normalisation, encodage
+et SelectKBest), prêtes à être passées au régresseur, sans DataFrame.
+"""
+import threading
+
+import numpy as np
+
+from compiled_model import MoteurCompile, est_manquant, caracteristiques_selectionnees
+
+
+class EncodeurRequetes:
+    def __init__(self, pipeline):
+        """pipeline: pipeline scikit-learn ou moteur compilé (MoteurCompile)."""
+        if isinstance(pipeline, MoteurCompile):
+            sorties = pipeline.sorties
+        else:
+            sorties = caracteristiques_selectionnees(pipeline)
+
+        # Un lecteur par caractéristique, dans l'ordre attendu par le régresseur:
+        #   ('num', attribut, imputation, moyenne, echelle)
+        #   ('cat', attribut, imputation, table valeur -> caractéristique, valeur par défaut)
+        # Pour l'encodage ordinal, une valeur par défaut None signale une catégorie inconnue.
+        self.lecteurs = []
+        for sortie in sorties:
+            type_sortie, attribut, imputation = sortie[:3]
+            if type_sortie == 'num':
+                self.lecteurs.append(('num', attribut, imputation, sortie[3], sortie[4]))
+            elif type_sortie == 'ord':
+                self.lecteurs.append(('cat', attribut, imputation, sortie[3], sortie[4]))
+            else:
+                self.lecteurs.append(('cat', attribut, imputation, {sortie[3]: 1.0}, 0.0))
+        self.n_caracteristiques = len(self.lecteurs)
+        self._local = threading.local()
+
+    def _remplir(self, ligne, entree):
+        for position, (type_lecteur, attribut, imputation, a, b) in enumerate(self.lecteurs):
+            valeur = getattr(entree, attribut)
+            if est_manquant(valeur):
+                valeur = imputation
+            if type_lecteur == 'num':
+                ligne[position] = (valeur - a) / b
+            else:
+                code = a.get(valeur, b)
+                if code is None:
+                    raise ValueError(f"Catégorie inconnue '{valeur}' pour '{attribut}'")
+                ligne[position] = code
+
+    def encoder(self, entree):
+        """
+        Encode une requête dans une ligne (1, n_caracteristiques) réutilisée
+        d'un appel à l'autre (une par thread).
+        """
+        ligne = getattr(self._local, 'ligne', None)
+        if ligne is None:
+            ligne = self._local.ligne = np.empty((1, self.n_caracteristiques), dtype=np.float32)
+        self._remplir(ligne[0], entree)
+        return ligne
+
+    def encoder_lot(self, entrees):
+        """Encode une liste de requêtes dans une matrice (n, n_caracteristiques)."""
+        X = np.empty((len(entrees), self.n_caracteristiques), dtype=np.float32)
+        for ligne, entree in zip(X, entrees):
+            self._remplir(ligne, entree)
+        return X
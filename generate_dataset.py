@@ -1,14 +1,11 @@
-import numpy as np
-import pandas as pd
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from datetime import datetime
-import random
-
-# Définir un seed pour la reproductibilité
-np.random.seed(42)
-random.seed(42)
 
-# Nombre d'enregistrements
-n_samples = 40000
+import numpy as np
+import pandas as pd
 
 # Définir les régions du Maroc
 regions = [
@@ -22,292 +19,605 @@ region_probs = [
     0.11, 0.08, 0.13, 0.13, 0.07, 0.20, 0.13, 0.05, 0.07, 0.01, 0.01, 0.01
 ]
 
-# Générer les données de base
-data = {
+# Modalités des variables catégorielles et leurs probabilités
+sexes = ['Homme', 'Femme']
+sexe_probs = [0.52, 0.48]
+milieux = ['Urbain', 'Rural']
+milieu_probs = [0.63, 0.37]
+etats_matrimoniaux = ['Célibataire', 'Marié', 'Divorcé', 'Veuf']
+etat_matrimonial_probs = [0.35, 0.55, 0.07, 0.03]
+niveaux_education = ['Sans niveau', 'Fondamental', 'Secondaire', 'Supérieur']
+niveau_education_probs = [0.25, 0.35, 0.25, 0.15]
+groupes_socio = ['Groupe 1', 'Groupe 2', 'Groupe 3', 'Groupe 4', 'Groupe 5', 'Groupe 6']
+groupe_socio_probs = [0.05, 0.15, 0.20, 0.20, 0.25, 0.15]
+categories_age = ['Jeune', 'Adulte', 'Sénior', 'Âgé']
+
+# Tables de correspondance, indexées par le code de la modalité
+# Âge de début de travail selon le niveau d'éducation
+debut_travail = np.array([15, 16, 19, 23])
+# Multiplicateurs de revenu (écarts marqués entre niveaux et groupes)
+education_multiplier = np.array([0.4, 0.7, 1.5, 3.0])
+socio_multiplier = np.array([4.0, 2.0, 1.2, 0.8, 0.6, 0.4])
+# Probabilité d'accès au crédit selon le groupe socioprofessionnel
+credit_probs = np.array([0.8, 0.8, 0.5, 0.5, 0.2, 0.2])
+
+# Colonnes qui reçoivent des valeurs manquantes
+colonnes_manquantes = ['niveau_education', 'annees_experience', 'taille_foyer', 'possede_voiture', 'possede_logement']
+
+# Cibles de calibration
+target_overall = 21949
+target_urbain = 26988
+target_rural = 12862
+target_pct_below_mean = 71.8
+target_pct_below_mean_urbain = 65.9
+target_pct_below_mean_rural = 85.4
+
+
+def tirer(rng, n, probs):
+    """Tire n codes de modalités selon les probabilités données."""
+    return rng.choice(len(probs), n, p=probs).astype(np.int8)
+
+
+def generer_donnees(n_samples, rng):
+    """
+    Génère les caractéristiques et le revenu brut (avant calibration) de
+    n_samples individus, entièrement par opérations vectorisées.
+    Les variables catégorielles sont retournées sous forme de codes.
+    """
     # Caractéristiques démographiques
-    'age': np.random.randint(18, 80, n_samples),
-    'sexe': np.random.choice(['Homme', 'Femme'], n_samples, p=[0.52, 0.48]),
-    'milieu': np.random.choice(['Urbain', 'Rural'], n_samples, p=[0.63, 0.37]),
-    'etat_matrimonial': np.random.choice(
-        ['Célibataire', 'Marié', 'Divorcé', 'Veuf'], 
-        n_samples, 
-        p=[0.35, 0.55, 0.07, 0.03]
-    ),
-    'region': np.random.choice(regions, n_samples, p=region_probs),
-    
+    age = rng.integers(18, 80, n_samples).astype(np.int16)
+    sexe = tirer(rng, n_samples, sexe_probs)
+    milieu = tirer(rng, n_samples, milieu_probs)
+    etat_matrimonial = tirer(rng, n_samples, etat_matrimonial_probs)
+    region = tirer(rng, n_samples, region_probs)
+
     # Caractéristiques socio-économiques
-    'niveau_education': np.random.choice(
-        ['Sans niveau', 'Fondamental', 'Secondaire', 'Supérieur'], 
-        n_samples, 
-        p=[0.25, 0.35, 0.25, 0.15]
-    ),
-    'categorie_socioprofessionnelle': np.random.choice(
-        ['Groupe 1', 'Groupe 2', 'Groupe 3', 'Groupe 4', 'Groupe 5', 'Groupe 6'], 
-        n_samples, 
-        p=[0.05, 0.15, 0.20, 0.20, 0.25, 0.15]
-    ),
-    
-    # Caractéristiques additionnelles choisies
-    'taille_foyer': np.random.randint(1, 10, n_samples),
-    'aide_sociale': np.random.choice([0, 1], n_samples, p=[0.7, 0.3]),
-    'a_acces_credit': np.random.choice([0, 1], n_samples, p=[0.6, 0.4]),
-    'a_retraite': np.zeros(n_samples, dtype=int),  # Sera mis à jour en fonction de l'âge
-    
+    niveau_education = tirer(rng, n_samples, niveau_education_probs)
+    categorie_socio = tirer(rng, n_samples, groupe_socio_probs)
+    taille_foyer = rng.integers(1, 10, n_samples).astype(np.float64)
+    aide_sociale = (rng.random(n_samples) < 0.3).astype(np.int8)
+
     # Possessions
-    'possede_voiture': np.random.choice([0, 1], n_samples, p=[0.7, 0.3]),
-    'possede_logement': np.random.choice([0, 1], n_samples, p=[0.4, 0.6]),
-    'possede_terrain': np.random.choice([0, 1], n_samples, p=[0.8, 0.2]),
+    possede_voiture = (rng.random(n_samples) < 0.3).astype(np.float64)
+    possede_logement = (rng.random(n_samples) < 0.6).astype(np.float64)
+    possede_terrain = (rng.random(n_samples) < 0.2).astype(np.int8)
+
+    # Catégorie d'âge: <30, <50, <65, sinon âgé
+    categorie_age = np.searchsorted([30, 50, 65], age, side='right').astype(np.int8)
+
+    # Années d'expérience selon l'âge et le niveau d'éducation, avec des
+    # périodes sans emploi de 0 à 4 ans
+    experience = np.maximum(0, age - debut_travail[niveau_education])
+    experience = np.maximum(0, experience - rng.integers(0, 5, n_samples)).astype(np.float64)
+
+    # Retraite à partir de 60 ans
+    a_retraite = (age >= 60).astype(np.int8)
+
+    # Accès au crédit selon la stabilité financière du groupe socioprofessionnel
+    a_acces_credit = (rng.random(n_samples) < credit_probs[categorie_socio]).astype(np.int8)
+
+    # Revenu: base liée à l'expérience, multiplicateurs d'éducation et de groupe,
+    # bonus pour les diplômés du supérieur en milieu urbain, bruit réduit
+    urban_edu_bonus = np.where((milieu == 0) & (niveau_education == 3), 1.5, 1.0)
+    revenu = ((4000 + experience * 800)
+              * education_multiplier[niveau_education]
+              * socio_multiplier[categorie_socio]
+              * urban_edu_bonus
+              * rng.normal(1, 0.1, n_samples))
+    revenu_annuel = np.maximum(1000, np.rint(revenu)).astype(np.int64)
+
+    return {
+        'age': age,
+        'sexe': sexe,
+        'milieu': milieu,
+        'etat_matrimonial': etat_matrimonial,
+        'region': region,
+        'niveau_education': niveau_education,
+        'categorie_socioprofessionnelle': categorie_socio,
+        'taille_foyer': taille_foyer,
+        'aide_sociale': aide_sociale,
+        'a_acces_credit': a_acces_credit,
+        'a_retraite': a_retraite,
+        'possede_voiture': possede_voiture,
+        'possede_logement': possede_logement,
+        'possede_terrain': possede_terrain,
+        'categorie_age': categorie_age,
+        'annees_experience': experience,
+        'revenu_annuel': revenu_annuel,
+    }
+
+
+def ajouter_bruit(donnees, rng, premier_id=1):
+    """Ajoute les colonnes redondantes et non pertinentes, les valeurs manquantes et aberrantes."""
+    n_samples = len(donnees['age'])
+
+    # Colonnes redondantes
+    donnees['age_en_mois'] = donnees['age'].astype(np.int32) * 12
+    donnees['est_urbain'] = (donnees['milieu'] == 0).astype(np.int8)
+    donnees['est_marie'] = (donnees['etat_matrimonial'] == 1).astype(np.int8)
+
+    # Colonnes non pertinentes
+    donnees['id_utilisateur'] = np.arange(premier_id, premier_id + n_samples)
+    donnees['code_postal'] = rng.integers(10000, 99999, n_samples).astype(np.int32)
+
+    # Valeurs manquantes (5% par colonne): code -1 pour les catégories, NaN sinon
+    for col in colonnes_manquantes:
+        mask = rng.random(n_samples) < 0.05
+        if col == 'niveau_education':
+            donnees[col][mask] = -1
+        else:
+            donnees[col][mask] = np.nan
+
+    # Âge aberrant
+    aberrant_indices = rng.choice(n_samples, int(n_samples * 0.01), replace=False)
+    donnees['age'][aberrant_indices] = rng.integers(100, 120, len(aberrant_indices))
+
+    # Revenu aberrant
+    aberrant_indices = rng.choice(n_samples, int(n_samples * 0.01), replace=False)
+    donnees['revenu_annuel'][aberrant_indices] = rng.integers(300000, 1000000, len(aberrant_indices))
+    return donnees
+
+
+cibles_milieu = {
+    0: (target_urbain, target_pct_below_mean_urbain),
+    1: (target_rural, target_pct_below_mean_rural),
 }
 
-# Créer le DataFrame
-df = pd.DataFrame(data)
-
-# Ajouter la catégorie d'âge
-def categoriser_age(age):
-    if age < 30:
-        return 'Jeune'
-    elif age < 50:
-        return 'Adulte'
-    elif age < 65:
-        return 'Sénior'
-    else:
-        return 'Âgé'
-
-df['categorie_age'] = df['age'].apply(categoriser_age)
-
-# Calculer les années d'expérience en fonction de l'âge et du niveau d'éducation
-def calculer_experience(row):
-    age = row['age']
-    education = row['niveau_education']
-    
-    if education == 'Sans niveau':
-        debut_travail = 15
-    elif education == 'Fondamental':
-        debut_travail = 16
-    elif education == 'Secondaire':
-        debut_travail = 19
-    else:  # Supérieur
-        debut_travail = 23
-    
-    experience = max(0, age - debut_travail)
-    # Ajouter une variabilité (certaines personnes peuvent avoir des périodes sans emploi)
-    experience = max(0, experience - np.random.randint(0, 5))
-    return experience
-
-df['annees_experience'] = df.apply(calculer_experience, axis=1)
-
-# Mettre à jour la retraite en fonction de l'âge
-df.loc[df['age'] >= 60, 'a_retraite'] = 1
-
-# Ajuster l'accès au crédit en fonction du revenu et de la stabilité financière
-def ajuster_acces_credit(row):
-    if row['categorie_socioprofessionnelle'] in ['Groupe 1', 'Groupe 2']:
-        return np.random.choice([0, 1], p=[0.2, 0.8])
-    elif row['categorie_socioprofessionnelle'] in ['Groupe 3', 'Groupe 4']:
-        return np.random.choice([0, 1], p=[0.5, 0.5])
-    else:
-        return np.random.choice([0, 1], p=[0.8, 0.2])
-
-df['a_acces_credit'] = df.apply(ajuster_acces_credit, axis=1)
-
-# Générer le revenu en fonction des caractéristiques
-def generer_revenu(row):
-    # Base income with stronger feature dependence
-    base_revenu = 4000 + (row['annees_experience'] * 800)  # Experience matters more
-    
-    # Education multipliers (wider gaps)
-    education_multiplier = {
-        'Sans niveau': 0.4,
-        'Fondamental': 0.7,
-        'Secondaire': 1.5,
-        'Supérieur': 3.0  # University graduates earn significantly more
-    }[row['niveau_education']]
-    
-    # Socio-professional group multipliers (starker differences)
-    socio_multiplier = {
-        'Groupe 1': 4.0,  # High-income professionals
-        'Groupe 2': 2.0,
-        'Groupe 3': 1.2,
-        'Groupe 4': 0.8,
-        'Groupe 5': 0.6,
-        'Groupe 6': 0.4   # Unemployed/Manual laborers
-    }[row['categorie_socioprofessionnelle']]
-    
-    # Interaction: Urban + Higher education = bonus
-    urban_edu_bonus = 1.5 if (row['milieu'] == 'Urbain' and row['niveau_education'] == 'Supérieur') else 1.0
-    
-    # Combine factors with less noise
-    revenu = base_revenu * education_multiplier * socio_multiplier * urban_edu_bonus
-    revenu *= np.random.normal(1, 0.1)  # Reduced noise
-    
-    return max(1000, int(round(revenu)))
-
-
-
-
-
-
-
-df['revenu_annuel'] = df.apply(generer_revenu, axis=1)
-
-# Ajouter des colonnes redondantes
-df['age_en_mois'] = df['age'] * 12
-df['est_urbain'] = df['milieu'].apply(lambda x: 1 if x == 'Urbain' else 0)
-df['est_marie'] = df['etat_matrimonial'].apply(lambda x: 1 if x == 'Marié' else 0)
-
-# Ajouter des colonnes non pertinentes
-df['id_utilisateur'] = np.arange(1, n_samples + 1)
-df['date_enregistrement'] = [datetime.now().strftime('%Y-%m-%d') for _ in range(n_samples)]
-df['code_postal'] = np.random.randint(10000, 99999, n_samples)
-
-# Ajouter des valeurs manquantes
-for col in ['niveau_education', 'annees_experience', 'taille_foyer', 'possede_voiture', 'possede_logement']:
-    mask = np.random.choice([True, False], n_samples, p=[0.05, 0.95])
-    df.loc[mask, col] = np.nan
-
-# Ajouter des valeurs aberrantes
-# Âge aberrant
-aberrant_indices = np.random.choice(n_samples, int(n_samples * 0.01), replace=False)
-df.loc[aberrant_indices, 'age'] = np.random.randint(100, 120, len(aberrant_indices))
-
-# Revenu aberrant
-aberrant_indices = np.random.choice(n_samples, int(n_samples * 0.01), replace=False)
-df.loc[aberrant_indices, 'revenu_annuel'] = np.random.randint(300000, 1000000, len(aberrant_indices))
-
-# Calculer les statistiques actuelles
-urbain_mean = df[df['milieu'] == 'Urbain']['revenu_annuel'].mean()
-rural_mean = df[df['milieu'] == 'Rural']['revenu_annuel'].mean()
-overall_mean = df['revenu_annuel'].mean()
-
-# Calculer les facteurs d'ajustement pour atteindre les cibles
-target_overall = 21949
-target_urbain = 26988
-target_rural = 12862
 
-adjustment_urbain = target_urbain / urbain_mean
-adjustment_rural = target_rural / rural_mean
+class StatistiquesRevenus:
+    """
+    Statistiques exactes des revenus par milieu, cumulables chunk par chunk:
+    un histogramme des revenus (entiers) dont la taille ne dépend que du
+    revenu maximal, pas du nombre de lignes.
+    """
+
+    def __init__(self):
+        self.histogrammes = {0: np.zeros(0, dtype=np.int64), 1: np.zeros(0, dtype=np.int64)}
+
+    def _cumuler(self, m, valeurs):
+        histo = self.histogrammes[m]
+        if len(valeurs) > len(histo):
+            valeurs = valeurs.copy()
+            valeurs[:len(histo)] += histo
+            self.histogrammes[m] = valeurs
+        else:
+            histo[:len(valeurs)] += valeurs
+
+    def ajouter(self, revenus, milieu):
+        for m in self.histogrammes:
+            self._cumuler(m, np.bincount(revenus[milieu == m]))
+
+    def fusionner(self, autre):
+        """Cumule les statistiques d'un autre chunk ou d'un autre shard."""
+        for m, valeurs in autre.histogrammes.items():
+            self._cumuler(m, valeurs)
+        return self
+
+    def _histogramme(self, m=None):
+        if m is not None:
+            return self.histogrammes[m]
+        urbain, rural = self.histogrammes[0], self.histogrammes[1]
+        total = np.zeros(max(len(urbain), len(rural)), dtype=np.int64)
+        total[:len(urbain)] += urbain
+        total[:len(rural)] += rural
+        return total
+
+    def effectif(self, m=None):
+        return int(self._histogramme(m).sum())
+
+    def moyenne(self, m=None, facteur=1.0):
+        """Moyenne des revenus, éventuellement après multiplication par `facteur` et troncature."""
+        histo = self._histogramme(m)
+        valeurs = np.arange(len(histo))
+        if facteur != 1.0:
+            valeurs = (valeurs * facteur).astype(np.int64)
+        return float((valeurs * histo).sum() / histo.sum())
+
+    def pct_sous(self, valeur, m=None):
+        histo = self._histogramme(m)
+        return float(histo[:int(np.ceil(valeur))].sum() / histo.sum() * 100)
+
+    def resume(self):
+        """Même format que statistiques_revenu."""
+        stats = {}
+        for nom, m in [('global', None), ('urbain', 0), ('rural', 1)]:
+            moyenne = self.moyenne(m)
+            stats[nom] = (moyenne, self.pct_sous(moyenne, m))
+        return stats
+
+
+class CalibrateurQuantile:
+    """
+    Calibration en forme fermée des revenus d'un milieu, calculée à partir de
+    leur histogramme. Soit t le revenu qui laisse la proportion cible p des
+    individus strictement en dessous. La transformation, croissante, est:
+      - x < t:  g(x) = M * x / t                (reste sous la moyenne M)
+      - x >= t: g(x) = M + pente * (x - t)      (reste au-dessus de M)
+    où la pente est choisie pour que la moyenne de g soit exactement M. Les
+    rangs sont conservés et les deux cibles sont atteintes en une seule passe.
+    """
 
-# Appliquer les ajustements (avec conversion explicite en int)
-df.loc[df['milieu'] == 'Urbain', 'revenu_annuel'] = (df.loc[df['milieu'] == 'Urbain', 'revenu_annuel'] * adjustment_urbain).astype(int)
-df.loc[df['milieu'] == 'Rural', 'revenu_annuel'] = (df.loc[df['milieu'] == 'Rural', 'revenu_annuel'] * adjustment_rural).astype(int)
+    def __init__(self, histogramme, target_mean, target_pct):
+        # Histogramme compacté: revenus présents et leurs effectifs
+        valeurs = np.flatnonzero(histogramme)
+        effectifs = histogramme[valeurs]
+        n = effectifs.sum()
+        effectifs_sous = np.cumsum(effectifs) - effectifs  # nombre de revenus < valeur
+        i = int(np.argmin(np.abs(effectifs_sous - target_pct / 100 * n)))
+        self.seuil = int(valeurs[i])
+        self.moyenne = target_mean
+
+        n_bas = effectifs_sous[i]
+        somme_bas = (valeurs[:i] * effectifs[:i]).sum()
+        n_haut = n - n_bas
+        somme_haut = (valeurs[i:] * effectifs[i:]).sum()
+        ecart_haut = somme_haut - n_haut * self.seuil
+        # Pour une moyenne M: M * somme_bas / t + n_haut * M + pente * ecart_haut = n * M
+        self.pente = target_mean * (n_bas - somme_bas / self.seuil) / ecart_haut if ecart_haut > 0 else 0.0
+
+    def appliquer(self, revenus):
+        bas = revenus < self.seuil
+        return np.where(bas,
+                        np.floor(revenus * (self.moyenne / self.seuil)),
+                        np.ceil(self.moyenne + self.pente * (revenus - self.seuil))).astype(np.int64)
+
+
+def calibrateurs(statistiques):
+    """Un calibrateur par milieu, à partir des statistiques des revenus bruts."""
+    return {m: CalibrateurQuantile(statistiques.histogrammes[m], cible, pct)
+            for m, (cible, pct) in cibles_milieu.items() if statistiques.effectif(m)}
+
+
+def appliquer_calibrateurs(revenus, milieu, calibrateurs_milieu):
+    """Calibre les revenus en place (un chunk ou le dataset entier)."""
+    for m, calibrateur in calibrateurs_milieu.items():
+        masque = milieu == m
+        revenus[masque] = calibrateur.appliquer(revenus[masque])
+    return revenus
+
+
+def calibrer_revenus(revenus, milieu):
+    """
+    Ajuste les revenus urbains et ruraux pour atteindre les moyennes et les
+    pourcentages sous la moyenne cibles. `revenus` est modifié en place.
+    """
+    statistiques = StatistiquesRevenus()
+    statistiques.ajouter(revenus, milieu)
+    return appliquer_calibrateurs(revenus, milieu, calibrateurs(statistiques))
 
-# Vérifier les statistiques après ajustement
-urbain_mean_adj = df[df['milieu'] == 'Urbain']['revenu_annuel'].mean()
-rural_mean_adj = df[df['milieu'] == 'Rural']['revenu_annuel'].mean()
-overall_mean_adj = df['revenu_annuel'].mean()
 
-# Fonction pour ajuster la distribution pour atteindre les pourcentages cibles sous la moyenne
-def ajuster_distribution_skew(df_subset, target_pct_below_mean, mean_value, iterations=5):
+# Calibration itérative d'origine, conservée comme référence pour les benchmarks
+def ajuster_distribution_skew(revenus, target_pct_below_mean, mean_value, rng, iterations=5):
     """
     Ajuste la distribution pour atteindre le pourcentage cible sous la moyenne
     en modifiant progressivement la forme de la distribution.
+    `revenus` (tableau d'entiers) est modifié en place.
     """
-    current_pct = (df_subset['revenu_annuel'] < mean_value).mean() * 100
-    
+    current_pct = (revenus < mean_value).mean() * 100
+
     # Si déjà proche de la cible, ne rien faire
     if abs(current_pct - target_pct_below_mean) < 1.0:
-        return df_subset
-    
+        return revenus
+
     # Déterminer si nous devons augmenter ou diminuer le pourcentage sous la moyenne
     need_increase = current_pct < target_pct_below_mean
-    
+
     for _ in range(iterations):
         # Calculer le pourcentage actuel sous la moyenne
-        current_pct = (df_subset['revenu_annuel'] < mean_value).mean() * 100
-        
+        current_pct = (revenus < mean_value).mean() * 100
+
         if abs(current_pct - target_pct_below_mean) < 1.0:
             break  # Assez proche de la cible
-        
+
         if need_increase:
-            # Nous devons augmenter le pourcentage sous la moyenne
-            # Identifier les revenus juste au-dessus de la moyenne
-            just_above = df_subset[(df_subset['revenu_annuel'] >= mean_value) & 
-                                  (df_subset['revenu_annuel'] < mean_value * 1.2)]
-            
-            if len(just_above) > 0:
-                # Calculer combien d'observations doivent être déplacées
-                n_to_move = int(len(df_subset) * (target_pct_below_mean - current_pct) / 100)
-                n_to_move = min(n_to_move, len(just_above))
-                
-                if n_to_move > 0:
-                    # Sélectionner les observations à déplacer
-                    to_move = just_above.sample(n=n_to_move)
-                    
-                    # Réduire ces revenus pour qu'ils soient sous la moyenne
-                    factor = 0.85  # Réduction de 15%
-                    df_subset.loc[to_move.index, 'revenu_annuel'] = (df_subset.loc[to_move.index, 'revenu_annuel'] * factor).astype(int)
+            # Revenus juste au-dessus de la moyenne, à réduire de 15%
+            candidats = np.flatnonzero((revenus >= mean_value) & (revenus < mean_value * 1.2))
+            n_to_move = int(len(revenus) * (target_pct_below_mean - current_pct) / 100)
+            factor = 0.85
         else:
-            # Nous devons diminuer le pourcentage sous la moyenne
-            # Identifier les revenus juste en-dessous de la moyenne
-            just_below = df_subset[(df_subset['revenu_annuel'] < mean_value) & 
-                                  (df_subset['revenu_annuel'] > mean_value * 0.8)]
-            
-            if len(just_below) > 0:
-                # Calculer combien d'observations doivent être déplacées
-                n_to_move = int(len(df_subset) * (current_pct - target_pct_below_mean) / 100)
-                n_to_move = min(n_to_move, len(just_below))
-                
-                if n_to_move > 0:
-                    # Sélectionner les observations à déplacer
-                    to_move = just_below.sample(n=n_to_move)
-                    
-                    # Augmenter ces revenus pour qu'ils soient au-dessus de la moyenne
-                    factor = 1.2  # Augmentation de 20%
-                    df_subset.loc[to_move.index, 'revenu_annuel'] = (df_subset.loc[to_move.index, 'revenu_annuel'] * factor).astype(int)
-    
-    return df_subset
-
-# Définir les pourcentages cibles
-target_pct_below_mean = 71.8
-target_pct_below_mean_urbain = 65.9
-target_pct_below_mean_rural = 85.4
+            # Revenus juste en-dessous de la moyenne, à augmenter de 20%
+            candidats = np.flatnonzero((revenus < mean_value) & (revenus > mean_value * 0.8))
+            n_to_move = int(len(revenus) * (current_pct - target_pct_below_mean) / 100)
+            factor = 1.2
+
+        n_to_move = min(n_to_move, len(candidats))
+        if n_to_move > 0:
+            to_move = rng.choice(candidats, n_to_move, replace=False)
+            revenus[to_move] = (revenus[to_move] * factor).astype(np.int64)
+
+    return revenus
+
+
+def calibrer_revenus_iteratif(revenus, urbain, rng):
+    """
+    Ajuste les moyennes puis la forme de la distribution par itérations
+    successives (méthode d'origine). `revenus` est modifié en place.
+    """
+    rural = ~urbain
+    for masque, target_mean, target_pct in [(urbain, target_urbain, target_pct_below_mean_urbain),
+                                            (rural, target_rural, target_pct_below_mean_rural)]:
+        sous_ensemble = revenus[masque]
+        if len(sous_ensemble) == 0:
+            continue
+        # Ajustement de la moyenne, puis de la forme de la distribution
+        sous_ensemble = (sous_ensemble * (target_mean / sous_ensemble.mean())).astype(np.int64)
+        ajuster_distribution_skew(sous_ensemble, target_pct, sous_ensemble.mean(), rng, iterations=10)
+        # Ajuster à nouveau pour atteindre exactement la moyenne cible
+        revenus[masque] = (sous_ensemble * (target_mean / sous_ensemble.mean())).astype(np.int64)
+    return revenus
+
+
+def construire_dataframe(donnees, date_enregistrement=None):
+    """Assemble les tableaux en DataFrame, les variables catégorielles en dtype category."""
+    modalites = {
+        'sexe': sexes,
+        'milieu': milieux,
+        'etat_matrimonial': etats_matrimoniaux,
+        'region': regions,
+        'niveau_education': niveaux_education,
+        'categorie_socioprofessionnelle': groupes_socio,
+        'categorie_age': categories_age,
+    }
+    n_samples = len(donnees['age'])
+    if date_enregistrement is None:
+        date_enregistrement = datetime.now().strftime('%Y-%m-%d')
+
+    colonnes = {}
+    for col, valeurs in donnees.items():
+        if col in modalites:
+            colonnes[col] = pd.Categorical.from_codes(valeurs, modalites[col])
+        else:
+            colonnes[col] = valeurs
+    colonnes['date_enregistrement'] = pd.Categorical.from_codes(
+        np.zeros(n_samples, dtype=np.int8), [date_enregistrement])
+
+    ordre = ['age', 'sexe', 'milieu', 'etat_matrimonial', 'region', 'niveau_education',
+             'categorie_socioprofessionnelle', 'taille_foyer', 'aide_sociale', 'a_acces_credit',
+             'a_retraite', 'possede_voiture', 'possede_logement', 'possede_terrain', 'categorie_age',
+             'annees_experience', 'revenu_annuel', 'age_en_mois', 'est_urbain', 'est_marie',
+             'id_utilisateur', 'date_enregistrement', 'code_postal']
+    return pd.DataFrame({col: colonnes[col] for col in ordre})
+
+
+# --- Génération par chunks, séquentielle ou répartie sur plusieurs processus ---
+
+# Taille des chunks de la génération en mémoire
+TAILLE_CHUNK_DEFAUT = 1000000
+
+
+def decouper(n_samples, taille_chunk, seed):
+    """
+    Liste des chunks (graine, indice, début, taille) couvrant n_samples lignes.
+    Chaque chunk reçoit un flux aléatoire indépendant issu de SeedSequence.spawn:
+    le résultat ne dépend que de la graine et de la taille des chunks, pas du
+    nombre de processus qui les génèrent.
+    """
+    debuts = range(0, n_samples, taille_chunk)
+    graines = np.random.SeedSequence(seed).spawn(len(debuts))
+    return [(graine, indice, debut, min(taille_chunk, n_samples - debut))
+            for indice, (graine, debut) in enumerate(zip(graines, debuts))]
+
 
-# Appliquer les ajustements de distribution
-df_urbain = df[df['milieu'] == 'Urbain'].copy()
-df_rural = df[df['milieu'] == 'Rural'].copy()
+def generer_chunk(graine, debut, taille):
+    """Génère un chunk non calibré; le même chunk est reproduit à l'identique à chaque appel."""
+    rng = np.random.default_rng(graine)
+    return ajouter_bruit(generer_donnees(taille, rng), rng, premier_id=debut + 1)
 
-df_urbain = ajuster_distribution_skew(df_urbain, target_pct_below_mean_urbain, urbain_mean_adj, iterations=10)
-df_rural = ajuster_distribution_skew(df_rural, target_pct_below_mean_rural, rural_mean_adj, iterations=10)
 
-# Recombiner les dataframes
-df = pd.concat([df_urbain, df_rural])
+def _tache_donnees(chunk):
+    graine, _, debut, taille = chunk
+    return generer_chunk(graine, debut, taille)
 
-# Vérifier les statistiques finales
-urbain_mean_final = df[df['milieu'] == 'Urbain']['revenu_annuel'].mean()
-rural_mean_final = df[df['milieu'] == 'Rural']['revenu_annuel'].mean()
-overall_mean_final = df['revenu_annuel'].mean()
 
-# Ajuster à nouveau pour atteindre exactement les moyennes cibles
-adjustment_urbain_final = target_urbain / urbain_mean_final
-adjustment_rural_final = target_rural / rural_mean_final
+def _tache_statistiques(chunk):
+    donnees = _tache_donnees(chunk)
+    statistiques = StatistiquesRevenus()
+    statistiques.ajouter(donnees['revenu_annuel'], donnees['milieu'])
+    return statistiques
 
-df.loc[df['milieu'] == 'Urbain', 'revenu_annuel'] = (df.loc[df['milieu'] == 'Urbain', 'revenu_annuel'] * adjustment_urbain_final).astype(int)
-df.loc[df['milieu'] == 'Rural', 'revenu_annuel'] = (df.loc[df['milieu'] == 'Rural', 'revenu_annuel'] * adjustment_rural_final).astype(int)
 
-# Recalculer les statistiques finales
-urbain_mean_final = df[df['milieu'] == 'Urbain']['revenu_annuel'].mean()
-rural_mean_final = df[df['milieu'] == 'Rural']['revenu_annuel'].mean()
-overall_mean_final = df['revenu_annuel'].mean()
+def _tache_ecriture(chunk, calibrateurs_milieu, ecrivain, date_enregistrement):
+    donnees = _tache_donnees(chunk)
+    appliquer_calibrateurs(donnees['revenu_annuel'], donnees['milieu'], calibrateurs_milieu)
+    statistiques = StatistiquesRevenus()
+    statistiques.ajouter(donnees['revenu_annuel'], donnees['milieu'])
+    ecrivain.ecrire(construire_dataframe(donnees, date_enregistrement), chunk[1])
+    return statistiques
 
-pct_below_mean_final = (df['revenu_annuel'] < overall_mean_final).mean() * 100
-pct_below_mean_urbain_final = (df[df['milieu'] == 'Urbain']['revenu_annuel'] < urbain_mean_final).mean() * 100
-pct_below_mean_rural_final = (df[df['milieu'] == 'Rural']['revenu_annuel'] < rural_mean_final).mean() * 100
 
-print(f"Revenu moyen global: {overall_mean_final:.2f} DH/an (Cible: {target_overall} DH/an)")
-print(f"Revenu moyen urbain: {urbain_mean_final:.2f} DH/an (Cible: {target_urbain} DH/an)")
-print(f"Revenu moyen rural: {rural_mean_final:.2f} DH/an (Cible: {target_rural} DH/an)")
-print(f"Pourcentage global sous la moyenne: {pct_below_mean_final:.1f}% (Cible: {target_pct_below_mean}%)")
-print(f"Pourcentage urbain sous la moyenne: {pct_below_mean_urbain_final:.1f}% (Cible: {target_pct_below_mean_urbain}%)")
-print(f"Pourcentage rural sous la moyenne: {pct_below_mean_rural_final:.1f}% (Cible: {target_pct_below_mean_rural}%)")
+def executer(tache, chunks, workers, *args):
+    """Applique la tâche à chaque chunk, dans l'ordre, sur `workers` processus."""
+    if workers <= 1:
+        return [tache(chunk, *args) for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(tache, chunks, *[[arg] * len(chunks) for arg in args]))
 
-# Sauvegarder le dataset
-df.to_csv('dataset_revenu_marocains.csv', index=False, encoding='utf-8')
-print(f"Dataset généré et sauvegardé avec {n_samples} enregistrements.")
 
-# Afficher un aperçu du dataset
-print("\nAperçu du dataset:")
-print(df.head())
+def cumuler(tache, chunks, workers, *args):
+    """
+    Applique la tâche à chaque chunk et fusionne les StatistiquesRevenus
+    retournées au fur et à mesure: au plus 2 * workers résultats en attente,
+    la mémoire ne dépend pas du nombre de chunks. La fusion est une somme
+    d'histogrammes entiers, le résultat ne dépend pas de l'ordre d'arrivée.
+    """
+    total = StatistiquesRevenus()
+    if workers <= 1:
+        for chunk in chunks:
+            total.fusionner(tache(chunk, *args))
+        return total
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        en_cours = set()
+        for chunk in chunks:
+            if len(en_cours) >= 2 * workers:
+                termines, en_cours = wait(en_cours, return_when=FIRST_COMPLETED)
+                for future in termines:
+                    total.fusionner(future.result())
+            en_cours.add(executor.submit(tache, chunk, *args))
+        for future in as_completed(en_cours):
+            total.fusionner(future.result())
+    return total
+
+
+def generer_dataset(n_samples=40000, seed=42, calibration='quantile',
+                    taille_chunk=TAILLE_CHUNK_DEFAUT, workers=1):
+    """Génère le dataset complet et calibré de n_samples individus, en mémoire."""
+    shards = executer(_tache_donnees, decouper(n_samples, taille_chunk, seed), workers)
+    donnees = {col: np.concatenate([shard[col] for shard in shards]) for col in shards[0]}
+    del shards
+    if calibration == 'iterative':
+        calibrer_revenus_iteratif(donnees['revenu_annuel'], donnees['milieu'] == 0,
+                                  np.random.default_rng(seed))
+    else:
+        calibrer_revenus(donnees['revenu_annuel'], donnees['milieu'])
+    return construire_dataframe(donnees)
+
+
+def generer_flux(n_samples, seed, taille_chunk, ecrivain, workers=1):
+    """
+    Génère n_samples lignes par chunks de taille_chunk et les transmet à
+    l'écrivain: la mémoire ne dépend que de la taille des chunks (et du
+    nombre de processus).
+
+    Les chunks étant reproductibles, la calibration se fait en deux passes sans
+    garder les données: la première cumule l'histogramme des revenus bruts de
+    tous les chunks, la seconde régénère chaque chunk, le calibre et l'écrit.
+    """
+    chunks = decouper(n_samples, taille_chunk, seed)
+    date_enregistrement = datetime.now().strftime('%Y-%m-%d')
+
+    # Passe 1: distribution des revenus bruts par milieu, fusionnée sur tous les chunks
+    brut = cumuler(_tache_statistiques, chunks, workers)
+
+    # Passe 2: calibration et écriture (chaque chunk est écrit sous son indice, dans n'importe quel ordre)
+    final = cumuler(_tache_ecriture, chunks, workers, calibrateurs(brut), ecrivain, date_enregistrement)
+    ecrivain.fermer(len(chunks))
+    return final
+
+
+class EcrivainParquet:
+    """Écrit chaque chunk dans un dataset Parquet partitionné (par défaut par région et milieu)."""
+
+    def __init__(self, dossier, partitions=('region', 'milieu')):
+        import pyarrow  # noqa: F401  (dépendance optionnelle)
+        self.dossier = dossier
+        self.partitions = list(partitions)
+
+    def ecrire(self, df, indice):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_to_dataset(table, self.dossier, partition_cols=self.partitions,
+                            basename_template=f"chunk-{indice:05d}-{{i}}.parquet")
+
+    def fermer(self, n_chunks):
+        pass
+
+
+class EcrivainCSV:
+    """
+    Écrit un unique fichier CSV compressé: chaque chunk est d'abord écrit dans
+    son propre fichier (ce qui permet l'écriture en parallèle), puis les
+    fichiers sont concaténés dans l'ordre (un flux gzip peut contenir
+    plusieurs membres).
+    """
 
-# Afficher les statistiques descriptives
-print("\nStatistiques descriptives du revenu annuel:")
-print(df['revenu_annuel'].describe())
\ No newline at end of file
+    def __init__(self, chemin, compression='gzip'):
+        self.chemin = chemin
+        self.compression = compression
+
+    def _partie(self, indice):
+        return f"{self.chemin}.part-{indice:05d}"
+
+    def ecrire(self, df, indice):
+        df.to_csv(self._partie(indice), header=indice == 0, index=False, encoding='utf-8',
+                  compression=self.compression)
+
+    def fermer(self, n_chunks):
+        with open(self.chemin, 'wb') as sortie:
+            for indice in range(n_chunks):
+                with open(self._partie(indice), 'rb') as partie:
+                    while bloc := partie.read(1 << 20):
+                        sortie.write(bloc)
+                os.remove(self._partie(indice))
+
+
+def creer_ecrivain(format_sortie, sortie):
+    if format_sortie == 'parquet':
+        try:
+            return EcrivainParquet(sortie)
+        except ImportError:
+            print("pyarrow n'est pas installé: écriture en CSV compressé")
+            sortie = f"{sortie}.csv.gz"
+    return EcrivainCSV(sortie)
+
+
+def statistiques_revenu(df):
+    """Moyennes et pourcentages sous la moyenne, global et par milieu."""
+    revenus = df['revenu_annuel'].to_numpy()
+    urbain = (df['milieu'] == 'Urbain').to_numpy()
+    stats = {}
+    for nom, valeurs in [('global', revenus), ('urbain', revenus[urbain]), ('rural', revenus[~urbain])]:
+        moyenne = valeurs.mean()
+        stats[nom] = (moyenne, (valeurs < moyenne).mean() * 100)
+    return stats
+
+
+def afficher_statistiques(stats):
+    cibles = [('global', target_overall, target_pct_below_mean),
+              ('urbain', target_urbain, target_pct_below_mean_urbain),
+              ('rural', target_rural, target_pct_below_mean_rural)]
+    for nom, target_mean, _ in cibles:
+        moyenne = stats[nom][0]
+        print(f"Revenu moyen {nom}: {moyenne:.2f} DH/an (Cible: {target_mean} DH/an, écart: {moyenne - target_mean:+.2f})")
+    for nom, _, target_pct in cibles:
+        pct = stats[nom][1]
+        print(f"Pourcentage {nom} sous la moyenne: {pct:.1f}% (Cible: {target_pct}%, écart: {pct - target_pct:+.1f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère le dataset simulé des revenus des marocains")
+    parser.add_argument("--n-samples", type=int, default=40000, help="Nombre d'enregistrements")
+    parser.add_argument("--seed", type=int, default=42, help="Graine du générateur aléatoire")
+    parser.add_argument("--sortie", default="dataset_revenu_marocains.csv",
+                        help="Fichier CSV de sortie (dossier en mode flux Parquet)")
+    parser.add_argument("--calibration", choices=["quantile", "iterative"], default="quantile",
+                        help="Calibration en forme fermée (quantiles) ou itérative d'origine (hors mode flux)")
+    parser.add_argument("--taille-chunk", type=int, default=None,
+                        help="Active la génération en flux par chunks de cette taille (mémoire constante)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de processus de génération (résultat identique quel que soit ce nombre)")
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet",
+                        help="Format de sortie du mode flux: Parquet partitionné par région et milieu, "
+                             "ou CSV compressé (gzip)")
+    args = parser.parse_args()
+
+    if args.taille_chunk:
+        debut = time.perf_counter()
+        stats = generer_flux(args.n_samples, args.seed, args.taille_chunk,
+                             creer_ecrivain(args.format, args.sortie), args.workers)
+        duree = time.perf_counter() - debut
+        afficher_statistiques(stats.resume())
+        print(f"Dataset généré en flux ({duree:.2f} s) et sauvegardé avec {args.n_samples} enregistrements.")
+        return
+
+    debut = time.perf_counter()
+    df = generer_dataset(args.n_samples, args.seed, args.calibration, workers=args.workers)
+    duree = time.perf_counter() - debut
+    afficher_statistiques(statistiques_revenu(df))
+
+    # Sauvegarder le dataset
+    df.to_csv(args.sortie, index=False, encoding='utf-8')
+    print(f"Dataset généré ({duree:.2f} s) et sauvegardé avec {args.n_samples} enregistrements.")
+
+    # Afficher un aperçu du dataset
+    print("\nAperçu du dataset:")
+    print(df.head())
+
+    # Afficher les statistiques descriptives
+    print("\nStatistiques descriptives du revenu annuel:")
+    print(df['revenu_annuel'].describe())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Entraînement incrémental: intègre un nouveau lot d'enquêtes au modèle
+sauvegardé par train.py sans tout réentraîner.
+
+Le réentraînement complet recharge tout le CSV, impute avec les médianes et
+modes de toutes les données, applique l'IsolationForest à l'ensemble puis
+relance la recherche d'hyperparamètres. Ici, pour chaque lot:
+  - les doublons sont retirés, y compris ceux déjà vus dans les lots précédents
+    (empreintes des lignes conservées dans l'état);
+  - les valeurs manquantes sont remplacées par les médianes et modes cumulés
+    (StatistiquesCourantes de cleaning.py);
+  - l'IsolationForest et l'attribution de `weight` (0.5 / 1.0) ne portent que
+    sur le lot, comme nettoyer() de train.py sur ses propres données;
+  - les imputeurs du pipeline reprennent les statistiques cumulées et le
+    StandardScaler est mis à jour avec partial_fit; les seuils des arbres
+    existants sur les colonnes numériques sont recalés sur la nouvelle échelle,
+    leurs prédictions restent donc identiques;
+  - la forêt grandit de `arbres_par_lot` arbres entraînés sur le lot seul
+    (warm_start); avec `arbres_max`, les arbres les plus anciens sont retirés
+    (ensemble glissant, qui suit les dérives des données).
+
+SelectKBest et les encodeurs restent ceux de l'entraînement initial. L'état
+(statistiques cumulées, empreintes, historique des lots) est sauvegardé à côté
+du modèle, sous `<modele>.incremental.joblib`. Le modèle mis à jour remplace
+le fichier de façon atomique: le registre de l'API le recharge à chaud. Les
+fichiers dérivés (moteur exporté, table précalculée) sont à reconstruire.
+
+Usage:
+    python incremental.py --initialiser dataset_revenu_marocains.csv [--modele modele_selection.joblib]
+    python incremental.py lot.csv [--modele modele_selection.joblib] [--arbres 20] [--arbres-max 200]
+"""
+import argparse
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+
+from cleaning import EnsembleEmpreintes, StatistiquesCourantes, empreintes_lignes
+from train import charger_configuration, cible, nettoyer
+
+
+def chemin_etat(chemin_modele):
+    return os.path.splitext(chemin_modele)[0] + '.incremental.joblib'
+
+
+class EtatIncremental:
+    """Ce qui doit survivre d'un lot à l'autre, sauvegardé à côté du modèle."""
+
+    def __init__(self, taille_reservoir=10000, random_state=42):
+        self.random_state = random_state
+        # Statistiques des données brutes (nettoyage) et des caractéristiques nettoyées (imputeurs du pipeline)
+        self.brutes = StatistiquesCourantes(taille_reservoir, random_state)
+        self.nettoyees = StatistiquesCourantes(taille_reservoir, random_state + 1)
+        self.empreintes = EnsembleEmpreintes()
+        self.n_lignes = 0
+        self.historique = []
+
+    def retirer_doublons(self, df):
+        """Retire les lignes déjà vues (dans ce lot ou un lot précédent) et mémorise les nouvelles."""
+        return df[self.empreintes.filtrer(empreintes_lignes(df))]
+
+    def nettoyer_lot(self, df, random_state):
+        df = self.retirer_doublons(df)
+        if df.empty:
+            return df
+        self.brutes.observer(df)
+        df = nettoyer(df, random_state, valeurs_manquantes=self.brutes.valeurs())
+        self.nettoyees.observer(df.drop(columns=[cible]))
+        self.n_lignes += len(df)
+        return df
+
+    @classmethod
+    def initialiser(cls, df, taille_reservoir=10000, random_state=42):
+        """État correspondant aux données d'entraînement du modèle initial."""
+        etat = cls(taille_reservoir, random_state)
+        etat.nettoyer_lot(df, random_state)
+        return etat
+
+    def sauvegarder(self, chemin):
+        temporaire = chemin + '.tmp'
+        joblib.dump(self, temporaire)
+        os.replace(temporaire, chemin)
+
+
+def _etape(pipeline, nom):
+    return pipeline.named_steps['preprocessor'].named_transformers_[nom]
+
+
+def mettre_a_jour_pretraitement(pipeline, X, etat):
+    """
+    Imputeurs sur les statistiques cumulées, StandardScaler mis à jour avec X.
+    Retourne (moyennes, échelles) du scaler avant la mise à jour.
+    """
+    preprocesseur = pipeline.named_steps['preprocessor']
+    valeurs = etat.nettoyees.valeurs()
+    for nom, transformeur, colonnes in preprocesseur.transformers_:
+        if hasattr(transformeur, 'named_steps') and 'imputer' in transformeur.named_steps:
+            imputeur = transformeur.named_steps['imputer']
+            imputeur.statistics_ = np.array(
+                [valeurs.get(col, ancienne) for col, ancienne in zip(colonnes, imputeur.statistics_)],
+                dtype=imputeur.statistics_.dtype)
+
+    numerique = _etape(pipeline, 'num')
+    scaler = numerique.named_steps['scaler']
+    anciennes = scaler.mean_.copy(), scaler.scale_.copy()
+    colonnes = next(colonnes for nom, _, colonnes in preprocesseur.transformers_ if nom == 'num')
+    scaler.partial_fit(numerique.named_steps['imputer'].transform(X[colonnes]))
+    return anciennes
+
+
+def recaler_seuils(pipeline, anciennes):
+    """
+    Ramène les seuils des arbres sur les colonnes numériques standardisées à
+    l'échelle courante du scaler: x <= s devient x' <= (s * e + m - m') / e'.
+
+    Un nœud qui n'a vu que des âges 26 et 28 coupe exactement à 27: l'entrée
+    égale au seuil part d'un côté ou de l'autre selon l'arrondi float32 des
+    arbres. Pour ces seuils entiers, le nouveau seuil garde l'entrée du même
+    côté qu'avant, et les prédictions restent identiques.
+    """
+    moyennes, echelles = anciennes
+    scaler = _etape(pipeline, 'num').named_steps['scaler']
+    tranche = pipeline.named_steps['preprocessor'].output_indices_['num']
+    selection = pipeline.named_steps['feature_selection'].get_support(indices=True)
+    recalages = {k: sortie - tranche.start for k, sortie in enumerate(selection)
+                 if tranche.start <= sortie < tranche.stop}
+    for arbre in pipeline.named_steps['regressor'].estimators_:
+        caracteristiques = arbre.tree_.feature
+        seuils = arbre.tree_.threshold
+        for k, j in recalages.items():
+            noeuds = np.flatnonzero(caracteristiques == k)
+            bruts = seuils[noeuds] * echelles[j] + moyennes[j]
+            nouveaux = (bruts - scaler.mean_[j]) / scaler.scale_[j]
+            entiers = np.abs(bruts - np.round(bruts)) < 1e-5
+            valeurs = np.round(bruts[entiers])
+            gauche = ((valeurs - moyennes[j]) / echelles[j]).astype(np.float32) <= seuils[noeuds[entiers]]
+            x = ((valeurs - scaler.mean_[j]) / scaler.scale_[j]).astype(np.float32)
+            nouveaux[entiers] = np.where(gauche, x, np.nextafter(x, np.float32(-np.inf)))
+            seuils[noeuds] = nouveaux
+
+
+def agrandir_foret(foret, X, y, n_arbres, arbres_max=None):
+    """Ajoute n_arbres arbres entraînés sur (X, y); garde au plus arbres_max arbres, les plus récents."""
+    foret.set_params(warm_start=True, n_estimators=len(foret.estimators_) + n_arbres)
+    foret.fit(X, y)
+    foret.set_params(warm_start=False)
+    if arbres_max and len(foret.estimators_) > arbres_max:
+        foret.estimators_ = foret.estimators_[-arbres_max:]
+        foret.set_params(n_estimators=arbres_max)
+    return foret
+
+
+def integrer_lot(pipeline, etat, lot, n_arbres=20, arbres_max=None):
+    """
+    Intègre le DataFrame brut `lot` au pipeline (modifié sur place) et à l'état.
+    Retourne la description de la mise à jour, ajoutée à l'historique de l'état.
+    """
+    foret = pipeline.named_steps['regressor']
+    if not isinstance(foret, (RandomForestRegressor, ExtraTreesRegressor)):
+        raise ValueError(f"Entraînement incrémental réservé aux forêts, pas à {type(foret).__name__}")
+    durees = {}
+    debut = time.perf_counter()
+    random_state = etat.random_state + len(etat.historique) + 1
+    n_brut = len(lot)
+    df = etat.nettoyer_lot(lot, random_state)
+    durees['nettoyage'] = time.perf_counter() - debut
+    if df.empty:
+        raise ValueError("Aucune ligne nouvelle dans le lot")
+
+    debut = time.perf_counter()
+    X = df.drop(columns=[cible])
+    anciennes = mettre_a_jour_pretraitement(pipeline, X, etat)
+    recaler_seuils(pipeline, anciennes)
+    durees['pretraitement'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    agrandir_foret(foret, pipeline[:-1].transform(X), df[cible].to_numpy(), n_arbres, arbres_max)
+    durees['arbres'] = time.perf_counter() - debut
+
+    description = {
+        'lot': len(etat.historique) + 1,
+        'lignes': n_brut,
+        'lignes_retenues': len(df),
+        'poids_reduits': int((df['weight'] < 1).sum()),
+        'arbres': len(foret.estimators_),
+        'n_lignes_cumulees': etat.n_lignes,
+        'durees': durees,
+    }
+    etat.historique.append(description)
+    return description
+
+
+def sauvegarder_modele(pipeline, chemin):
+    temporaire = chemin + '.tmp'
+    joblib.dump(pipeline, temporaire)
+    os.replace(temporaire, chemin)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intègre un lot d'enquêtes au modèle sans réentraînement complet")
+    parser.add_argument("lot", nargs="?", help="CSV du nouveau lot (mêmes colonnes que le dataset)")
+    parser.add_argument("--config", help="Fichier JSON qui remplace des clés de la configuration par défaut")
+    parser.add_argument("--modele", help="Pipeline à mettre à jour (défaut: sortie_modele de la configuration)")
+    parser.add_argument("--etat", help="Fichier d'état (défaut: <modele>.incremental.joblib)")
+    parser.add_argument("--initialiser", metavar="CSV",
+                        help="Crée l'état à partir des données d'entraînement du modèle")
+    parser.add_argument("--arbres", type=int, help="Arbres ajoutés par lot")
+    parser.add_argument("--arbres-max", type=int, help="Nombre maximal d'arbres (les plus anciens sont retirés)")
+    parser.add_argument("--sortie", help="Fichier du modèle mis à jour (défaut: remplace --modele)")
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    configuration = charger_configuration(args.config)
+    parametres = configuration['incremental']
+    chemin_modele = args.modele or configuration['sortie_modele']
+    etat_chemin = args.etat or chemin_etat(chemin_modele)
+
+    if args.initialiser:
+        debut = time.perf_counter()
+        etat = EtatIncremental.initialiser(pd.read_csv(args.initialiser), parametres['taille_reservoir'],
+                                           configuration['random_state'])
+        etat.sauvegarder(etat_chemin)
+        print(f"État initialisé sur {etat.n_lignes} lignes en {time.perf_counter() - debut:.1f} s: '{etat_chemin}'")
+        return
+    if not args.lot:
+        parser.error("indiquer le CSV du lot, ou --initialiser")
+    if not os.path.exists(etat_chemin):
+        parser.error(f"état '{etat_chemin}' absent: lancer d'abord --initialiser avec les données d'entraînement")
+
+    pipeline = joblib.load(chemin_modele)
+    etat = joblib.load(etat_chemin)
+    debut = time.perf_counter()
+    try:
+        description = integrer_lot(pipeline, etat, pd.read_csv(args.lot),
+                                   args.arbres or parametres['arbres_par_lot'],
+                                   args.arbres_max or parametres['arbres_max'])
+    except ValueError as e:
+        parser.exit(1, f"Lot '{args.lot}' non intégré: {e}\n")
+    duree = time.perf_counter() - debut
+    sauvegarder_modele(pipeline, args.sortie or chemin_modele)
+    etat.sauvegarder(etat_chemin)
+    print(f"Lot {description['lot']}: {description['lignes_retenues']}/{description['lignes']} lignes retenues, "
+          f"{description['poids_reduits']} à poids réduit, {description['arbres']} arbres ({duree:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Traitements asynchrones de gros fichiers (jobs) pour l'API.
+
+Un job prédit un fichier complet (CSV, éventuellement compressé, ou Parquet)
+avec score.py: lecture par chunks, prédictions écrites au fur et à mesure dans
+un CSV, reprise après le dernier chunk terminé. Les jobs sont enregistrés dans
+une file SQLite (`<dossier>/jobs.sqlite3`), avec leurs fichiers dans
+`<dossier>/<id>/`: la file survit aux redémarrages et peut être partagée par
+plusieurs processus (workers uvicorn, ou `python jobs.py` dédié).
+
+Chaque processus exécute au plus `n_workers` jobs à la fois, dans des threads
+d'arrière-plan, avec la version du modèle fixée à la soumission. Un job en
+cours dont le processus a disparu (redémarrage, arrêt brutal) ou qui n'a pas
+avancé depuis `expiration` secondes est remis en file et reprend où il
+s'était arrêté; après TENTATIVES_MAX tentatives il passe en échec. Chaque
+thread réserve les jobs sous son propre nom (`hôte:pid/n`) et ne met à jour un
+job que tant qu'il en est le propriétaire: un worker dont le job a été remis en
+file s'arrête au chunk suivant, sans toucher à l'état fixé par le nouveau.
+
+La file est bornée: au-delà de `capacite` jobs en attente, soumettre() lève
+FilePleine (l'API répond 429).
+
+Usage (worker dédié, sans servir l'API: API_JOBS_WORKERS=0 côté API):
+    python jobs.py
+"""
+import os
+import shutil
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from logging_config import obtenir_logger
+from score import TAILLE_CHUNK_DEFAUT, scorer
+
+logger = obtenir_logger("jobs")
+
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ECHEC = "echec"
+
+TENTATIVES_MAX = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    etat TEXT NOT NULL,
+    entree TEXT NOT NULL,
+    sortie TEXT NOT NULL,
+    version TEXT,
+    taille_chunk INTEGER NOT NULL,
+    conserver INTEGER NOT NULL DEFAULT 0,
+    cree_le REAL NOT NULL,
+    debut REAL,
+    fin REAL,
+    debut_execution REAL,
+    lignes_execution INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    lignes INTEGER NOT NULL DEFAULT 0,
+    tentatives INTEGER NOT NULL DEFAULT 0,
+    proprietaire TEXT,
+    battement REAL,
+    erreur TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_etat ON jobs (etat, cree_le);
+"""
+
+
+class FilePleine(Exception):
+    """Trop de jobs en attente: la soumission est refusée."""
+
+
+class JobInterrompu(Exception):
+    """
+    Arrêt demandé pendant un job: il est remis en file et reprendra. Si
+    `repris`, le job a déjà été remis en file (et peut-être réservé par un
+    autre worker): il est abandonné tel quel.
+    """
+
+    def __init__(self, repris=False):
+        super().__init__()
+        self.repris = repris
+
+
+def extension_fichier(entete):
+    """Extension d'un fichier envoyé, d'après ses premiers octets."""
+    if entete.startswith(b"PAR1"):
+        return ".parquet"
+    if entete.startswith(b"\x1f\x8b"):
+        return ".csv.gz"
+    return ".csv"
+
+
+def _processus_actif(proprietaire):
+    """Faux si le propriétaire `hôte:pid/n` est sur cette machine et que son processus n'existe plus."""
+    hote, _, pid = proprietaire.partition("/")[0].rpartition(":")
+    if hote != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+class FileJobs:
+    def __init__(self, dossier, capacite=20, expiration=300.0, retention=86400.0):
+        """
+        capacite: nombre maximal de jobs en attente.
+        expiration: secondes sans progression après lesquelles un job en cours est remis en file.
+        retention: secondes pendant lesquelles un job terminé (ou en échec) et ses fichiers sont conservés.
+        """
+        self.dossier = dossier
+        self.chemin = os.path.join(dossier, "jobs.sqlite3")
+        self.capacite = capacite
+        self.expiration = expiration
+        self.retention = retention
+        self._initialisee = False
+
+    def _connecter(self):
+        if not self._initialisee:
+            os.makedirs(self.dossier, exist_ok=True)
+            connexion = sqlite3.connect(self.chemin, timeout=30, isolation_level=None)
+            try:
+                connexion.execute("PRAGMA journal_mode=WAL")
+                connexion.executescript(SCHEMA)
+            finally:
+                connexion.close()
+            self._initialisee = True
+        connexion = sqlite3.connect(self.chemin, timeout=30, isolation_level=None)
+        connexion.row_factory = sqlite3.Row
+        return connexion
+
+    @contextmanager
+    def _transaction(self):
+        # Une connexion par opération: utilisable depuis n'importe quel thread.
+        # BEGIN IMMEDIATE sérialise les écritures entre processus.
+        connexion = self._connecter()
+        try:
+            connexion.execute("BEGIN IMMEDIATE")
+            try:
+                yield connexion
+            except BaseException:
+                connexion.execute("ROLLBACK")
+                raise
+            connexion.execute("COMMIT")
+        finally:
+            connexion.close()
+
+    def nouveau_dossier(self):
+        """Identifiant d'un nouveau job et dossier de ses fichiers."""
+        identifiant = uuid.uuid4().hex
+        dossier = os.path.join(self.dossier, identifiant)
+        os.makedirs(dossier)
+        return identifiant, dossier
+
+    def pleine(self):
+        with self._transaction() as connexion:
+            return self._n_en_attente(connexion) >= self.capacite
+
+    def _n_en_attente(self, connexion):
+        return connexion.execute("SELECT COUNT(*) FROM jobs WHERE etat = ?", (EN_ATTENTE,)).fetchone()[0]
+
+    def soumettre(self, identifiant, entree, version, taille_chunk=TAILLE_CHUNK_DEFAUT, conserver=False):
+        """Met un job en file; lève FilePleine si la file est pleine."""
+        sortie = os.path.join(self.dossier, identifiant, "resultats.csv")
+        with self._transaction() as connexion:
+            if self._n_en_attente(connexion) >= self.capacite:
+                raise FilePleine(f"{self.capacite} jobs déjà en attente")
+            connexion.execute(
+                "INSERT INTO jobs (id, etat, entree, sortie, version, taille_chunk, conserver, cree_le) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (identifiant, EN_ATTENTE, entree, sortie, version, taille_chunk, int(conserver), time.time()),
+            )
+        return self.obtenir(identifiant)
+
+    def reserver(self, proprietaire):
+        """Passe le plus ancien job en attente en cours pour `proprietaire`; None si la file est vide."""
+        maintenant = time.time()
+        with self._transaction() as connexion:
+            ligne = connexion.execute(
+                "SELECT id FROM jobs WHERE etat = ? ORDER BY cree_le LIMIT 1", (EN_ATTENTE,)).fetchone()
+            if ligne is None:
+                return None
+            connexion.execute(
+                "UPDATE jobs SET etat = ?, proprietaire = ?, battement = ?, debut = COALESCE(debut, ?), "
+                "debut_execution = ?, lignes_execution = lignes, tentatives = tentatives + 1 WHERE id = ?",
+                (EN_COURS, proprietaire, maintenant, maintenant, maintenant, ligne["id"]),
+            )
+            return dict(connexion.execute("SELECT * FROM jobs WHERE id = ?", (ligne["id"],)).fetchone())
+
+    # Les mises à jour d'un job en cours ne s'appliquent que si `proprietaire` le détient encore:
+    # recuperer_orphelins() peut l'avoir remis en file pendant son exécution
+
+    def avancer(self, identifiant, proprietaire, chunks, lignes):
+        """Enregistre l'avancement; retourne 0 si le job n'appartient plus à `proprietaire`."""
+        with self._transaction() as connexion:
+            return connexion.execute(
+                "UPDATE jobs SET chunks = ?, lignes = ?, battement = ? WHERE id = ? AND proprietaire = ?",
+                (chunks, lignes, time.time(), identifiant, proprietaire)).rowcount
+
+    def terminer(self, identifiant, proprietaire):
+        with self._transaction() as connexion:
+            connexion.execute("UPDATE jobs SET etat = ?, fin = ?, proprietaire = NULL "
+                              "WHERE id = ? AND proprietaire = ?",
+                              (TERMINE, time.time(), identifiant, proprietaire))
+
+    def echouer(self, identifiant, proprietaire, message):
+        with self._transaction() as connexion:
+            connexion.execute("UPDATE jobs SET etat = ?, fin = ?, erreur = ?, proprietaire = NULL "
+                              "WHERE id = ? AND proprietaire = ?",
+                              (ECHEC, time.time(), message, identifiant, proprietaire))
+
+    def remettre(self, identifiant, proprietaire):
+        """
+        Remet en file un job interrompu proprement (arrêt du processus), avant
+        les jobs soumis après lui; l'exécution interrompue ne compte pas comme une tentative.
+        """
+        with self._transaction() as connexion:
+            connexion.execute("UPDATE jobs SET etat = ?, proprietaire = NULL, tentatives = tentatives - 1 "
+                              "WHERE id = ? AND etat = ? AND proprietaire = ?",
+                              (EN_ATTENTE, identifiant, EN_COURS, proprietaire))
+
+    def recuperer_orphelins(self):
+        """
+        Remet en file les jobs en cours dont le processus a disparu ou qui
+        n'avancent plus; retourne leur nombre.
+        """
+        limite = time.time() - self.expiration
+        n = 0
+        with self._transaction() as connexion:
+            for job in connexion.execute("SELECT * FROM jobs WHERE etat = ?", (EN_COURS,)).fetchall():
+                if _processus_actif(job["proprietaire"] or "") and job["battement"] >= limite:
+                    continue
+                if job["tentatives"] >= TENTATIVES_MAX:
+                    connexion.execute(
+                        "UPDATE jobs SET etat = ?, fin = ?, proprietaire = NULL, erreur = ? WHERE id = ?",
+                        (ECHEC, time.time(), f"Interrompu {job['tentatives']} fois", job["id"]))
+                else:
+                    connexion.execute("UPDATE jobs SET etat = ?, proprietaire = NULL WHERE id = ?",
+                                      (EN_ATTENTE, job["id"]))
+                n += 1
+        return n
+
+    def purger(self):
+        """Supprime les jobs terminés depuis plus de `retention` secondes, avec leurs fichiers."""
+        with self._transaction() as connexion:
+            anciens = [ligne["id"] for ligne in connexion.execute(
+                "SELECT id FROM jobs WHERE etat IN (?, ?) AND fin < ?",
+                (TERMINE, ECHEC, time.time() - self.retention))]
+            connexion.executemany("DELETE FROM jobs WHERE id = ?", [(identifiant,) for identifiant in anciens])
+        for identifiant in anciens:
+            shutil.rmtree(os.path.join(self.dossier, identifiant), ignore_errors=True)
+        return len(anciens)
+
+    def obtenir(self, identifiant):
+        """État d'un job (dict), ou None s'il est inconnu."""
+        with self._transaction() as connexion:
+            ligne = connexion.execute("SELECT * FROM jobs WHERE id = ?", (identifiant,)).fetchone()
+            if ligne is None:
+                return None
+            job = dict(ligne)
+            if job["etat"] == EN_ATTENTE:
+                job["position"] = connexion.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE etat = ? AND cree_le < ?",
+                    (EN_ATTENTE, job["cree_le"])).fetchone()[0]
+        return job
+
+    def compter(self):
+        """Nombre de jobs par état."""
+        with self._transaction() as connexion:
+            comptes = dict(connexion.execute("SELECT etat, COUNT(*) FROM jobs GROUP BY etat").fetchall())
+        return {etat: comptes.get(etat, 0) for etat in (EN_ATTENTE, EN_COURS, TERMINE, ECHEC)}
+
+
+def decrire(job):
+    """Vue publique d'un job: avancement et débit de l'exécution en cours (ou de la dernière)."""
+    fin = job["fin"] if job["fin"] is not None else time.time()
+    duree = fin - job["debut_execution"] if job["debut_execution"] is not None else None
+    lignes_execution = job["lignes"] - job["lignes_execution"]
+    return {
+        "id": job["id"],
+        "etat": job["etat"],
+        "version": job["version"],
+        "position": job.get("position"),
+        "chunks_termines": job["chunks"],
+        "lignes_predites": job["lignes"],
+        "debit_lignes_s": lignes_execution / duree if duree else None,
+        "duree_s": fin - job["debut"] if job["debut"] is not None else None,
+        "tentatives": job["tentatives"],
+        "cree_le": job["cree_le"],
+        "termine_le": job["fin"],
+        "erreur": job["erreur"],
+    }
+
+
+class ExecuteurJobs:
+    """Threads d'arrière-plan qui exécutent les jobs de la file, au plus `n_workers` à la fois."""
+
+    def __init__(self, file, obtenir_version, n_workers=1, pret=None, intervalle=1.0):
+        """
+        obtenir_version: nom -> version du modèle (VersionModele: predicteur et chemin); lève KeyError si inconnue.
+        pret: fonction indiquant si le modèle est chargé; les jobs attendent qu'il le soit.
+        """
+        self.file = file
+        self.obtenir_version = obtenir_version
+        self.n_workers = n_workers
+        self.pret = pret
+        self.intervalle = intervalle
+        self.proprietaire = f"{socket.gethostname()}:{os.getpid()}"
+        self._arret = threading.Event()
+        self._threads = []
+        self._derniere_maintenance = 0.0
+
+    def demarrer(self):
+        n = self.file.recuperer_orphelins()
+        if n:
+            logger.info(f"{n} jobs interrompus remis en file")
+        self._arret.clear()
+        self._threads = [threading.Thread(target=self._boucle, args=(f"{self.proprietaire}/{i}",),
+                                          name=f"job-{i}", daemon=True)
+                         for i in range(self.n_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def arreter(self, attente=30.0):
+        """Interrompt les jobs en cours après leur chunk courant; ils reprendront au prochain démarrage."""
+        self._arret.set()
+        for thread in self._threads:
+            thread.join(attente)
+        self._threads = []
+
+    def _boucle(self, proprietaire):
+        while not self._arret.is_set():
+            try:
+                job = None
+                if self.pret is None or self.pret():
+                    job = self.file.reserver(proprietaire)
+                if job is None:
+                    self._maintenance()
+                    self._arret.wait(self.intervalle)
+                    continue
+                self.executer(job)
+            except Exception as e:
+                # Erreur de la file elle-même (disque plein, base verrouillée...): réessayer plus tard
+                logger.error(f"Erreur de la file des jobs: {e}")
+                self._arret.wait(self.intervalle)
+
+    def _maintenance(self):
+        # Jobs abandonnés par d'autres processus et jobs expirés, au plus une fois par minute
+        maintenant = time.monotonic()
+        if maintenant - self._derniere_maintenance < 60:
+            return
+        self._derniere_maintenance = maintenant
+        self.file.recuperer_orphelins()
+        self.file.purger()
+
+    def executer(self, job):
+        identifiant, proprietaire = job["id"], job["proprietaire"]
+
+        def progression(chunks, lignes):
+            if not self.file.avancer(identifiant, proprietaire, chunks, lignes):
+                raise JobInterrompu(repris=True)
+            if self._arret.is_set():
+                raise JobInterrompu()
+
+        logger.info(f"Job {identifiant}: début (tentative {job['tentatives']}, "
+                    f"{job['lignes']} lignes déjà prédites)")
+        try:
+            version = self.obtenir_version(job["version"])
+        except KeyError:
+            self.file.echouer(identifiant, proprietaire, f"Version du modèle inconnue: {job['version']}")
+            return
+        except Exception as e:
+            self.file.echouer(identifiant, proprietaire,
+                              f"Erreur lors du chargement de la version {job['version']}: {e}")
+            return
+
+        try:
+            scorer(job["entree"], job["sortie"], version.chemin, job["taille_chunk"],
+                   conserver=bool(job["conserver"]), modele=version.predicteur, progression=progression)
+        except JobInterrompu as e:
+            if e.repris:
+                logger.warning(f"Job {identifiant}: remis en file pendant son exécution (sans progression "
+                               f"depuis {self.file.expiration:g} s), abandonné")
+            else:
+                self.file.remettre(identifiant, proprietaire)
+                logger.info(f"Job {identifiant}: interrompu, remis en file")
+        except Exception as e:
+            self.file.echouer(identifiant, proprietaire, str(e))
+            logger.error(f"Job {identifiant}: échec: {e}")
+        else:
+            self.file.terminer(identifiant, proprietaire)
+            logger.info(f"Job {identifiant}: terminé")
+
+
+def main():
+    # Même configuration (variables d'environnement) que l'API
+    import api
+
+    executeur = ExecuteurJobs(api.file_jobs, api.registre.obtenir, max(1, api.JOBS_WORKERS),
+                              pret=lambda: api.registre.active is not None)
+    arret = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: arret.set())
+    signal.signal(signal.SIGINT, lambda *_: arret.set())
+    api.registre.demarrer()
+    executeur.demarrer()
+    logger.info(f"{executeur.n_workers} workers sur la file {api.file_jobs.chemin}")
+    arret.wait()
+    executeur.arreter()
+    api.registre.arreter()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Configuration de la journalisation de l'API.
+
+Le niveau est réglé par API_LOG_NIVEAU (INFO par défaut). Les messages de
+niveau DEBUG et INFO émis sur le chemin des requêtes peuvent être échantillonnés
+(API_LOG_ECHANTILLON, fraction conservée entre 0 et 1); les avertissements et
+les erreurs sont toujours conservés.
+"""
+import logging
+import os
+import random
+
+NIVEAU = os.environ.get("API_LOG_NIVEAU", "INFO").upper()
+TAUX_ECHANTILLONNAGE = float(os.environ.get("API_LOG_ECHANTILLON", "0.01"))
+
+
+class FiltreEchantillonnage(logging.Filter):
+    """Ne conserve qu'une fraction des messages marqués `echantillonne=True`."""
+
+    def __init__(self, taux):
+        super().__init__()
+        self.taux = taux
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, "echantillonne", False):
+            return True
+        return random.random() < self.taux
+
+
+def obtenir_logger(nom):
+    logger = logging.getLogger(nom)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handler.addFilter(FiltreEchantillonnage(TAUX_ECHANTILLONNAGE))
+        logger.addHandler(handler)
+        logger.setLevel(NIVEAU)
+        logger.propagate = False
+    return logger
+
+
+# Argument `extra` à passer aux messages du chemin des requêtes; leurs valeurs
+# sont passées en arguments (style %), formatées seulement si le message est émis
+ECHANTILLONNE = {"echantillonne": True}
@@ -0,0 +1,319 @@
+"""
+Table précalculée des prédictions pour l'espace d'entrée énumérable.
+
+Le modèle ne lit que les attributs qui alimentent les caractéristiques
+retenues par SelectKBest. Hors des attributs numériques continus, ce sont des
+indicateurs binaires ou des catégories peu nombreuses, et les curseurs de
+app.py bornent les numériques à des entiers (âge 18-80, expérience 0-50):
+l'ensemble des entrées possibles est fini. Ce module prédit une fois pour
+toutes chaque combinaison et range les prédictions dans un tableau NumPy
+(float32), indexé par une clé en base mixte:
+
+    cle = somme(chiffre(attribut) * pas(attribut))
+
+où chiffre(attribut) est la position de la valeur dans le domaine de l'axe.
+Les catégories qui produisent les mêmes caractéristiques (par exemple les
+régions autres que celles retenues par SelectKBest) partagent un chiffre.
+
+L'API projette le tableau en mémoire (mmap, partagé entre les workers) et
+répond par une simple lecture; une requête hors de la grille (valeur
+manquante, non entière, hors domaine, catégorie inconnue) est prédite par le
+modèle.
+
+Fichiers écrits à côté du modèle: `<modele>.table.npy` (prédictions) et
+`<modele>.table.json` (axes et prédictions de contrôle: l'API vérifie au
+chargement que la table correspond au modèle).
+
+Usage:
+    python lookup_table.py modele_selection.joblib [--domaine age=18:80] [--domaine weight=1.0]
+"""
+import argparse
+import json
+import math
+import os
+import time
+from types import SimpleNamespace
+
+import joblib
+import numpy as np
+
+from compiled_model import _decrire_sorties, caracteristiques_selectionnees
+
+# Domaines des attributs numériques: curseurs de app.py et poids par défaut;
+# les autres attributs numériques sont des indicateurs 0/1
+DOMAINES_DEFAUT = {
+    'age': list(range(18, 81)),
+    'annees_experience': list(range(0, 51)),
+    'taille_foyer': list(range(1, 11)),
+    'weight': [1.0],
+}
+DOMAINE_INDICATEUR = [0, 1]
+TAILLE_BLOC = 1 << 16
+N_CONTROLES = 32
+
+
+def chemin_table(chemin_modele):
+    """Base des fichiers de la table d'un modèle (pipeline ou moteur exporté)."""
+    base = chemin_modele.removesuffix('.joblib').removesuffix('.moteur')
+    return f"{base}.table"
+
+
+def decrire_axes(pipeline, domaines=None):
+    """
+    Un axe par attribut lu par le modèle, dans l'ordre de ses caractéristiques:
+    {'attribut', 'type', 'valeurs' (numérique) ou 'classes' (catégorie -> chiffre),
+     'positions' (caractéristiques alimentées), 'codes' (caractéristiques de chaque chiffre)}.
+    """
+    domaines = dict(DOMAINES_DEFAUT, **(domaines or {}))
+    sorties = caracteristiques_selectionnees(pipeline)
+
+    # Toutes les catégories connues du préprocesseur, y compris celles dont
+    # aucune colonne one-hot n'a été retenue
+    categories = {}
+    for sortie in _decrire_sorties(pipeline.named_steps['preprocessor']):
+        if sortie[0] == 'ord':
+            categories.setdefault(sortie[1], []).extend(sortie[3])
+        elif sortie[0] == 'onehot':
+            categories.setdefault(sortie[1], []).append(sortie[3])
+
+    axes = {}
+    for position, sortie in enumerate(sorties):
+        type_sortie, attribut = sortie[:2]
+        axe = axes.setdefault(attribut, {'attribut': attribut, 'type': 'num' if type_sortie == 'num' else 'cat',
+                                         'positions': [], 'sorties': []})
+        axe['positions'].append(position)
+        axe['sorties'].append(sortie)
+
+    for axe in axes.values():
+        if axe['type'] == 'num':
+            (_, _, _, moyenne, echelle), = axe['sorties']
+            axe['valeurs'] = [float(v) for v in domaines.get(axe['attribut'], DOMAINE_INDICATEUR)]
+            axe['codes'] = [[(v - moyenne) / echelle] for v in axe['valeurs']]
+        else:
+            # Regrouper les catégories qui produisent les mêmes caractéristiques
+            classes, codes = {}, []
+            for categorie in dict.fromkeys(categories[axe['attribut']]):
+                code = [_coder(sortie, categorie) for sortie in axe['sorties']]
+                if code not in codes:
+                    codes.append(code)
+                classes[categorie] = codes.index(code)
+            axe['classes'], axe['codes'] = classes, codes
+        del axe['sorties']
+    return list(axes.values())
+
+
+def _coder(sortie, categorie):
+    if sortie[0] == 'ord':
+        return float(sortie[3][categorie])
+    return 1.0 if categorie == sortie[3] else 0.0
+
+
+def _pas(radices):
+    """Pas de chaque axe en base mixte (le dernier axe varie le plus vite)."""
+    pas = [1] * len(radices)
+    for i in range(len(radices) - 2, -1, -1):
+        pas[i] = pas[i + 1] * radices[i + 1]
+    return pas
+
+
+def _caracteristiques(axes, cles, n_caracteristiques):
+    """Matrice des caractéristiques encodées des clés `cles`."""
+    radices = [len(axe['codes']) for axe in axes]
+    X = np.empty((len(cles), n_caracteristiques), dtype=np.float32)
+    for axe, pas, radice in zip(axes, _pas(radices), radices):
+        chiffres = (cles // pas) % radice
+        X[:, axe['positions']] = np.asarray(axe['codes'], dtype=np.float64)[chiffres]
+    return X
+
+
+def construire_table(chemin_modele, domaines=None, taille_bloc=TAILLE_BLOC):
+    """Prédit toute la grille et écrit la table; retourne ses métadonnées."""
+    debut = time.perf_counter()
+    pipeline = joblib.load(chemin_modele)
+    regresseur = pipeline.named_steps['regressor']
+    axes = decrire_axes(pipeline, domaines)
+    n_caracteristiques = sum(len(axe['positions']) for axe in axes)
+    radices = [len(axe['codes']) for axe in axes]
+    n = math.prod(radices)
+
+    base = chemin_table(chemin_modele)
+    temporaire = f"{base}.tmp.npy"
+    table = np.lib.format.open_memmap(temporaire, mode='w+', dtype=np.float32, shape=(n,))
+    for debut_bloc in range(0, n, taille_bloc):
+        cles = np.arange(debut_bloc, min(n, debut_bloc + taille_bloc))
+        table[debut_bloc:debut_bloc + len(cles)] = regresseur.predict(_caracteristiques(axes, cles, n_caracteristiques))
+    table.flush()
+
+    # Prédictions de contrôle, recalculées par l'API avec le modèle chargé
+    controles = np.random.default_rng(0).integers(0, n, N_CONTROLES)
+    metadonnees = {
+        'modele': os.path.basename(chemin_modele),
+        'axes': [{cle: axe[cle] for cle in ('attribut', 'type', 'valeurs', 'classes') if cle in axe} for axe in axes],
+        'n_entrees': n,
+        'controles': [[int(cle), float(table[cle])] for cle in controles],
+        'duree_construction_s': time.perf_counter() - debut,
+    }
+    del table
+    os.replace(temporaire, f"{base}.npy")
+    with open(f"{base}.json", 'w', encoding='utf-8') as f:
+        json.dump(metadonnees, f, ensure_ascii=False, indent=1)
+    return metadonnees
+
+
+class TablePredictions:
+    """Table chargée (en mmap par défaut), interrogée avec des objets PredictionInput."""
+
+    def __init__(self, base, mmap_mode='r'):
+        with open(f"{base}.json", encoding='utf-8') as f:
+            self.metadonnees = json.load(f)
+        self.predictions = np.load(f"{base}.npy", mmap_mode=mmap_mode)
+        self.chemin = f"{base}.npy"
+
+        axes = self.metadonnees['axes']
+        radices = [len(axe['valeurs'] if axe['type'] == 'num' else set(axe['classes'].values())) for axe in axes]
+        if math.prod(radices) != len(self.predictions):
+            raise ValueError(f"{self.chemin}: taille incohérente avec les axes de {base}.json")
+        # (attribut, valeur -> chiffre multiplié par le pas de l'axe)
+        self.axes = []
+        self.pas = _pas(radices)
+        self.radices = radices
+        for axe, pas in zip(axes, self.pas):
+            if axe['type'] == 'num':
+                chiffres = {valeur: i * pas for i, valeur in enumerate(axe['valeurs'])}
+            else:
+                chiffres = {categorie: i * pas for categorie, i in axe['classes'].items()}
+            self.axes.append((axe['attribut'], chiffres))
+        self.hits = 0
+        self.misses = 0
+
+    def cle(self, entree):
+        """Clé de l'entrée, ou None si elle est hors de la grille."""
+        cle = 0
+        for attribut, chiffres in self.axes:
+            valeur = chiffres.get(getattr(entree, attribut))
+            if valeur is None:
+                return None
+            cle += valeur
+        return cle
+
+    def predire_lot(self, entrees):
+        """Prédictions de la table (float), None pour les entrées hors de la grille."""
+        predictions = []
+        for entree in entrees:
+            cle = self.cle(entree)
+            predictions.append(None if cle is None else float(self.predictions[cle]))
+        n_hors_grille = predictions.count(None)
+        self.hits += len(predictions) - n_hors_grille
+        self.misses += n_hors_grille
+        return predictions
+
+    def entree(self, cle):
+        """Entrée (attributs lus par le modèle) correspondant à une clé, pour les contrôles."""
+        valeurs = {}
+        for (attribut, chiffres), pas, radice in zip(self.axes, self.pas, self.radices):
+            chiffre = (cle // pas) % radice * pas
+            valeurs[attribut] = next(v for v, c in chiffres.items() if c == chiffre)
+        return SimpleNamespace(**valeurs)
+
+    def verifier(self, predire, tolerance=1e-3):
+        """
+        Compare les prédictions de contrôle à `predire(entree)` (modèle chargé);
+        lève ValueError si la table a été construite pour un autre modèle.
+        """
+        for cle, attendue in self.metadonnees['controles']:
+            try:
+                obtenue = float(predire(self.entree(cle)))
+            except (AttributeError, ValueError) as e:
+                raise ValueError(f"{self.chemin} ne correspond pas au modèle chargé: {e}")
+            if abs(obtenue - attendue) > tolerance * max(1.0, abs(obtenue)):
+                raise ValueError(f"{self.chemin} ne correspond pas au modèle chargé "
+                                 f"(clé {cle}: {attendue:.2f} dans la table, {obtenue:.2f} par le modèle)")
+
+    def statistiques(self):
+        total = self.hits + self.misses
+        return {
+            "fichier": self.chemin,
+            "n_entrees": len(self.predictions),
+            "taille_mo": self.predictions.nbytes / 1e6,
+            "hits": self.hits,
+            "misses": self.misses,
+            "taux_hit": self.hits / total if total else 0.0,
+        }
+
+
+def charger_table(chemin_modele, encodeur, regresseur):
+    """
+    Table du modèle `chemin_modele` si elle existe et correspond au modèle
+    chargé (encodeur et régresseur), None si elle est absente.
+    """
+    base = chemin_table(chemin_modele)
+    if not os.path.exists(f"{base}.npy"):
+        return None
+    table = TablePredictions(base)
+    table.verifier(lambda entree: regresseur.predict(encodeur.encoder(entree))[0])
+    return table
+
+
+def _domaine(texte):
+    """'age=18:80' -> ('age', [18, ..., 80]); 'weight=0.5,1.0' -> ('weight', [0.5, 1.0])."""
+    attribut, _, valeurs = texte.partition('=')
+    if ':' in valeurs:
+        debut, fin = valeurs.split(':')
+        return attribut, list(range(int(debut), int(fin) + 1))
+    return attribut, [float(v) for v in valeurs.split(',')]
+
+
+def mesurer(chemin_modele, n_appels=20000):
+    """Latences (µs) d'une prédiction par la table et par le modèle (encodeur + régresseur)."""
+    from feature_encoder import EncodeurRequetes
+
+    pipeline = joblib.load(chemin_modele)
+    encodeur = EncodeurRequetes(pipeline)
+    regresseur = pipeline.named_steps['regressor']
+    table = charger_table(chemin_modele, encodeur, regresseur)
+    rng = np.random.default_rng(1)
+    entrees = [table.entree(int(cle)) for cle in rng.integers(0, len(table.predictions), 1000)]
+
+    debut = time.perf_counter()
+    for i in range(n_appels):
+        table.predire_lot([entrees[i % len(entrees)]])
+    duree_table = (time.perf_counter() - debut) / n_appels
+
+    n_modele = max(1, n_appels // 100)
+    debut = time.perf_counter()
+    for i in range(n_modele):
+        regresseur.predict(encodeur.encoder(entrees[i % len(entrees)]))
+    duree_modele = (time.perf_counter() - debut) / n_modele
+
+    ecarts = [abs(table.predire_lot([e])[0] - regresseur.predict(encodeur.encoder_lot([e]))[0]) for e in entrees[:200]]
+    return duree_table * 1e6, duree_modele * 1e6, max(ecarts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Précalcule les prédictions de toutes les entrées de la grille")
+    parser.add_argument("modele", help="Pipeline sauvegardé par train.py (ou une variante de compression.py)")
+    parser.add_argument("--domaine", action="append", default=[], type=_domaine,
+                        help="Domaine d'un attribut numérique: 'age=18:80' ou 'weight=0.5,1.0'")
+    args = parser.parse_args()
+
+    metadonnees = construire_table(args.modele, dict(args.domaine))
+    base = chemin_table(args.modele)
+    print("Axes:")
+    for axe in metadonnees['axes']:
+        if axe['type'] == 'num':
+            print(f"  {axe['attribut']:<32} {len(axe['valeurs'])} valeurs "
+                  f"({axe['valeurs'][0]:g} à {axe['valeurs'][-1]:g})")
+        else:
+            print(f"  {axe['attribut']:<32} {len(set(axe['classes'].values()))} classes "
+                  f"({len(axe['classes'])} catégories)")
+    taille = os.path.getsize(f"{base}.npy") / 1e6
+    print(f"\n{metadonnees['n_entrees']} entrées, {taille:.1f} Mo, "
+          f"construite en {metadonnees['duree_construction_s']:.1f} s -> {base}.npy")
+
+    latence_table, latence_modele, ecart = mesurer(args.modele)
+    print(f"Prédiction unitaire: {latence_table:.2f} µs par la table, {latence_modele:.0f} µs par le modèle "
+          f"(écart maximal {ecart:.4f})")
+
+
+if __name__ == "__main__":
+    main()
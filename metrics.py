@@ -0,0 +1,347 @@
+"""
+Instrumentation de l'API: durées par étape de la prédiction, durées des
+requêtes HTTP et profilage échantillonné à la demande.
+
+Les durées sont agrégées dans des histogrammes à bornes fixes (un comptage
+par intervalle, une somme et un total), sans conserver les observations:
+une observation coûte une recherche dichotomique et quelques incréments. Le
+tout est exposé au format texte de Prometheus, sans dépendance supplémentaire.
+
+Les compteurs sont propres à chaque processus: avec plusieurs workers
+uvicorn, chaque scrape de /metrics lit le worker qui répond (label `pid`
+ajouté par l'API pour les distinguer).
+
+Usage:
+    chrono = metriques.chronometre()
+    X = encoder(...)
+    chrono.etape("encodage")
+    y = regresseur.predict(X)
+    chrono.etape("regressor")
+    chrono.terminer()
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+
+# Bornes (secondes) des histogrammes de durées: de 10 µs à 10 s
+BORNES_DUREES = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogramme:
+    """Histogramme cumulatif à bornes fixes (sémantique `le` de Prometheus)."""
+
+    def __init__(self, bornes=BORNES_DUREES):
+        self.bornes = bornes
+        self.comptes = [0] * (len(bornes) + 1)   # dernier intervalle: au-delà de la dernière borne
+        self.somme = 0.0
+        self.n = 0
+        self._verrou = threading.Lock()
+
+    def observer(self, valeur):
+        i = bisect_left(self.bornes, valeur)
+        with self._verrou:
+            self.comptes[i] += 1
+            self.somme += valeur
+            self.n += 1
+
+    def instantane(self):
+        """(comptes cumulés par borne, +Inf compris, somme, total), lus de façon cohérente."""
+        with self._verrou:
+            comptes, somme, n = list(self.comptes), self.somme, self.n
+        cumul, total = [], 0
+        for compte in comptes:
+            total += compte
+            cumul.append(total)
+        return cumul, somme, n
+
+    def quantile(self, q):
+        """Estimation d'un quantile par interpolation linéaire dans l'intervalle qui le contient."""
+        cumul, _, n = self.instantane()
+        if n == 0:
+            return None
+        rang = q * n
+        precedent, borne_basse = 0, 0.0
+        for i, total in enumerate(cumul):
+            if total >= rang:
+                if i == len(self.bornes):
+                    return self.bornes[-1]
+                borne_haute = self.bornes[i]
+                compte = total - precedent
+                return borne_basse + (borne_haute - borne_basse) * ((rang - precedent) / compte if compte else 1.0)
+            precedent, borne_basse = total, self.bornes[i]
+        return self.bornes[-1]
+
+
+class Chronometre:
+    """Durées des étapes d'un appel, cumulées localement puis enregistrées en une fois par terminer()."""
+
+    __slots__ = ("metriques", "dernier", "durees")
+
+    def __init__(self, metriques):
+        self.metriques = metriques
+        self.dernier = time.perf_counter()
+        self.durees = {}
+
+    def etape(self, nom):
+        """Attribue à `nom` le temps écoulé depuis la marque précédente."""
+        maintenant = time.perf_counter()
+        self.durees[nom] = self.durees.get(nom, 0.0) + maintenant - self.dernier
+        self.dernier = maintenant
+
+    def terminer(self):
+        for nom, duree in self.durees.items():
+            self.metriques.observer_etape(nom, duree)
+
+
+class _ChronometreInactif:
+    __slots__ = ()
+
+    def etape(self, nom):
+        pass
+
+    def terminer(self):
+        pass
+
+
+CHRONOMETRE_INACTIF = _ChronometreInactif()
+
+
+class Metriques:
+    def __init__(self, actif=True):
+        self.actif = actif
+        self.etapes = {}        # étape -> Histogramme
+        self.requetes = {}      # (route, méthode, statut) -> Histogramme
+        self.compteurs = {}     # (nom, labels) -> valeur
+        self.aides = {}         # nom du compteur -> description
+        self._verrou = threading.Lock()
+
+    def _histogramme(self, table, cle):
+        histogramme = table.get(cle)
+        if histogramme is None:
+            with self._verrou:
+                histogramme = table.setdefault(cle, Histogramme())
+        return histogramme
+
+    def chronometre(self):
+        return Chronometre(self) if self.actif else CHRONOMETRE_INACTIF
+
+    def observer_etape(self, etape, duree):
+        if self.actif:
+            self._histogramme(self.etapes, etape).observer(duree)
+
+    def observer_requete(self, route, methode, statut, duree):
+        if self.actif:
+            self._histogramme(self.requetes, (route, methode, statut)).observer(duree)
+
+    def decrire(self, nom, aide):
+        self.aides[nom] = aide
+
+    def incrementer(self, nom, labels=(), n=1):
+        """`labels`: tuple de couples (label, valeur)."""
+        if self.actif:
+            with self._verrou:
+                cle = (nom, labels)
+                self.compteurs[cle] = self.compteurs.get(cle, 0) + n
+
+    def resume_etapes(self):
+        """Nombre d'observations, moyenne, p50 et p99 (ms) par étape."""
+        resume = {}
+        with self._verrou:
+            etapes = sorted(self.etapes.items())
+        for etape, histogramme in etapes:
+            _, somme, n = histogramme.instantane()
+            resume[etape] = {
+                "n": n,
+                "moyenne_ms": somme / n * 1000 if n else None,
+                "p50_ms": _en_ms(histogramme.quantile(0.5)),
+                "p99_ms": _en_ms(histogramme.quantile(0.99)),
+            }
+        return resume
+
+    def exposer(self, labels_communs=(), familles=()):
+        """
+        Texte au format d'exposition Prometheus.
+        familles: métriques supplémentaires (nom, type, aide, [(labels, valeur)]),
+        par exemple des jauges lues au moment du scrape.
+        """
+        with self._verrou:
+            etapes = sorted(self.etapes.items())
+            requetes = sorted(self.requetes.items())
+            compteurs = sorted(self.compteurs.items())
+
+        lignes = []
+        _exposer_histogrammes(
+            lignes, "api_etape_duree_secondes", "Durée des étapes de la prédiction",
+            [((("etape", etape),), histogramme) for etape, histogramme in etapes],
+            labels_communs,
+        )
+        _exposer_histogrammes(
+            lignes, "api_requete_duree_secondes", "Durée des requêtes HTTP",
+            [((("route", route), ("methode", methode), ("statut", str(statut))), histogramme)
+             for (route, methode, statut), histogramme in requetes],
+            labels_communs,
+        )
+
+        par_nom = {}
+        for (nom, labels), valeur in compteurs:
+            par_nom.setdefault(nom, []).append((labels, valeur))
+        for nom, valeurs in par_nom.items():
+            _exposer_famille(lignes, nom, "counter", self.aides.get(nom), valeurs, labels_communs)
+
+        for nom, type_metrique, aide, valeurs in familles:
+            _exposer_famille(lignes, nom, type_metrique, aide, valeurs, labels_communs)
+        return "\n".join(lignes) + "\n"
+
+
+def _en_ms(valeur):
+    return valeur * 1000 if valeur is not None else None
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{nom}="{_echapper(valeur)}"' for nom, valeur in labels) + "}"
+
+
+def _nombre(valeur):
+    if valeur == float("inf"):
+        return "+Inf"
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+def _exposer_famille(lignes, nom, type_metrique, aide, valeurs, labels_communs):
+    if aide:
+        lignes.append(f"# HELP {nom} {aide}")
+    lignes.append(f"# TYPE {nom} {type_metrique}")
+    for labels, valeur in valeurs:
+        lignes.append(f"{nom}{_labels(tuple(labels_communs) + tuple(labels))} {_nombre(valeur)}")
+
+
+def _exposer_histogrammes(lignes, nom, aide, histogrammes, labels_communs):
+    lignes.append(f"# HELP {nom} {aide}")
+    lignes.append(f"# TYPE {nom} histogram")
+    for labels, histogramme in histogrammes:
+        labels = tuple(labels_communs) + labels
+        cumul, somme, n = histogramme.instantane()
+        for borne, total in zip(histogramme.bornes + (float("inf"),), cumul):
+            lignes.append(f"{nom}_bucket{_labels(labels + (('le', _nombre(borne)),))} {total}")
+        lignes.append(f"{nom}_sum{_labels(labels)} {_nombre(somme)}")
+        lignes.append(f"{nom}_count{_labels(labels)} {n}")
+
+
+class MiddlewareMetriques:
+    """
+    Middleware ASGI mesurant la durée de chaque requête HTTP par route
+    (chemin déclaré, pas le chemin reçu), méthode et statut.
+    """
+
+    def __init__(self, app, metriques):
+        self.app = app
+        self.metriques = metriques
+        self._routes = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metriques.actif:
+            await self.app(scope, receive, send)
+            return
+
+        statut = [500]
+
+        async def envoyer(message):
+            if message["type"] == "http.response.start":
+                statut[0] = message["status"]
+            await send(message)
+
+        debut = time.perf_counter()
+        try:
+            await self.app(scope, receive, envoyer)
+        finally:
+            self.metriques.observer_requete(self.route(scope), scope["method"], statut[0],
+                                            time.perf_counter() - debut)
+
+    def route(self, scope):
+        # Le routeur de Starlette ajoute l'endpoint choisi au scope de la requête
+        if self._routes is None:
+            self._routes = {route.endpoint: route.path
+                            for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self._routes.get(scope.get("endpoint"), "inconnue")
+
+
+class ProfileurEchantillonne:
+    """
+    Profilage cProfile d'une fraction des appels pendant une fenêtre de temps.
+    Hors fenêtre, executer() se réduit à un test.
+    """
+
+    def __init__(self):
+        self.fin = 0.0
+        self.taux = 0.0
+        self.n_profiles = 0
+        self._stats = None
+        self._verrou = threading.Lock()
+
+    @property
+    def actif(self):
+        return time.monotonic() < self.fin
+
+    def demarrer(self, duree, taux):
+        """Ouvre une fenêtre de `duree` secondes; lève RuntimeError si une fenêtre est déjà ouverte."""
+        with self._verrou:
+            if self.actif:
+                raise RuntimeError("Un profilage est déjà en cours")
+            self.taux = taux
+            self.n_profiles = 0
+            self._stats = None
+            self.fin = time.monotonic() + duree
+
+    def arreter(self):
+        """Ferme la fenêtre et retourne les statistiques cumulées (pstats.Stats, ou None)."""
+        with self._verrou:
+            self.fin = 0.0
+            stats, self._stats = self._stats, None
+            return stats
+
+    def executer(self, fonction, *args):
+        if not self.actif or random.random() >= self.taux:
+            return fonction(*args)
+        profil = cProfile.Profile()
+        try:
+            profil.enable()
+        except ValueError:
+            # Un autre profileur est actif (un seul à la fois par processus à partir de Python 3.12)
+            return fonction(*args)
+        try:
+            return fonction(*args)
+        finally:
+            profil.disable()
+            with self._verrou:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profil)
+                else:
+                    self._stats.add(profil)
+                self.n_profiles += 1
+
+
+def formater_profil(stats, tri="cumulative", lignes=40):
+    """Rapport texte des fonctions les plus coûteuses."""
+    sortie = io.StringIO()
+    stats.stream = sortie
+    stats.sort_stats(tri).print_stats(lignes)
+    return sortie.getvalue()
+
+
+def exporter_profil(stats):
+    """Contenu d'un fichier .pstats (pstats.Stats(fichier), snakeviz, ...)."""
+    return marshal.dumps(stats.stats)
@@ -0,0 +1,290 @@
+"""
+Registre des versions du modèle, rechargées à chaud sans interrompre le service.
+
+Le registre surveille un dossier de modèles: chaque fichier `<version>.joblib`
+(ou `<version>.moteur.joblib` avec le moteur mmap) est une version. Lorsqu'une
+nouvelle version apparaît, ou qu'un fichier existant change, elle est chargée
+puis préchauffée (un lot de prédictions) dans un thread d'arrière-plan, et ne
+remplace la version active qu'une fois prête. Le remplacement est une simple
+affectation de référence: chaque requête obtient sa version une fois au début
+et la garde jusqu'à la fin, les requêtes en cours terminent donc sur
+l'ancienne version.
+
+La version active est la plus récemment déployée (date de modification du
+fichier); les autres versions du dossier sont chargées à la demande, lorsqu'une
+requête les demande explicitement. Si un chargement échoue, la version active
+reste en service et l'échec est exposé dans les statistiques.
+
+Pour déployer sans qu'un fichier incomplet soit lu, l'écrire sous un nom
+temporaire (préfixe '.' ou suffixe '.tmp') puis le renommer; à défaut, un
+fichier n'est chargé que lorsque son empreinte est stable entre deux scans.
+
+Sans dossier de modèles, le fichier unique du modèle est surveillé de la même façon.
+"""
+import os
+import threading
+import time
+
+import joblib
+
+from compiled_model import ForetCompilee, MoteurCompile, charger_moteur, compiler_pipeline, compiler_regresseur
+from explainer import ExplicateurForet
+from feature_encoder import EncodeurRequetes
+from logging_config import obtenir_logger
+from lookup_table import charger_table
+from prediction_cache import empreinte_fichier
+
+logger = obtenir_logger("registre")
+
+
+class VersionModele:
+    """Une version chargée: le modèle et les objets dérivés utilisés pour prédire."""
+
+    def __init__(self, nom, chemin, moteur, creer_cache=None, table=False):
+        self.nom = nom
+        self.chemin = chemin
+        self.empreinte = empreinte_fichier(chemin)
+
+        debut = time.perf_counter()
+        self.model = charger_moteur(chemin) if moteur == "mmap" else joblib.load(chemin)
+        self.predicteur = self.model   # prédit à partir d'un DataFrame
+        self.encodeur = None           # requêtes -> caractéristiques sélectionnées, sans DataFrame
+        self.regresseur = None         # prédit à partir des caractéristiques encodées
+        try:
+            self.encodeur = EncodeurRequetes(self.model)
+            if isinstance(self.model, MoteurCompile):
+                self.regresseur = self.model.foret
+            else:
+                self.regresseur = self.model.named_steps['regressor']
+                if moteur == "compile":
+                    self.predicteur = compiler_pipeline(self.model)
+                    self.regresseur = self.predicteur.foret
+        except ValueError as e:
+            logger.warning(f"Pipeline non compilable, utilisation des DataFrames scikit-learn: {e}")
+            self.predicteur, self.encodeur, self.regresseur = self.model, None, None
+        # Clés du cache propres à cette version: son nom et l'empreinte du fichier chargé, qui ne changent plus
+        self.cache = None
+        if creer_cache is not None and self.encodeur is not None:
+            self.cache = creer_cache(f"{nom}:{self.empreinte}")
+        # Table des prédictions précalculées (lookup_table.py), si elle a été construite pour ce modèle
+        self.table = None
+        if table and self.encodeur is not None:
+            try:
+                self.table = charger_table(chemin, self.encodeur, self.regresseur)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Table des prédictions ignorée pour la version '{nom}': {e}")
+        self.duree_chargement = time.perf_counter() - debut
+        self.duree_prechauffage = None
+        self.charge_le = time.time()
+        self._foret_compilee = None
+        self._explicateur = None
+        self._verrou = threading.Lock()
+
+    def foret_compilee(self):
+        """
+        Forêt compilée du régresseur (intervalles et explications), compilée
+        au premier appel avec le moteur sklearn. None si le régresseur n'est
+        pas supporté ou si les requêtes ne peuvent pas être encodées.
+        """
+        if self._foret_compilee is None and self.encodeur is not None:
+            with self._verrou:
+                if self._foret_compilee is None:
+                    foret = self.regresseur
+                    if not isinstance(foret, ForetCompilee):
+                        try:
+                            foret = compiler_regresseur(foret)
+                        except ValueError:
+                            foret = False
+                    self._foret_compilee = foret
+        return self._foret_compilee or None
+
+    def foret_dispersion(self):
+        """Forêt compilée qui donne la prédiction de chaque arbre (intervalles de /predict), si forêt aléatoire."""
+        foret = self.foret_compilee()
+        return foret if foret is not None and foret.moyenne_des_arbres else None
+
+    def explicateur(self):
+        """Contributions par champ (/explain), préparées au premier appel; None comme foret_compilee()."""
+        if self._explicateur is None:
+            foret = self.foret_compilee()
+            with self._verrou:
+                if self._explicateur is None:
+                    if foret is None:
+                        self._explicateur = False
+                    else:
+                        champs = [lecteur[1] for lecteur in self.encodeur.lecteurs]
+                        self._explicateur = ExplicateurForet(foret, champs)
+        return self._explicateur or None
+
+    def statistiques(self):
+        return {
+            "version": self.nom,
+            "chemin": self.chemin,
+            "empreinte": self.empreinte,
+            "duree_chargement_s": self.duree_chargement,
+            "duree_prechauffage_s": self.duree_prechauffage,
+            "charge_le": self.charge_le,
+            "table": self.table.statistiques() if self.table is not None else None,
+        }
+
+
+class RegistreModeles:
+    def __init__(self, dossier, chemin_defaut, moteur="sklearn", creer_cache=None,
+                 prechauffer=None, intervalle=2.0, conserver=3, table=False):
+        """
+        dossier: dossier des versions (peut ne pas exister: chemin_defaut est alors la seule source).
+        table: charger la table des prédictions précalculées de chaque version, si elle existe.
+        creer_cache: fonction qui crée le cache d'une version à partir du préfixe de ses clés.
+        prechauffer: fonction appelée avec chaque nouvelle version avant qu'elle ne devienne active.
+        conserver: nombre de versions gardées en mémoire (la version active comprise).
+        """
+        self.dossier = dossier
+        self.chemin_defaut = chemin_defaut
+        self.moteur = moteur
+        self.creer_cache = creer_cache
+        self.prechauffer = prechauffer
+        self.intervalle = intervalle
+        self.conserver = conserver
+        self.table = table
+
+        self.active = None
+        self.versions = {}          # nom -> VersionModele chargée
+        self.echecs = {}            # nom -> (empreinte, message) du dernier chargement échoué
+        self.n_remplacements = 0
+        self._vues = {}             # nom -> empreinte vue au scan précédent
+        self._verrou = threading.Lock()
+        self._arret = threading.Event()
+        self._thread = None
+
+    @property
+    def suffixe(self):
+        return ".moteur.joblib" if self.moteur == "mmap" else ".joblib"
+
+    def lister(self):
+        """Versions disponibles sur disque: nom -> chemin."""
+        if not os.path.isdir(self.dossier):
+            if not os.path.exists(self.chemin_defaut):
+                return {}
+            nom = os.path.basename(self.chemin_defaut)
+            return {nom.removesuffix(self.suffixe): self.chemin_defaut}
+        sources = {}
+        for entree in os.scandir(self.dossier):
+            nom = entree.name
+            if nom.startswith('.') or not nom.endswith(self.suffixe) or not entree.is_file():
+                continue
+            if self.moteur != "mmap" and nom.endswith(".moteur.joblib"):
+                continue
+            sources[nom.removesuffix(self.suffixe)] = entree.path
+        return sources
+
+    def charger(self, nom, chemin):
+        """Charge et préchauffe une version, sans la rendre active."""
+        version = VersionModele(nom, chemin, self.moteur, self.creer_cache, self.table)
+        if self.prechauffer is not None:
+            debut = time.perf_counter()
+            self.prechauffer(version)
+            version.duree_prechauffage = time.perf_counter() - debut
+        logger.info(f"Version '{nom}' chargée en {version.duree_chargement:.3f} s, "
+                    f"préchauffée en {version.duree_prechauffage or 0.0:.3f} s")
+        return version
+
+    def scanner(self, initial=False):
+        """
+        Charge la version la plus récente si elle est nouvelle ou a changé, et
+        l'active une fois préchauffée. Hors chargement initial, un fichier n'est
+        chargé que si son empreinte n'a pas changé depuis le scan précédent
+        (écriture terminée). Les autres versions sont chargées à la demande.
+        """
+        with self._verrou:
+            sources = self.lister()
+            empreintes = {nom: empreinte_fichier(chemin) for nom, chemin in sources.items()}
+            dates = {}
+            for nom, chemin in sources.items():
+                try:
+                    dates[nom] = os.path.getmtime(chemin)
+                except OSError:
+                    pass
+
+            if dates:
+                nom = max(dates, key=lambda n: (dates[n], n))
+                empreinte = empreintes[nom]
+                stable = initial or self.active is None or self._vues.get(nom) == empreinte
+                self._vues = {nom: empreinte}
+                version = self.versions.get(nom)
+                deja_chargee = version is not None and version.empreinte == empreinte
+                deja_echouee = self.echecs.get(nom, (None,))[0] == empreinte
+                if stable and not deja_chargee and not deja_echouee:
+                    try:
+                        version = self.versions[nom] = self.charger(nom, sources[nom])
+                        self.echecs.pop(nom, None)
+                    except Exception as e:
+                        version = None
+                        self.echecs[nom] = (empreinte, str(e))
+                        logger.error(f"Échec du chargement de la version '{nom}': {e}")
+                if version is not None and version.empreinte == empreinte and version is not self.active:
+                    self._activer(version)
+
+            # Oublier les versions dont le fichier a disparu ou changé (l'active reste servie)
+            for nom, version in list(self.versions.items()):
+                if version is not self.active and empreintes.get(nom) != version.empreinte:
+                    del self.versions[nom]
+            return self.active is not None
+
+    def _activer(self, version):
+        precedente = self.active.nom if self.active is not None else None
+        self.active = version
+        self.n_remplacements += 1
+        logger.info(f"Version active: '{version.nom}' (précédente: {precedente})")
+
+        # Libérer les versions les plus anciennes au-delà de `conserver`
+        anciennes = sorted(self.versions.values(), key=lambda v: v.charge_le, reverse=True)
+        for ancienne in anciennes[self.conserver:]:
+            if ancienne is not self.active:
+                del self.versions[ancienne.nom]
+
+    def obtenir(self, nom=None):
+        """
+        Version à utiliser pour une requête: la version active, ou la version
+        demandée (chargée à la demande si elle n'est plus en mémoire).
+        Lève KeyError si la version demandée n'existe pas.
+        """
+        if nom is None or (self.active is not None and nom == self.active.nom):
+            return self.active
+        version = self.versions.get(nom)
+        if version is not None:
+            return version
+        with self._verrou:
+            if nom not in self.versions:
+                chemin = self.lister().get(nom)
+                if chemin is None:
+                    raise KeyError(nom)
+                self.versions[nom] = self.charger(nom, chemin)
+            return self.versions[nom]
+
+    def demarrer(self):
+        """Chargement initial puis surveillance du dossier, dans un thread d'arrière-plan."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._boucle, name="registre-modeles", daemon=True)
+            self._thread.start()
+
+    def arreter(self):
+        self._arret.set()
+
+    def _boucle(self):
+        self.scanner(initial=True)
+        while not self._arret.wait(self.intervalle):
+            try:
+                self.scanner()
+            except Exception as e:
+                logger.error(f"Erreur lors de la surveillance des modèles: {e}")
+
+    def statistiques(self):
+        return {
+            "pid": os.getpid(),
+            "moteur": self.moteur,
+            "dossier": self.dossier if os.path.isdir(self.dossier) else None,
+            "version_active": self.active.nom if self.active is not None else None,
+            "n_remplacements": self.n_remplacements,
+            "versions": [version.statistiques() for version in self.versions.values()],
+            "echecs": {nom: message for nom, (_, message) in self.echecs.items()},
+        }
@@ -0,0 +1,170 @@
+"""
+Cache des prédictions, indexé par une empreinte du vecteur de caractéristiques.
+
+La clé est calculée sur les caractéristiques encodées (feature_encoder.py):
+deux requêtes qui ne diffèrent que par des champs ignorés par le modèle
+partagent donc la même entrée. Chaque clé est préfixée par l'empreinte de la
+version du modèle, fixée à son chargement par le registre (model_registry.py):
+une version encore servie après le remplacement de son fichier garde ses
+propres clés, et ses prédictions ne sont jamais servies à une autre version.
+
+Deux stockages sont disponibles:
+  - CacheLocal: LRU en mémoire avec expiration (TTL), propre à chaque worker;
+  - CacheRedis: partagé entre les workers uvicorn (dépendance optionnelle `redis`).
+    Sa taille et ses évictions ne sont pas mesurées (None dans les
+    statistiques): la base peut contenir d'autres clés, et Redis évince seul.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def empreinte_fichier(chemin):
+    """Empreinte légère d'un fichier: taille et date de modification."""
+    try:
+        stat = os.stat(chemin)
+    except OSError:
+        return "absent"
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def cle_vecteur(ligne):
+    """Empreinte canonique d'un vecteur de caractéristiques (tableau NumPy)."""
+    return hashlib.blake2b(ligne.tobytes(), digest_size=16).hexdigest()
+
+
+class CacheLocal:
+    """LRU en mémoire avec expiration, protégé par un verrou."""
+
+    def __init__(self, taille_max=10000, ttl=3600.0):
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self.evictions = 0
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def get(self, cle):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return None
+            valeur, expiration = entree
+            if expiration < time.monotonic():
+                del self._entrees[cle]
+                self.evictions += 1
+                return None
+            self._entrees.move_to_end(cle)
+            return valeur
+
+    def set(self, cle, valeur):
+        with self._verrou:
+            self._entrees[cle] = (valeur, time.monotonic() + self.ttl)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._verrou:
+            self._entrees.clear()
+
+    def __len__(self):
+        return len(self._entrees)
+
+
+class CacheRedis:
+    """
+    Stockage partagé entre workers; l'expiration et l'éviction sont gérées par
+    Redis. Les clés portent l'empreinte de la version (voir CachePredictions):
+    celles d'une ancienne version ne sont jamais supprimées, elles expirent.
+    """
+
+    def __init__(self, url, ttl=3600.0, prefixe="revenu:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("Le cache partagé nécessite le paquet 'redis' (pip install redis)") from e
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefixe = prefixe
+
+    def get(self, cle):
+        valeur = self._client.get(self.prefixe + cle)
+        return None if valeur is None else float(valeur)
+
+    def set(self, cle, valeur):
+        self._client.set(self.prefixe + cle, repr(float(valeur)), px=int(self.ttl * 1000))
+
+
+class CachePredictions:
+    def __init__(self, stockage, empreinte, chemin_modele=None, intervalle_verification=5.0):
+        """
+        `empreinte`: préfixe des clés, propre à la version du modèle. Avec
+        `chemin_modele` (cache utilisé hors du registre), le fichier est
+        revérifié toutes les `intervalle_verification` secondes et les clés
+        prennent sa nouvelle empreinte s'il a changé; le registre, qui charge
+        une nouvelle version pour chaque nouveau fichier, ne le donne pas.
+        """
+        self.stockage = stockage
+        self.chemin_modele = chemin_modele
+        self.intervalle_verification = intervalle_verification
+        self.empreinte = empreinte
+        self._empreinte_fichier = empreinte_fichier(chemin_modele) if chemin_modele is not None else None
+        self._prochaine_verification = time.monotonic() + intervalle_verification
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Compteurs et empreinte modifiés depuis les threads qui servent les requêtes
+        self._verrou = threading.Lock()
+
+    def _verifier_modele(self):
+        maintenant = time.monotonic()
+        if self.chemin_modele is None or maintenant < self._prochaine_verification:
+            return
+        self._prochaine_verification = maintenant + self.intervalle_verification
+        empreinte = empreinte_fichier(self.chemin_modele)
+        if empreinte != self._empreinte_fichier:
+            # Nouvelles clés; les anciennes expirent d'elles-mêmes (LRU, TTL), sans
+            # parcourir ni vider un stockage partagé avec d'autres workers
+            self._empreinte_fichier = self.empreinte = empreinte
+            self.invalidations += 1
+
+    def predire(self, X, fonction_prediction):
+        """
+        Prédit les lignes de X (caractéristiques encodées) en ne calculant que
+        celles absentes du cache.
+        """
+        with self._verrou:
+            self._verifier_modele()
+            empreinte = self.empreinte
+        cles = [f"{empreinte}:{cle_vecteur(ligne)}" for ligne in X]
+        predictions = [self.stockage.get(cle) for cle in cles]
+        manquantes = [i for i, p in enumerate(predictions) if p is None]
+        with self._verrou:
+            self.hits += len(cles) - len(manquantes)
+            self.misses += len(manquantes)
+
+        if manquantes:
+            calculees = fonction_prediction(X[manquantes] if len(manquantes) < len(X) else X)
+            for i, valeur in zip(manquantes, calculees):
+                predictions[i] = float(valeur)
+                self.stockage.set(cles[i], float(valeur))
+        return predictions
+
+    def statistiques(self):
+        """Taille et évictions valent None pour un stockage qui ne les mesure pas (CacheRedis)."""
+        with self._verrou:
+            hits, misses, invalidations, empreinte = self.hits, self.misses, self.invalidations, self.empreinte
+        total = hits + misses
+        return {
+            "stockage": type(self.stockage).__name__,
+            "empreinte_modele": empreinte,
+            "taille": len(self.stockage) if hasattr(self.stockage, '__len__') else None,
+            "hits": hits,
+            "misses": misses,
+            "taux_hit": hits / total if total else 0.0,
+            "evictions": getattr(self.stockage, 'evictions', None),
+            "invalidations": invalidations,
+        }
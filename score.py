@@ -0,0 +1,320 @@
+"""
+Prédiction en masse d'un fichier d'enquête (même schéma que
+dataset_revenu_marocains.csv) avec le pipeline sauvegardé, hors API.
+
+Le fichier d'entrée (CSV, éventuellement compressé, ou Parquet: fichier ou
+dataset partitionné produit par generate_dataset.py) est lu par chunks. Chaque
+chunk reçoit le nettoyage des colonnes du notebook (suppression de
+id_utilisateur, date_enregistrement, code_postal, age_en_mois et categorie_age,
+calcul de niveau_socioeco), puis est prédit par un pool de processus qui
+chargent chacun le modèle une seule fois. Les prédictions sont écrites au fur
+et à mesure, dans l'ordre des lignes: la mémoire utilisée ne dépend que de la
+taille des chunks et du nombre de workers, pas de la taille du fichier.
+
+Les valeurs manquantes sont laissées aux imputeurs du pipeline (statistiques
+de l'entraînement): contrairement au notebook, un chunk ne voit pas le fichier
+entier. Seules les colonnes de possessions sont imputées avant le calcul de
+niveau_socioeco, avec ces mêmes statistiques, comme à l'entraînement. Le dédoublonnage et le traitement des valeurs aberrantes, propres à
+l'entraînement, ne sont pas appliqués.
+
+Reprise: l'avancement est enregistré dans `<sortie>.reprise.json` après
+chaque chunk écrit. Relancer la même commande reprend après le dernier chunk
+terminé (la fin éventuellement incomplète de la sortie est tronquée).
+
+Usage:
+    python score.py dataset_revenu_marocains.csv predictions.csv --workers 4
+    python score.py dataset_parquet/ predictions.parquet --taille-chunk 200000
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from compiled_model import est_manquant, imputations_numeriques
+from train import cible, colonnes_possessions, colonnes_supprimees
+
+TAILLE_CHUNK_DEFAUT = 100000
+COLONNE_PREDICTION = 'revenu_predit'
+COLONNE_IDENTIFIANT = 'id_utilisateur'
+
+
+def lire_chunks(chemin, taille_chunk, debut=0):
+    """Itère sur les chunks (DataFrame) de l'entrée, à partir du chunk `debut`."""
+    if os.path.isdir(chemin) or chemin.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(chemin, format='parquet', partitioning='hive')
+        # pyarrow produit au plus un lot par fichier: regrouper en chunks de taille fixe
+        reste = None
+        indice = 0
+        for batch in dataset.to_batches(batch_size=taille_chunk):
+            table = pa.Table.from_batches([batch])
+            if reste is not None:
+                table = pa.concat_tables([reste, table])
+            while table.num_rows >= taille_chunk:
+                if indice >= debut:
+                    yield table.slice(0, taille_chunk).to_pandas()
+                indice += 1
+                table = table.slice(taille_chunk)
+            reste = table
+        if reste is not None and reste.num_rows and indice >= debut:
+            yield reste.to_pandas()
+        return
+
+    # CSV: les chunks déjà traités sont lus puis ignorés, un à la fois
+    for indice, df in enumerate(pd.read_csv(chemin, chunksize=taille_chunk)):
+        if indice >= debut:
+            yield df
+
+
+def preparer(df, colonnes_modele, imputations=None):
+    """
+    Nettoyage des colonnes du notebook; retourne les caractéristiques dans l'ordre du modèle.
+    imputations: valeurs de remplacement des possessions manquantes, avant le calcul de niveau_socioeco.
+    """
+    df = df.drop(columns=colonnes_supprimees + [cible], errors='ignore')
+    # niveau_socioeco et weight sont calculés ici; toutes les autres colonnes doivent être fournies
+    requises = dict.fromkeys(colonnes_possessions + [colonne for colonne in colonnes_modele
+                                                     if colonne not in ('niveau_socioeco', 'weight')])
+    manquantes = [colonne for colonne in requises if colonne not in df.columns]
+    if manquantes:
+        raise ValueError(f"Colonnes absentes du fichier d'entrée: {manquantes}")
+    if imputations:
+        df = df.fillna({colonne: valeur for colonne, valeur in imputations.items() if colonne in df.columns})
+    df['niveau_socioeco'] = df[colonnes_possessions].sum(axis=1)
+    if 'weight' not in df.columns:
+        df['weight'] = 1.0
+    return df[colonnes_modele]
+
+
+# Modèle chargé une fois par processus du pool
+_modele = None
+
+
+def _initialiser(chemin_modele, workers):
+    global _modele
+    _modele = joblib.load(chemin_modele)
+    regresseur = _modele.steps[-1][1]
+    if workers > 1 and hasattr(regresseur, 'n_jobs'):
+        # Un processus par cœur: pas de threads supplémentaires dans chaque worker
+        regresseur.n_jobs = 1
+
+
+def colonnes_modele(modele):
+    """Colonnes attendues par le modèle: pipeline scikit-learn ou moteur compilé (compiled_model.py)."""
+    if hasattr(modele, 'feature_names_in_'):
+        return list(modele.feature_names_in_)
+    return list(modele.colonnes_requises)
+
+
+def imputations_possessions(modele):
+    """
+    Imputations des colonnes de possessions apprises par le pipeline (ou
+    recopiées dans le moteur compilé; un moteur exporté avant qu'il ne les
+    garde n'en fournit pas, et les possessions manquantes comptent pour 0).
+    """
+    if hasattr(modele, 'named_steps'):
+        try:
+            imputations = imputations_numeriques(modele)
+        except ValueError:
+            imputations = {}
+    else:
+        imputations = getattr(modele, 'imputations', {})
+    return {colonne: imputations[colonne] for colonne in colonnes_possessions
+            if colonne in imputations and not est_manquant(imputations[colonne])}
+
+
+def predire_chunk(modele, df):
+    return modele.predict(preparer(df, colonnes_modele(modele), imputations_possessions(modele)))
+
+
+def _predire_chunk(df):
+    return predire_chunk(_modele, df)
+
+
+class EcrivainCSV:
+    """Ajoute les prédictions à un unique fichier CSV; la position de fin sert de point de reprise."""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+
+    def reprendre(self, position):
+        # Tronquer ce qui a pu être écrit après le dernier chunk enregistré
+        mode = 'r+b' if os.path.exists(self.chemin) else 'wb'
+        with open(self.chemin, mode) as f:
+            f.truncate(position)
+        return position
+
+    def ecrire(self, df, indice):
+        with open(self.chemin, 'ab') as f:
+            df.to_csv(f, header=indice == 0, index=False, encoding='utf-8')
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+
+class EcrivainParquet:
+    """Un fichier Parquet par chunk dans le dossier de sortie, écrit sous un nom temporaire puis renommé."""
+
+    def __init__(self, dossier):
+        import pyarrow  # noqa: F401  (dépendance optionnelle)
+        self.dossier = dossier
+
+    def reprendre(self, position):
+        os.makedirs(self.dossier, exist_ok=True)
+        for nom in os.listdir(self.dossier):
+            if nom.startswith('.') or int(nom.split('-')[1].split('.')[0]) >= position:
+                os.remove(os.path.join(self.dossier, nom))
+        return position
+
+    def ecrire(self, df, indice):
+        temporaire = os.path.join(self.dossier, f".part-{indice:05d}.parquet")
+        df.to_parquet(temporaire, index=False)
+        os.replace(temporaire, os.path.join(self.dossier, f"part-{indice:05d}.parquet"))
+        return indice + 1
+
+
+def creer_ecrivain(sortie, format_sortie=None):
+    if format_sortie is None:
+        format_sortie = 'parquet' if sortie.endswith('.parquet') else 'csv'
+    if format_sortie == 'parquet':
+        return EcrivainParquet(sortie)
+    return EcrivainCSV(sortie)
+
+
+def charger_reprise(chemin, parametres):
+    """Chunks déjà terminés, position de l'écrivain et lignes prédites, ou (0, 0, 0) pour un nouveau traitement."""
+    if not os.path.exists(chemin):
+        return 0, 0, 0
+    with open(chemin, encoding='utf-8') as f:
+        etat = json.load(f)
+    if etat['parametres'] != parametres:
+        raise ValueError(f"{chemin} correspond à un autre traitement ({etat['parametres']}): "
+                         "utiliser --recommencer pour repartir de zéro")
+    return etat['chunks_termines'], etat['position'], etat['lignes']
+
+
+def enregistrer_reprise(chemin, parametres, chunks_termines, position, n_lignes):
+    temporaire = f"{chemin}.tmp"
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump({'parametres': parametres, 'chunks_termines': chunks_termines,
+                   'position': position, 'lignes': n_lignes}, f)
+    os.replace(temporaire, chemin)
+
+
+def resultat_chunk(df, predictions, debut_ligne, conserver):
+    """Colonnes écrites pour un chunk: identifiant (ou numéro de ligne) et prédiction."""
+    if conserver:
+        sortie = df.copy()
+    elif COLONNE_IDENTIFIANT in df.columns:
+        sortie = df[[COLONNE_IDENTIFIANT]].copy()
+    else:
+        sortie = pd.DataFrame({'ligne': np.arange(debut_ligne, debut_ligne + len(df))})
+    sortie[COLONNE_PREDICTION] = predictions
+    return sortie
+
+
+def scorer(entree, sortie, chemin_modele='modele_selection.joblib', taille_chunk=TAILLE_CHUNK_DEFAUT,
+           workers=1, format_sortie=None, conserver=False, recommencer=False, modele=None, progression=None):
+    """
+    Prédit tout le fichier d'entrée; retourne le nombre de lignes prédites par cette exécution.
+
+    modele: modèle déjà chargé (par exemple par l'API), utilisé dans ce processus
+    à la place de `chemin_modele`, qui identifie alors seulement le traitement
+    pour la reprise.
+    progression: appelée après chaque chunk écrit avec le nombre de chunks et de
+    lignes prédits depuis le début du traitement (reprises comprises); une
+    exception levée par cette fonction interrompt le traitement, qui pourra reprendre.
+    """
+    ecrivain = creer_ecrivain(sortie, format_sortie)
+    chemin_reprise = f"{sortie}.reprise.json"
+    parametres = {'entree': os.path.abspath(entree), 'modele': os.path.abspath(chemin_modele),
+                  'taille_chunk': taille_chunk, 'conserver': conserver}
+    if recommencer and os.path.exists(chemin_reprise):
+        os.remove(chemin_reprise)
+    debut, position, lignes_precedentes = charger_reprise(chemin_reprise, parametres)
+    position = ecrivain.reprendre(position)
+    if debut:
+        print(f"Reprise après {debut} chunks déjà prédits")
+
+    n_lignes = 0
+    indice = debut
+    chunks = lire_chunks(entree, taille_chunk, debut)
+
+    def ecrire(df, predictions):
+        nonlocal indice, position, n_lignes
+        position = ecrivain.ecrire(resultat_chunk(df, predictions, indice * taille_chunk, conserver), indice)
+        indice += 1
+        n_lignes += len(df)
+        enregistrer_reprise(chemin_reprise, parametres, indice, position, lignes_precedentes + n_lignes)
+        if progression is not None:
+            progression(indice, lignes_precedentes + n_lignes)
+
+    if modele is not None:
+        for df in chunks:
+            ecrire(df, predire_chunk(modele, df))
+    elif workers <= 1:
+        _initialiser(chemin_modele, workers)
+        for df in chunks:
+            ecrire(df, _predire_chunk(df))
+    else:
+        # Au plus 2 chunks en cours par worker: la mémoire reste bornée quelle que soit la taille du fichier
+        with ProcessPoolExecutor(workers, initializer=_initialiser, initargs=(chemin_modele, workers)) as pool:
+            en_cours = deque()
+            for df in chunks:
+                en_cours.append((df, pool.submit(_predire_chunk, df)))
+                if len(en_cours) >= 2 * workers:
+                    df_termine, future = en_cours.popleft()
+                    ecrire(df_termine, future.result())
+            while en_cours:
+                df_termine, future = en_cours.popleft()
+                ecrire(df_termine, future.result())
+
+    os.remove(chemin_reprise)
+    return n_lignes
+
+
+def rss_max_mo():
+    """Pic de mémoire résidente (Mo) du processus principal et du plus gros worker."""
+    principal = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return principal, workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prédit le revenu de chaque ligne d'un fichier d'enquête")
+    parser.add_argument("entree", help="Fichier CSV (éventuellement compressé) ou Parquet (fichier ou dossier)")
+    parser.add_argument("sortie", help="Fichier CSV, ou dossier Parquet si le nom se termine par .parquet")
+    parser.add_argument("--modele", default="modele_selection.joblib", help="Pipeline sauvegardé par train.py")
+    parser.add_argument("--taille-chunk", type=int, default=TAILLE_CHUNK_DEFAUT, help="Lignes par chunk")
+    parser.add_argument("--workers", type=int, default=1, help="Nombre de processus de prédiction")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None,
+                        help="Format de sortie (par défaut selon l'extension de la sortie)")
+    parser.add_argument("--conserver-colonnes", action="store_true",
+                        help="Recopier toutes les colonnes de l'entrée avant la prédiction")
+    parser.add_argument("--recommencer", action="store_true", help="Ignorer un traitement interrompu")
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    try:
+        n_lignes = scorer(args.entree, args.sortie, args.modele, args.taille_chunk, args.workers,
+                          args.format, args.conserver_colonnes, args.recommencer)
+    except ValueError as e:
+        sys.exit(str(e))
+    duree = time.perf_counter() - debut
+    principal, workers = rss_max_mo()
+    print(f"{n_lignes} lignes prédites en {duree:.1f} s ({n_lignes / duree:.0f} lignes/s)")
+    print(f"Pic de mémoire: {principal:.0f} Mo (processus principal), {workers:.0f} Mo (plus gros worker)")
+
+
+if __name__ == "__main__":
+    main()
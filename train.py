@@ -0,0 +1,505 @@
+"""
+Entraînement reproductible du modèle de prédiction du revenu, extrait du notebook.
+
+Reprend le nettoyage et la modélisation du notebook (prétraitement,
+SelectKBest puis cinq régresseurs) à partir d'une configuration, avec:
+  - une seule validation croisée par modèle: les métriques (MAE, RMSE, R²)
+    sont lues dans les résultats de la recherche d'hyperparamètres au lieu
+    d'un second cross_val_predict;
+  - le prétraitement (préprocesseur et SelectKBest) ajusté une seule fois
+    par pli, et ses sorties partagées entre tous les candidats et modèles;
+  - les recherches des différents modèles exécutées en parallèle, dans un
+    budget de coeurs donné.
+
+Écrit modele_selection.joblib, sa version exportée pour le chargement en
+mmap par l'API (modele_selection.moteur.joblib) et un rapport JSON des
+métriques et des durées de chaque étape. Avec --compresser, produit aussi les
+variantes compactes du modèle retenu et leur rapport (compression.py).
+
+Chaque modèle choisit son mode de recherche dans la configuration
+('recherche'): grille exhaustive (défaut), tirage aléatoire ('aleatoire',
+n_iter candidats) ou divisions successives sur la taille d'échantillon
+('halving', paramètres 'facteur' et 'min_echantillons').
+
+Usage:
+    python train.py [--config config.json] [--cpus N] [--dataset fichier.csv] [--recherche halving] [--compresser]
+"""
+import argparse
+import json
+import os
+import warnings
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor, IsolationForest, RandomForestRegressor
+from sklearn.feature_selection import SelectKBest, f_regression
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler, train_test_split
+from sklearn.neural_network import MLPRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+from compiled_model import exporter_moteur
+
+ESTIMATEURS = {
+    'LinearRegression': LinearRegression,
+    'DecisionTreeRegressor': DecisionTreeRegressor,
+    'RandomForestRegressor': RandomForestRegressor,
+    'GradientBoostingRegressor': GradientBoostingRegressor,
+    'MLPRegressor': MLPRegressor,
+}
+
+# Configuration du notebook; un fichier JSON passé avec --config remplace les clés qu'il définit
+CONFIGURATION_DEFAUT = {
+    'dataset': 'dataset_revenu_marocains.csv',
+    # Parquet produit par cleaning.py: remplace le chargement et le nettoyage de 'dataset'
+    'dataset_nettoye': None,
+    'sortie_modele': 'modele_selection.joblib',
+    # Moteur chargeable en mmap par l'API (API_MOTEUR=mmap); null pour ne pas l'écrire
+    'sortie_moteur': 'modele_selection.moteur.joblib',
+    'rapport': 'rapport_entrainement.json',
+    'test_size': 0.3,
+    'random_state': 42,
+    'k_caracteristiques': 15,
+    'n_plis': 5,
+    # Variantes compactes du modèle retenu (compression.py, ou train.py --compresser)
+    'compression': {
+        'dossier': 'modeles_compresses',
+        'rapport': 'rapport_compression.json',
+        'profondeurs': [10, 15, 20],
+        'feuilles_min': [5, 20],
+        'n_arbres': [10, 25, 50],
+        'eleve_gb': {'n_estimators': 300, 'max_depth': 5, 'learning_rate': 0.1},
+        'eleve_lineaire': True,
+    },
+    'incremental': {
+        'arbres_par_lot': 20,
+        'arbres_max': None,
+        'taille_reservoir': 10000,
+    },
+    'modeles': {
+        'Régression Linéaire': {
+            'estimateur': 'LinearRegression',
+            'parametres': {},
+            'grille': {},
+        },
+        'Arbre de Décision': {
+            'estimateur': 'DecisionTreeRegressor',
+            'parametres': {'random_state': 42},
+            'grille': {
+                'regressor__criterion': ['squared_error'],
+                'regressor__max_depth': [None, 5, 6, 7, 10],
+                'regressor__min_samples_split': [2, 3, 4, 5, 10],
+            },
+        },
+        'Forêt Aléatoire': {
+            'estimateur': 'RandomForestRegressor',
+            'parametres': {'random_state': 42},
+            'grille': {
+                'regressor__n_estimators': [50, 100],
+                'regressor__criterion': ['squared_error'],
+                'regressor__max_depth': [None, 10, 15],
+            },
+        },
+        'Gradient Boosting': {
+            'estimateur': 'GradientBoostingRegressor',
+            'parametres': {'random_state': 42},
+            'recherche': 'aleatoire',
+            'n_iter': 10,
+            'grille': {
+                'regressor__loss': ['squared_error'],
+                'regressor__learning_rate': [0.1, 0.2],
+                'regressor__n_estimators': [100, 200],
+                'regressor__subsample': [0.8, 1],
+            },
+        },
+        'Réseau de Neurones': {
+            'estimateur': 'MLPRegressor',
+            'parametres': {'random_state': 42, 'max_iter': 300},
+            'recherche': 'aleatoire',
+            'n_iter': 10,
+            'grille': {
+                'regressor__hidden_layer_sizes': [(100,), (100, 50), (100, 100)],
+                'regressor__activation': ['relu'],
+                'regressor__solver': ['adam'],
+                'regressor__alpha': [0.0001, 0.001, 0.01],
+                'regressor__learning_rate': ['adaptive'],
+                'regressor__learning_rate_init': [0.001, 0.01],
+                'regressor__max_iter': [200],
+            },
+        },
+    },
+}
+
+# Ordre des catégories ordinales
+categories_education = ['Sans niveau', 'Fondamental', 'Secondaire', 'Supérieur']
+categories_socio = ['Groupe 6', 'Groupe 5', 'Groupe 4', 'Groupe 3', 'Groupe 2', 'Groupe 1']
+colonnes_ordinales = ['niveau_education', 'categorie_socioprofessionnelle']
+
+colonnes_supprimees = ['id_utilisateur', 'date_enregistrement', 'code_postal', 'age_en_mois', 'categorie_age']
+colonnes_aberrantes = ['age', 'annees_experience', 'revenu_annuel']
+colonnes_possessions = ['possede_voiture', 'possede_logement', 'possede_terrain']
+cible = 'revenu_annuel'
+
+@contextmanager
+def chronometre(durees, etape):
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        durees[etape] = time.perf_counter() - debut
+
+
+def charger_configuration(chemin=None):
+    configuration = json.loads(json.dumps(CONFIGURATION_DEFAUT))
+    if chemin:
+        with open(chemin, encoding='utf-8') as f:
+            configuration.update(json.load(f))
+    # JSON ne connaît pas les tuples (hidden_layer_sizes)
+    for modele in configuration['modeles'].values():
+        modele['grille'] = {
+            parametre: [tuple(v) if isinstance(v, list) else v for v in valeurs]
+            for parametre, valeurs in modele['grille'].items()
+        }
+    return configuration
+
+
+def nettoyer(df, random_state=42, valeurs_manquantes=None):
+    """
+    Nettoyage et création de caractéristiques, comme dans le notebook.
+    valeurs_manquantes: valeurs de remplacement par colonne, à la place des
+    médianes et modes de `df` (statistiques cumulées de l'entraînement incrémental).
+    """
+    df = df.drop_duplicates()
+
+    # Valeurs manquantes: médiane pour les colonnes numériques, mode pour les autres
+    if valeurs_manquantes is not None:
+        df = df.fillna({col: valeur for col, valeur in valeurs_manquantes.items() if col in df.columns})
+    df = df.fillna({col: df[col].median() for col in df.select_dtypes(include=['int64', 'float64'])})
+    df = df.fillna({col: df[col].mode()[0] for col in df.select_dtypes(include=['object'])})
+
+    # Valeurs aberrantes: suppression des extrêmes, poids réduit pour les modérées
+    iso_forest = IsolationForest(contamination=0.05, random_state=random_state)
+    aberrant = iso_forest.fit_predict(df[colonnes_aberrantes]) == -1
+    extremes = ((df['age'] > 100) | (df[cible] > 1000000)).to_numpy()
+    df = df[~extremes].copy()
+    df['weight'] = np.where(aberrant[~extremes], 0.5, 1.0)
+
+    df = df.drop(columns=colonnes_supprimees)
+    df['niveau_socioeco'] = df[colonnes_possessions].sum(axis=1)
+    return df
+
+
+def construire_preprocesseur(X):
+    categorielles = [col for col in X.columns if X[col].dtype == 'object']
+    numeriques = [col for col in X.columns if col not in categorielles]
+    ordinales = [col for col in categorielles if col in colonnes_ordinales]
+    nominales = [col for col in categorielles if col not in ordinales]
+
+    transformers = [('num', Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='median')),
+        ('scaler', StandardScaler()),
+    ]), numeriques)]
+    if ordinales:
+        transformers.append(('ord', Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='most_frequent')),
+            ('encoder', OrdinalEncoder(categories=[categories_education, categories_socio])),
+        ]), ordinales))
+    if nominales:
+        transformers.append(('nom', Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='most_frequent')),
+            ('encoder', OneHotEncoder(handle_unknown='ignore', sparse_output=False)),
+        ]), nominales))
+    return ColumnTransformer(transformers=transformers)
+
+
+def construire_pretraitement(X, k):
+    return Pipeline([
+        ('preprocessor', construire_preprocesseur(X)),
+        ('feature_selection', SelectKBest(f_regression, k=k)),
+    ])
+
+
+def metriques(y, y_pred):
+    return {
+        'MAE': float(mean_absolute_error(y, y_pred)),
+        'RMSE': float(np.sqrt(mean_squared_error(y, y_pred))),
+        'R²': float(r2_score(y, y_pred)),
+    }
+
+
+def pretraiter_plis(pretraitement, X, y, plis):
+    """
+    Ajuste le prétraitement (préprocesseur et SelectKBest) une seule fois par
+    pli: tous les candidats de tous les modèles réutilisent ces données transformées.
+    """
+    resultats = []
+    for entrainement, validation in plis.split(X):
+        pretraitement_pli = clone(pretraitement)
+        X_entrainement = pretraitement_pli.fit_transform(X.iloc[entrainement], y.iloc[entrainement])
+        resultats.append((X_entrainement, y.iloc[entrainement].to_numpy(),
+                          pretraitement_pli.transform(X.iloc[validation]), validation))
+    return resultats
+
+
+def candidats(modele, random_state):
+    """Combinaisons d'hyperparamètres du régresseur, comme GridSearchCV / RandomizedSearchCV."""
+    grille = {parametre.removeprefix('regressor__'): valeurs for parametre, valeurs in modele['grille'].items()}
+    if modele.get('recherche') == 'aleatoire':
+        return list(ParameterSampler(grille, modele.get('n_iter', 10), random_state=random_state))
+    return list(ParameterGrid(grille))
+
+
+def grouper_n_estimators(regresseur, liste):
+    """
+    Regroupe les candidats qui ne diffèrent que par n_estimators, par valeurs
+    croissantes: chaque groupe est entraîné une seule fois en ajoutant des
+    arbres (warm_start), avec le même résultat que des entraînements séparés.
+    """
+    parametres = regresseur.get_params()
+    if 'warm_start' not in parametres or 'n_estimators' not in parametres:
+        return [[i] for i in range(len(liste))]
+    groupes = {}
+    for i, candidat in enumerate(liste):
+        autres = repr(sorted((p, v) for p, v in candidat.items() if p != 'n_estimators'))
+        groupes.setdefault(autres, []).append(i)
+    return [sorted(groupe, key=lambda i: liste[i].get('n_estimators', parametres['n_estimators']))
+            for groupe in groupes.values()]
+
+
+def predire_pli(regresseur, liste, pli, echantillon=None):
+    """Prédictions sur le pli de validation de chaque candidat d'un groupe."""
+    X_entrainement, y_entrainement, X_validation, _ = pli
+    if echantillon is not None:
+        X_entrainement, y_entrainement = X_entrainement[echantillon], y_entrainement[echantillon]
+    modele = clone(regresseur)
+    if len(liste) > 1:
+        modele.set_params(warm_start=True)
+    predictions = []
+    for parametres in liste:
+        modele.set_params(**parametres).fit(X_entrainement, y_entrainement)
+        predictions.append(modele.predict(X_validation))
+    return predictions
+
+
+def evaluer(regresseur, liste, plis, y, n_jobs, echantillons=None):
+    """
+    Métriques de chaque candidat sur les prédictions hors pli. Si `echantillons`
+    est donné (un tableau d'indices par pli), les candidats ne sont entraînés
+    que sur ce sous-échantillon de chaque pli.
+    """
+    groupes = grouper_n_estimators(regresseur, liste)
+    echantillons = echantillons or [None] * len(plis)
+    resultats = Parallel(n_jobs=n_jobs)(
+        delayed(predire_pli)(regresseur, [liste[i] for i in groupe], pli, echantillon)
+        for groupe in groupes for pli, echantillon in zip(plis, echantillons)
+    )
+
+    y_pred = np.empty((len(liste), len(y)))
+    taches = ((groupe, pli) for groupe in groupes for pli in plis)
+    for (groupe, (_, _, _, validation)), predictions in zip(taches, resultats):
+        for i, prediction in zip(groupe, predictions):
+            y_pred[i, validation] = prediction
+    return [metriques(y, y_pred[i]) for i in range(len(liste))]
+
+
+def tours_halving(n_candidats, n_max, facteur, n_min):
+    """Tailles d'échantillon des tours: la dernière est l'ensemble complet de chaque pli."""
+    n_tours = 1 + min(int(np.floor(np.log(n_max / n_min) / np.log(facteur))) if n_max > n_min else 0,
+                      int(np.ceil(np.log(n_candidats) / np.log(facteur))) if n_candidats > 1 else 0)
+    return [n_max // facteur ** (n_tours - 1 - tour) for tour in range(n_tours)]
+
+
+def rechercher_halving(regresseur, modele, plis, y, random_state, n_jobs):
+    """
+    Divisions successives sur la taille d'échantillon: tous les candidats de la
+    grille sont évalués sur un petit sous-échantillon de chaque pli, puis seul
+    le meilleur tiers (pour facteur=3) passe au tour suivant, avec un
+    échantillon trois fois plus grand, jusqu'à l'ensemble complet.
+    """
+    liste = list(ParameterGrid({parametre.removeprefix('regressor__'): valeurs
+                                for parametre, valeurs in modele['grille'].items()}))
+    facteur = modele.get('facteur', 3)
+    rng = np.random.default_rng(random_state)
+    ordres = [rng.permutation(len(pli[1])) for pli in plis]
+    n_max = min(len(ordre) for ordre in ordres)
+
+    restants = list(range(len(liste)))
+    tours = []
+    for n in tours_halving(len(liste), n_max, facteur, modele.get('min_echantillons', 1000)):
+        complet = n == n_max
+        scores = evaluer(regresseur, [liste[i] for i in restants], plis, y, n_jobs,
+                         None if complet else [ordre[:n] for ordre in ordres])
+        tours.append({'n_candidats': len(restants), 'n_echantillons': int(n)})
+        classement = sorted(range(len(restants)), key=lambda j: scores[j]['RMSE'])
+        if complet:
+            break
+        restants = [restants[j] for j in classement[:int(np.ceil(len(restants) / facteur))]]
+    meilleur = classement[0]
+    return liste[restants[meilleur]], scores[meilleur], tours
+
+
+def rechercher(nom, modele, plis, y, random_state, n_jobs):
+    """
+    Évalue chaque candidat sur les plis prétraités. Les prédictions hors pli
+    donnent directement les métriques de validation croisée du notebook
+    (cross_val_predict), sans réentraîner le meilleur candidat.
+    """
+    debut = time.perf_counter()
+    regresseur = ESTIMATEURS[modele['estimateur']](**modele['parametres'])
+    if modele.get('recherche') == 'halving':
+        # Arrêt anticipé du réseau de neurones sur une partie des données d'entraînement
+        if 'early_stopping' in regresseur.get_params():
+            regresseur.set_params(early_stopping=True)
+        parametres, score, tours = rechercher_halving(regresseur, modele, plis, y, random_state, n_jobs)
+        n_candidats = tours[0]['n_candidats']
+    else:
+        liste = candidats(modele, random_state)
+        scores = evaluer(regresseur, liste, plis, y, n_jobs)
+        meilleur = min(range(len(liste)), key=lambda i: scores[i]['RMSE'])
+        parametres, score, tours = liste[meilleur], scores[meilleur], None
+        n_candidats = len(liste)
+    duree = time.perf_counter() - debut
+
+    resultat = dict(score, Temps=duree, n_candidats=n_candidats,
+                    meilleurs_parametres={f'regressor__{p}': v for p, v in parametres.items()})
+    if tours:
+        resultat['tours'] = tours
+    print(f"{nom}: MAE {resultat['MAE']:.2f}, RMSE {resultat['RMSE']:.2f}, "
+          f"R² {resultat['R²']:.4f} ({n_candidats} candidats, {duree:.1f} s)")
+    return resultat, clone(regresseur).set_params(**parametres)
+
+
+def entrainer(configuration, cpus=None, compresser=False):
+    cpus = cpus or os.cpu_count() or 1
+    random_state = configuration['random_state']
+    durees = {}
+    debut = time.perf_counter()
+
+    if configuration.get('dataset_nettoye'):
+        # Dataset déjà nettoyé par cleaning.py
+        from cleaning import lire_nettoye
+
+        with chronometre(durees, 'chargement'):
+            df = lire_nettoye(configuration['dataset_nettoye'])
+    else:
+        with chronometre(durees, 'chargement'):
+            df = pd.read_csv(configuration['dataset'])
+        with chronometre(durees, 'nettoyage'):
+            df = nettoyer(df, random_state)
+    with chronometre(durees, 'separation'):
+        X = df.drop(columns=[cible])
+        y = df[cible]
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=configuration['test_size'], random_state=random_state
+        )
+    with chronometre(durees, 'pretraitement des plis'):
+        pretraitement = construire_pretraitement(X_train, configuration['k_caracteristiques'])
+        plis = pretraiter_plis(pretraitement, X_train, y_train,
+                               KFold(n_splits=configuration['n_plis'], shuffle=True, random_state=random_state))
+
+    # Budget de coeurs réparti entre les recherches exécutées simultanément
+    modeles = configuration['modeles']
+    n_paralleles = min(len(modeles), cpus)
+    n_jobs = max(1, cpus // n_paralleles)
+    print(f"{len(modeles)} modèles, {n_paralleles} recherche(s) simultanée(s) de {n_jobs} coeur(s)")
+
+    resultats, regresseurs = {}, {}
+    with chronometre(durees, 'recherche'):
+        with ThreadPoolExecutor(max_workers=n_paralleles) as executor:
+            futures = {
+                nom: executor.submit(rechercher, nom, modele, plis, y_train.to_numpy(), random_state, n_jobs)
+                for nom, modele in modeles.items()
+            }
+            for nom, future in futures.items():
+                resultats[nom], regresseurs[nom] = future.result()
+                durees[f'recherche {nom}'] = resultats[nom]['Temps']
+
+    # Seul le modèle retenu (meilleur R² en validation croisée) est réentraîné sur tout l'ensemble d'apprentissage
+    meilleur_nom = max(resultats, key=lambda nom: resultats[nom]['R²'])
+    with chronometre(durees, 'entrainement final'):
+        X_pretraite = pretraitement.fit_transform(X_train, y_train)
+        meilleur_modele = Pipeline(pretraitement.steps + [
+            ('regressor', regresseurs[meilleur_nom].fit(X_pretraite, y_train.to_numpy())),
+        ])
+    with chronometre(durees, 'evaluation'):
+        test = metriques(y_test, meilleur_modele.predict(X_test))
+    with chronometre(durees, 'sauvegarde'):
+        joblib.dump(meilleur_modele, configuration['sortie_modele'])
+        if configuration.get('sortie_moteur'):
+            exporter_moteur(meilleur_modele, configuration['sortie_moteur'])
+    if compresser:
+        from compression import compresser as compresser_modele
+
+        with chronometre(durees, 'compression'):
+            compresser_modele(meilleur_modele, X_train, y_train, X_test, y_test, configuration)
+    durees['total'] = time.perf_counter() - debut
+
+    rapport = {
+        'meilleur_modele': meilleur_nom,
+        'test': test,
+        'validation_croisee': resultats,
+        'durees': durees,
+        'cpus': cpus,
+        'n_entrainement': len(X_train),
+        'n_test': len(X_test),
+        'configuration': configuration,
+    }
+    with open(configuration['rapport'], 'w', encoding='utf-8') as f:
+        json.dump(rapport, f, ensure_ascii=False, indent=2, default=str)
+    return rapport
+
+
+def afficher_rapport(rapport):
+    test = rapport['test']
+    print(f"\nMeilleur modèle: {rapport['meilleur_modele']}")
+    print(f"  Test: MAE {test['MAE']:.2f}, RMSE {test['RMSE']:.2f}, R² {test['R²']:.4f}")
+    print("\nDurées par étape:")
+    for etape, duree in rapport['durees'].items():
+        print(f"  {etape:<32} {duree:>8.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entraîne et sauvegarde le modèle de prédiction du revenu")
+    parser.add_argument("--config", help="Fichier JSON qui remplace des clés de la configuration par défaut")
+    parser.add_argument("--cpus", type=int, default=None,
+                        help="Nombre de coeurs alloués aux recherches d'hyperparamètres (défaut: tous)")
+    parser.add_argument("--dataset", help="Dataset d'entraînement (remplace celui de la configuration)")
+    parser.add_argument("--nettoye", help="Parquet déjà nettoyé par cleaning.py (remplace chargement et nettoyage)")
+    parser.add_argument("--sortie", help="Fichier du modèle sauvegardé (remplace celui de la configuration)")
+    parser.add_argument("--recherche", choices=["grille", "aleatoire", "halving"],
+                        help="Mode de recherche de tous les modèles (remplace celui de chaque modèle)")
+    parser.add_argument("--compresser", action="store_true",
+                        help="Produire aussi les variantes compactes du modèle retenu (compression.py)")
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    configuration = charger_configuration(args.config)
+    if args.dataset:
+        configuration['dataset'] = args.dataset
+    if args.nettoye:
+        configuration['dataset_nettoye'] = args.nettoye
+    if args.sortie:
+        configuration['sortie_modele'] = args.sortie
+    if args.recherche:
+        for modele in configuration['modeles'].values():
+            modele['recherche'] = args.recherche
+
+    rapport = entrainer(configuration, args.cpus, args.compresser)
+    afficher_rapport(rapport)
+    print(f"\nModèle sauvegardé dans '{configuration['sortie_modele']}', "
+          f"rapport dans '{configuration['rapport']}'")
+
+
+if __name__ == "__main__":
+    main()